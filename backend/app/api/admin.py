@@ -1,11 +1,19 @@
 import shutil
 import os
 import tempfile
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, BackgroundTasks
+import logging
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, BackgroundTasks, Depends
 from fastapi.responses import FileResponse
-from app.services import rag_service
+from app.core import profiling
+from app.core.auth_simple import verify_profiling_key
+from app.services import rag_service, slot_settings
+from app.core.tasks import scheduler
+from app.services.lead_outbox import lead_outbox
+from app.services.collection_memory import collection_memory
+from app.services.slot_router import slot_router
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # NOTE: All endpoints are protected by the global API Key dependency in main.py.
 # NOTE: Functions are defined as 'def' (sync) to allow FastAPI to run them in a threadpool,
@@ -15,7 +23,7 @@ def remove_file(path: str):
     try:
         os.remove(path)
     except Exception as e:
-        print(f"Error deleting temp file {path}: {e}")
+        logger.warning(f"Error deleting temp file {path}: {e}")
 
 @router.post("/reset")
 def reset_knowledge_base(payload: dict):
@@ -45,12 +53,80 @@ def update_config(config: dict):
 @router.post("/slots")
 def create_new_slot(payload: dict):
     name = payload.get("name", "New Brain")
-    slot_id = rag_service.create_slot(name)
+    shards = payload.get("shards", 1)
+    engine = payload.get("engine", slot_settings.ENGINE_CHROMA)
+    try:
+        slot_settings.validate({"shards": shards, "engine": engine})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    slot_id = rag_service.create_slot(name, shards=shards, engine=engine)
     if slot_id:
-        return {"status": "success", "slot_id": slot_id, "name": name}
+        return {"status": "success", "slot_id": slot_id, "name": name, "shards": shards, "engine": engine}
     else:
         raise HTTPException(status_code=500, detail="Failed to create slot.")
 
+@router.get("/slots/{slot_id}/settings")
+def get_slot_settings(slot_id: str):
+    return rag_service.get_slot_settings(slot_id)
+
+@router.put("/slots/{slot_id}/settings")
+def update_slot_settings(slot_id: str, payload: dict):
+    """
+    Storage settings of a slot, e.g. {"shards": 4} or {"engine": "numpy"} (only
+    while the slot is empty) or {"hnsw_search_ef": 64} (new collections; rebuild
+    the index to apply it to existing data).
+    """
+    if not slot_id or ".." in slot_id:
+        raise HTTPException(status_code=400, detail="Invalid collection name")
+    try:
+        return rag_service.update_slot_settings(slot_id, payload)
+    except rag_service.SlotNotEmptyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/slots/{slot_id}/index")
+def get_slot_index(slot_id: str):
+    """Configured HNSW parameters vs the ones the slot's collections were built with."""
+    if not slot_id or ".." in slot_id:
+        raise HTTPException(status_code=400, detail="Invalid collection name")
+    return rag_service.get_slot_index(slot_id)
+
+@router.post("/slots/{slot_id}/index/rebuild")
+def rebuild_slot_index(slot_id: str):
+    """Applies the slot's HNSW settings to its existing data (copies it into a new index)."""
+    if not slot_id or ".." in slot_id:
+        raise HTTPException(status_code=400, detail="Invalid collection name")
+    try:
+        return rag_service.rebuild_slot_index(slot_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/slots/{slot_id}/storage")
+def get_slot_storage(slot_id: str):
+    """Records, HNSW tombstones, metadata/index consistency and SQLite fragmentation of a slot."""
+    if not slot_id or ".." in slot_id:
+        raise HTTPException(status_code=400, detail="Invalid collection name")
+    try:
+        return rag_service.get_slot_storage(slot_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/slots/{slot_id}/storage/compact")
+def compact_slot_storage(slot_id: str, rebuild: bool = True, vacuum: bool = True):
+    """
+    Rebuilds the slot's indexes without deleted elements, purges Chroma's
+    consumed write log and VACUUMs SQLite; reports the storage before/after.
+    """
+    if not slot_id or ".." in slot_id:
+        raise HTTPException(status_code=400, detail="Invalid collection name")
+    try:
+        return rag_service.compact_slot(slot_id, rebuild=rebuild, vacuum=vacuum)
+    except rag_service.MaintenanceRunningError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/slots/{slot_id}")
 def delete_slot(slot_id: str):
     # Basic validation
@@ -104,3 +180,75 @@ def import_slot(collection_name: str = Form(...), file: UploadFile = File(...)):
                 os.remove(temp_path)
             except Exception:
                 pass # logging.warning("Could not delete temp file")
+
+# --- MAINTENANCE JOBS ---
+@router.get("/maintenance/jobs")
+async def list_maintenance_jobs():
+    """Lists scheduled maintenance jobs with their timing metrics (for this worker)."""
+    return scheduler.list_jobs()
+
+@router.post("/maintenance/jobs/{job_name}/run")
+async def run_maintenance_job(job_name: str):
+    """Triggers a maintenance job immediately."""
+    if job_name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_name}'.")
+    return await scheduler.run_job(job_name)
+
+# --- LEAD OUTBOX (deferred lead extraction) ---
+@router.get("/leads/outbox")
+async def get_lead_outbox_stats():
+    """Pending/dead items per stage of the deferred lead outbox."""
+    return await lead_outbox.stats()
+
+@router.post("/leads/outbox/flush")
+async def flush_lead_outbox():
+    """Processes every due outbox item now (extraction + webhook delivery)."""
+    if not lead_outbox.enabled:
+        raise HTTPException(status_code=400, detail="LEAD_WEBHOOK_URL is not configured.")
+    return await lead_outbox.process_once()
+
+# --- COLLECTION MEMORY (loaded vector indexes, LRU eviction) ---
+@router.get("/memory/collections")
+def get_collection_memory():
+    """Resident collections (LRU first) with their estimated size, plus eviction/reload counters."""
+    return collection_memory.stats()
+
+@router.post("/memory/collections/enforce")
+def enforce_collection_memory():
+    """Runs the budget check now (no-op without COLLECTION_MEMORY_BUDGET_MB)."""
+    return collection_memory.enforce()
+
+# --- AUTO SLOT ROUTING (collection_name="auto") ---
+@router.get("/routing")
+def get_slot_routing():
+    """Routing index (slots, codes, latency) and the centroid codes per slot."""
+    return slot_router.stats()
+
+@router.post("/routing/rebuild")
+async def rebuild_slot_routing(collection_name: str = None):
+    """Re-clusters one slot's centroids now, or every slot that needs it."""
+    if not slot_router.enabled:
+        raise HTTPException(status_code=400, detail="ROUTER_ENABLED is off.")
+    return await slot_router.rebuild(collection_name)
+
+# --- REQUEST PROFILES (X-NEXUS-PROFILE admin key) ---
+@router.get("/profiles", dependencies=[Depends(verify_profiling_key)])
+def list_request_profiles():
+    """Stored single-request profiles, newest first."""
+    return profiling.list_profiles()
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(verify_profiling_key)])
+def get_request_profile(profile_id: str):
+    """Profile report: duration, sample count and top allocations."""
+    report = profiling.load_profile(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return report
+
+@router.get("/profiles/{profile_id}/folded", dependencies=[Depends(verify_profiling_key)])
+def get_request_profile_stacks(profile_id: str):
+    """Collapsed stacks, ready for flamegraph.pl / speedscope."""
+    path = profiling.folded_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, filename=f"profile_{profile_id}.folded", media_type="text/plain")
@@ -1,10 +1,16 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Request
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
+from starlette.concurrency import run_in_threadpool
 import logging
 
 # Servicios y Core
-from app.services.chat_service import get_answer
+from app.services.chat_service import get_answer, resolve_collections, LEAD_MODE_DEFERRED
+from app.services.security_service import consume_quota, session_key
+from app.core.config import settings
+from app.services import session_service, token_accounting
+from app.core.security import hash_user_id
+from app.services.lead_outbox import lead_outbox
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -14,10 +20,18 @@ class QueryRequest(BaseModel):
     # Campos principales (Frontend v4.1)
     message: Optional[str] = None
     collection_name: str = "nexus_slot_1" # Default sugerido por Antigravity
+    # Consulta federada: varios slots a la vez (ignora collection_name)
+    collection_names: Optional[List[str]] = None
     
     # Campos de Negocio / Contexto
     business_context: Optional[str] = None
     user_id: Optional[str] = None
+    # Conversación del panel de administración: historial en servidor y cuota
+    # diaria propios de la sesión (ignorado si llega user_id)
+    session_id: Optional[str] = None
+    # "separate" (default), "fused" (respuesta + lead en una sola llamada al LLM)
+    # o "deferred" (respuesta inmediata, lead entregado después al webhook)
+    lead_mode: Optional[Literal["separate", "fused", "deferred"]] = None
 
     # Campos Legacy (Compatibilidad n8n antigua)
     query: Optional[str] = None 
@@ -26,7 +40,17 @@ class QueryRequest(BaseModel):
 # --- ENDPOINT ---
 # --- ENDPOINT ---
 @router.post("/chat", tags=["Chat"])
-def chat_endpoint(request: QueryRequest, background_tasks: BackgroundTasks):
+async def chat_endpoint(request: QueryRequest, background_tasks: BackgroundTasks, http_request: Request):
+    collection_names = None
+    if request.collection_names is not None:
+        try:
+            collection_names = resolve_collections(request.collection_names)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # Federated requests are labelled "federated" (one metrics label value); token usage is split per slot
+    collection_label = token_accounting.collection_label(collection_names, request.collection_name)
+    # Metrics label (the collection travels in the JSON body, not the query string)
+    http_request.state.collection = collection_label
     # 1. Normalizar entrada (message gana, query es fallback)
     final_query = request.message or request.query
     final_context = request.business_context or request.system_instruction
@@ -34,15 +58,43 @@ def chat_endpoint(request: QueryRequest, background_tasks: BackgroundTasks):
     if not final_query:
         raise HTTPException(status_code=400, detail="Message/Query cannot be empty")
 
+    lead_mode = request.lead_mode or settings.LEAD_EXTRACTION_MODE
+    deferred_lead = bool(final_context) and lead_mode == LEAD_MODE_DEFERRED
+    if deferred_lead and not lead_outbox.enabled:
+        raise HTTPException(status_code=400, detail="Deferred lead extraction requires LEAD_WEBHOOK_URL to be configured")
+
+    # Rate limit (sliding window per user, or per admin UI session; in server mode a SQLite write shared by the workers)
+    quota_id = request.user_id or (session_key(ui_session_id=request.session_id) if request.session_id else None)
+    usage = await run_in_threadpool(consume_quota, quota_id) if quota_id else None
+    # Model calls from here on (answer, lead extraction, background summary) are billed to this tenant/user
+    tally = token_accounting.start_scope(
+        collection_names or request.collection_name,
+        hash_user_id(request.user_id) if request.user_id else "",
+        token_accounting.OP_CHAT
+    )
+
     try:
-        # 2. Llamar al Cerebro (usando la collection_name que pide Antigravity)
-        response = get_answer(
+        # 2. Sesión en servidor: con user_id el cliente sólo envía el mensaje nuevo
+        summary, history = None, []
+        session = session_key(request.user_id, request.session_id) if request.user_id or request.session_id else None
+        if session:
+            summary, history = await session_service.load_session(session)
+
+        # 3. Llamar al Cerebro (usando la collection_name que pide Antigravity)
+        # get_answer is blocking (LangChain/Chroma), so it runs in the threadpool
+        response = await run_in_threadpool(
+            get_answer,
             query=final_query, 
             collection_name=request.collection_name, 
-            history=[] # Stateless por ahora para estabilidad
+            collection_names=collection_names,
+            history=history,
+            # Deferred: no extraction on the request path, the outbox worker does it
+            business_context=None if deferred_lead else final_context,
+            summary=summary,
+            lead_mode=lead_mode
         )
         
-        # 3. Procesar respuesta
+        # 4. Procesar respuesta
         bot_answer = ""
         lead_data = None
         
@@ -52,13 +104,26 @@ def chat_endpoint(request: QueryRequest, background_tasks: BackgroundTasks):
         else:
             bot_answer = str(response)
 
-        # 4. Respuesta final
-        return {
+        if session:
+            await session_service.append_exchange(session, final_query, bot_answer)
+            # Summarize turns that left the window after the reply is sent
+            background_tasks.add_task(session_service.compact_session, session)
+
+        # 5. Respuesta final
+        result = {
             "answer": bot_answer,
             "sources": response.get("sources", []),
             "lead_data": lead_data,
-            "usage": {"remaining": 20, "limit_reached": False}
+            "usage": usage,
+            # Tokens/cost of this request so far (the background summary is not included)
+            "token_usage": tally.to_dict()
         }
+        if deferred_lead:
+            # lead_data llegará al webhook con este lead_id
+            result["lead_id"] = await lead_outbox.enqueue(
+                final_query, bot_answer, final_context, ",".join(collection_names or [request.collection_name]), request.user_id
+            )
+        return result
         
     except Exception as e:
         logger.error(f"ERROR CRÍTICO EN CHAT: {e}")
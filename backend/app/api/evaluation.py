@@ -1,11 +1,13 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import List, Optional
-from app.services.evaluation_service import generate_evaluation_testset, run_evaluation
+from starlette.concurrency import run_in_threadpool
 import json
+import logging
 import os
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # Simple storage for the last generated testset (in memory for now, or file)
 LAST_TESTSET_PATH = "latest_testset.json"
@@ -15,6 +17,14 @@ class GenerateRequest(BaseModel):
 
 class RunRequest(BaseModel):
     testset: Optional[List[dict]] = None
+
+def _evaluation_service():
+    """
+    ragas, datasets and llama-index take seconds and hundreds of MB to import:
+    they are loaded on the first evaluation request, not at API startup.
+    """
+    from app.services import evaluation_service
+    return evaluation_service
     
 @router.post("/evaluate/generate", tags=["Evaluation"])
 async def generate_testset(request: GenerateRequest):
@@ -23,7 +33,9 @@ async def generate_testset(request: GenerateRequest):
     This can take a while (minutes).
     """
     try:
-        data = generate_evaluation_testset(limit=request.limit)
+        # Import and generation are blocking: keep them off the event loop
+        service = await run_in_threadpool(_evaluation_service)
+        data = await run_in_threadpool(service.generate_evaluation_testset, limit=request.limit)
         
         # Save to disk
         with open(LAST_TESTSET_PATH, "w") as f:
@@ -53,7 +65,8 @@ async def evaluate_system(request: RunRequest):
             else:
                 raise HTTPException(status_code=400, detail="No testset provided and no cached testset found.")
         
-        results = run_evaluation(data)
+        service = await run_in_threadpool(_evaluation_service)
+        results = await run_in_threadpool(service.run_evaluation, data)
         
         # Calculate averages for easy reading
         # results is a list of dicts with scores per row? 
@@ -66,7 +79,8 @@ async def evaluate_system(request: RunRequest):
             "status": "success",
             "results": results
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Evaluation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
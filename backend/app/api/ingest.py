@@ -1,8 +1,10 @@
 from typing import List
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from starlette.concurrency import run_in_threadpool
 import os
-import shutil
-from app.services.rag_service import index_document 
+from app.services import rag_service, token_accounting, upload_store
+from app.services.rag_service import index_document
+from app.services.slot_router import AUTO_COLLECTION
 
 router = APIRouter()
 
@@ -14,24 +16,33 @@ async def ingest_documents(
     """
     Uploads multiple files and indexes them into ChromaDB.
     """
+    if collection_name == AUTO_COLLECTION:
+        raise HTTPException(status_code=400, detail=f"'{AUTO_COLLECTION}' is reserved for query routing")
+    token_accounting.start_scope(collection_name, operation=token_accounting.OP_INGEST)
     results = []
-    upload_dir = "/app/data_uploads"
-    os.makedirs(upload_dir, exist_ok=True)
+    upload_dir = rag_service.UPLOAD_DIR
 
     for file in files:
         try:
-            # 1. Save File
-            file_path = os.path.join(upload_dir, file.filename)
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+            # 1. Save File (by content hash: identical files are stored once, whatever slot uploads them)
+            filename = os.path.basename(file.filename)
+            # Off the event loop: saving waits on the upload lock while the GC runs,
+            # indexing on the slot write lock while the slot's index is rebuilt
+            upload = await run_in_threadpool(upload_store.save, file.file, filename, upload_dir)
                 
             # 2. Trigger Indexing (RAG Magic)
-            indexing_result = index_document(file_path, collection_name)
+            indexing_result = await run_in_threadpool(
+                index_document, upload["path"], collection_name,
+                source=os.path.join(upload_dir, filename), file_hash=upload["hash"]
+            )
+            # 3. Reference it from the slot (unreferenced files are garbage collected)
+            await run_in_threadpool(upload_store.add_reference, collection_name, filename, upload, upload_dir)
             
             results.append({
                 "filename": file.filename,
                 "status": "success",
+                "file_hash": upload["hash"],
+                "deduplicated": upload["deduplicated"],
                 "details": indexing_result
             })
             
@@ -0,0 +1,60 @@
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from app.services import token_accounting
+from app.services.chat_service import auto_search, federated_search, resolve_collections, RETRIEVAL_K
+from app.services.slot_router import AUTO_COLLECTION
+
+router = APIRouter()
+
+class SearchRequest(BaseModel):
+    query: str
+    # "auto": routed to the most likely slots
+    collection_name: str = "nexus_slot_1"
+    # Several slots at once (overrides collection_name)
+    collection_names: Optional[List[str]] = None
+    k: int = Field(RETRIEVAL_K, ge=1, le=50)
+
+@router.post("/search", tags=["Search"])
+async def search_endpoint(request: SearchRequest, http_request: Request):
+    """
+    Retrieval only (no LLM call): the top-k chunks across the requested slots,
+    each tagged with its slot and a cosine similarity score.
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    routed = None
+    if not request.collection_names and request.collection_name == AUTO_COLLECTION:
+        http_request.state.collection = AUTO_COLLECTION
+        tally = token_accounting.start_scope(AUTO_COLLECTION, operation=token_accounting.OP_SEARCH)
+        docs, routed = await run_in_threadpool(auto_search, request.query, request.k)
+        return _search_response(docs, tally, routed)
+    try:
+        collection_names = resolve_collections(request.collection_names or [request.collection_name])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    http_request.state.collection = token_accounting.collection_label(collection_names)
+    tally = token_accounting.start_scope(collection_names, operation=token_accounting.OP_SEARCH)
+
+    docs = await run_in_threadpool(federated_search, request.query, collection_names, request.k)
+    return _search_response(docs, tally)
+
+def _search_response(docs: list, tally, routed: list = None) -> dict:
+    response = {
+        "results": [
+            {
+                "text": doc.page_content,
+                "slot": doc.metadata.get("slot"),
+                "score": doc.metadata.get("score"),
+                "metadata": doc.metadata,
+            }
+            for doc in docs
+        ],
+        "token_usage": tally.to_dict()
+    }
+    if routed is not None:
+        # Slots picked by auto routing, with their centroid similarity
+        response["routed_slots"] = routed
+    return response
@@ -0,0 +1,27 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from app.core.security import hash_user_id
+from app.services import token_accounting
+
+router = APIRouter()
+
+@router.get("/usage/tokens", tags=["Usage"])
+async def get_token_usage(
+    days: int = Query(30, ge=1, le=366),
+    group_by: str = "collection,day",
+    collection: Optional[str] = None,
+    user_id: Optional[str] = None
+):
+    """
+    Model token usage and estimated cost (USD) per tenant.
+    group_by: comma separated subset of day, collection, user_hash, operation, model.
+    """
+    columns = [c.strip() for c in group_by.split(",") if c.strip()]
+    invalid = [c for c in columns if c not in token_accounting.GROUP_COLUMNS]
+    if invalid or len(set(columns)) != len(columns):
+        raise HTTPException(
+            status_code=400,
+            detail=f"group_by must be a subset of {sorted(token_accounting.GROUP_COLUMNS)}"
+        )
+    user_hash = hash_user_id(user_id) if user_id else None
+    return await token_accounting.get_token_usage(days, columns, collection, user_hash)
@@ -1,5 +1,6 @@
 from fastapi import Security, HTTPException, status
 from fastapi.security import APIKeyHeader
+from app.core import profiling
 import os
 from dotenv import load_dotenv
 
@@ -8,6 +9,8 @@ load_dotenv()
 API_KEY_NAME = "X-NEXUS-KEY"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 NEXUS_API_KEY = os.getenv("NEXUS_API_KEY")
+# Admin-only features (request profiling) use a separate key: PROFILING_KEY
+profiling_key_header = APIKeyHeader(name="X-NEXUS-PROFILE", auto_error=False)
 
 async def verify_api_key(api_key_header: str = Security(api_key_header)):
     if not NEXUS_API_KEY:
@@ -20,3 +23,11 @@ async def verify_api_key(api_key_header: str = Security(api_key_header)):
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Could not validate credentials",
     )
+
+async def verify_profiling_key(profiling_key_header: str = Security(profiling_key_header)):
+    if profiling.is_admin_key(profiling_key_header):
+        return True
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Profiling requires a valid X-NEXUS-PROFILE admin key",
+    )
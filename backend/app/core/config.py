@@ -11,17 +11,137 @@ class Settings:
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY")
+    # Alternative OpenAI-compatible endpoint, e.g. the offline stub (stubs/openai_stub.py):
+    # OPENAI_BASE_URL=http://openai-stub:8100/v1
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
     
     # Database
     # Default to /app/data/nexus.db for Docker/Production
     # This can be overridden by setting DB_PATH env var
     DB_PATH: str = os.getenv("DB_PATH", "/app/data/nexus.db")
     DATABASE_URL: str = f"sqlite+aiosqlite:///{DB_PATH}"
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "4"))
+    # Max writes grouped into a single commit
+    DB_WRITE_BATCH_SIZE: int = int(os.getenv("DB_WRITE_BATCH_SIZE", "200"))
+    # Max rows removed per retention DELETE (keeps the write lock short)
+    DB_DELETE_BATCH_SIZE: int = int(os.getenv("DB_DELETE_BATCH_SIZE", "500"))
     
     # Limits
     LOG_RETENTION_HOURS: int = 24
     CHAT_RETENTION_HOURS: int = 2
     MAX_REQUESTS_LIMIT: int = 20
+    # Lead extraction: "separate" (RAG + extraction call), "fused" (single structured call)
+    # or "deferred" (answer now, extraction + webhook delivery in the background)
+    LEAD_EXTRACTION_MODE: str = os.getenv("LEAD_EXTRACTION_MODE", "separate")
+    # Deferred mode: n8n (or any) webhook receiving {"leads": [...]} batches
+    LEAD_WEBHOOK_URL: str = os.getenv("LEAD_WEBHOOK_URL", "")
+    LEAD_WEBHOOK_TIMEOUT_SECONDS: float = float(os.getenv("LEAD_WEBHOOK_TIMEOUT_SECONDS", "10"))
+    LEAD_BATCH_SIZE: int = int(os.getenv("LEAD_BATCH_SIZE", "10"))
+    LEAD_BATCH_WINDOW_SECONDS: float = float(os.getenv("LEAD_BATCH_WINDOW_SECONDS", "2"))
+    LEAD_WORKER_INTERVAL_SECONDS: float = float(os.getenv("LEAD_WORKER_INTERVAL_SECONDS", "15"))
+    LEAD_MAX_ATTEMPTS: int = int(os.getenv("LEAD_MAX_ATTEMPTS", "8"))
+    LEAD_RETRY_BASE_SECONDS: float = float(os.getenv("LEAD_RETRY_BASE_SECONDS", "5"))
+    LEAD_RETRY_MAX_SECONDS: float = float(os.getenv("LEAD_RETRY_MAX_SECONDS", "900"))
+    LEAD_CLAIM_LEASE_SECONDS: float = float(os.getenv("LEAD_CLAIM_LEASE_SECONDS", "300"))
+    # Server-side chat sessions: turns kept verbatim; older ones are folded into a summary
+    SESSION_WINDOW_TURNS: int = int(os.getenv("SESSION_WINDOW_TURNS", "5"))
+    # Background maintenance (app/core/tasks.py)
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_JITTER: float = float(os.getenv("SCHEDULER_JITTER", "0.1"))
+    CLEANUP_INTERVAL_SECONDS: float = float(os.getenv("CLEANUP_INTERVAL_SECONDS", "900"))
+    CACHE_EVICTION_INTERVAL_SECONDS: float = float(os.getenv("CACHE_EVICTION_INTERVAL_SECONDS", "300"))
+    ORPHAN_GC_INTERVAL_SECONDS: float = float(os.getenv("ORPHAN_GC_INTERVAL_SECONDS", "3600"))
+    ORPHAN_FILE_MAX_AGE_HOURS: float = float(os.getenv("ORPHAN_FILE_MAX_AGE_HOURS", "1"))
+
+    # In-memory rate limiter: how often pending hits are flushed to SQLite
+    RATE_LIMIT_FLUSH_SECONDS: float = float(os.getenv("RATE_LIMIT_FLUSH_SECONDS", "5"))
+    # Token/cost accounting: how often aggregated usage is upserted into SQLite
+    TOKEN_USAGE_FLUSH_SECONDS: float = float(os.getenv("TOKEN_USAGE_FLUSH_SECONDS", "10"))
+
+    # Startup warm-up of the slots in slots.json (open store, load index, test query).
+    # /readyz answers 503 until it finishes or WARMUP_TIMEOUT_SECONDS passes.
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    WARMUP_TIMEOUT_SECONDS: float = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "60"))
+    WARMUP_CONCURRENCY: int = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+    # Also embed a short text once, so the embeddings client has its connection open
+    WARMUP_MODEL_CLIENTS: bool = os.getenv("WARMUP_MODEL_CLIENTS", "true").lower() == "true"
+
+    # Vector store access: "embedded" (this process opens /app/chroma_db, single worker)
+    # or "server" (a Chroma server owns the store, so uvicorn can run WEB_CONCURRENCY workers)
+    VECTOR_STORE_MODE: str = os.getenv("VECTOR_STORE_MODE", "embedded").lower()
+    CHROMA_SERVER_HOST: str = os.getenv("CHROMA_SERVER_HOST", "127.0.0.1")
+    CHROMA_SERVER_PORT: int = int(os.getenv("CHROMA_SERVER_PORT", "8001"))
+    # Keep-alive connections per worker to the Chroma server (~ threadpool size)
+    CHROMA_HTTP_POOL_SIZE: int = int(os.getenv("CHROMA_HTTP_POOL_SIZE", "40"))
+
+    # Threads running the per-shard calls of sharded slots (parallel writes, fan-out queries)
+    SHARD_FANOUT_WORKERS: int = int(os.getenv("SHARD_FANOUT_WORKERS", "16"))
+
+    # Federated queries (collection_names): max slots per request and concurrent slot lookups
+    FEDERATED_MAX_SLOTS: int = int(os.getenv("FEDERATED_MAX_SLOTS", "20"))
+    FEDERATED_SEARCH_WORKERS: int = int(os.getenv("FEDERATED_SEARCH_WORKERS", "16"))
+
+    # Auto slot routing (collection_name="auto"): per-slot centroid codebooks, see app/services/slot_router.py
+    ROUTER_ENABLED: bool = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+    ROUTER_TOP_N: int = int(os.getenv("ROUTER_TOP_N", "3"))
+    ROUTER_CODES_PER_SLOT: int = int(os.getenv("ROUTER_CODES_PER_SLOT", "4"))
+    # Coarse pass on randomly projected codes, then exact scores for the shortlist
+    ROUTER_PROJECTION_DIM: int = int(os.getenv("ROUTER_PROJECTION_DIM", "64"))
+    ROUTER_SHORTLIST: int = int(os.getenv("ROUTER_SHORTLIST", "32"))
+    ROUTER_REFRESH_SECONDS: float = float(os.getenv("ROUTER_REFRESH_SECONDS", "5"))
+    # Re-clustering job: slots never clustered or whose size drifted by this fraction
+    ROUTER_REBUILD_INTERVAL_SECONDS: float = float(os.getenv("ROUTER_REBUILD_INTERVAL_SECONDS", "3600"))
+    ROUTER_REBUILD_DRIFT: float = float(os.getenv("ROUTER_REBUILD_DRIFT", "0.5"))
+    ROUTER_SAMPLE_SIZE: int = int(os.getenv("ROUTER_SAMPLE_SIZE", "5000"))
+
+    # Loaded HNSW indexes: above this estimate (MB) the least recently used collections
+    # idle for COLLECTION_IDLE_SECONDS are unloaded (reloaded on next use). 0 = no limit.
+    COLLECTION_MEMORY_BUDGET_MB: float = float(os.getenv("COLLECTION_MEMORY_BUDGET_MB", "0"))
+    COLLECTION_IDLE_SECONDS: float = float(os.getenv("COLLECTION_IDLE_SECONDS", "300"))
+    COLLECTION_MEMORY_CHECK_SECONDS: float = float(os.getenv("COLLECTION_MEMORY_CHECK_SECONDS", "30"))
+
+    # Storage maintenance job (see POST /slots/{id}/storage/compact): purges Chroma's
+    # consumed write log, VACUUMs chroma.sqlite3 once this fraction of its pages is free
+    # and reports HNSW indexes with this fraction of deleted elements. Rebuilding them
+    # from the job is opt-in (MAINTENANCE_REBUILD_INDEXES)
+    MAINTENANCE_INTERVAL_SECONDS: float = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "86400"))
+    MAINTENANCE_TOMBSTONE_RATIO: float = float(os.getenv("MAINTENANCE_TOMBSTONE_RATIO", "0.2"))
+    MAINTENANCE_VACUUM_FRAGMENTATION: float = float(os.getenv("MAINTENANCE_VACUUM_FRAGMENTATION", "0.2"))
+    MAINTENANCE_REBUILD_INDEXES: bool = os.getenv("MAINTENANCE_REBUILD_INDEXES", "false").lower() == "true"
+
+    # RAGAS evaluation endpoints. Chat/ingest-only workers can turn them off;
+    # either way the evaluation stack is only imported on first use.
+    EVALUATION_ENABLED: bool = os.getenv("EVALUATION_ENABLED", "true").lower() == "true"
+
+    # Logging (app/core/logs.py): JSON lines on stdout written by a background thread
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+    # Per-logger overrides, e.g. "app.services.rag_service=DEBUG,uvicorn.access=WARNING"
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+    # Records beyond this backlog are dropped (and counted) instead of blocking requests
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # Sampling of DEBUG/INFO per message and second: the first N pass, then 1 of every M (0 = drop)
+    LOG_SAMPLE_INITIAL: int = int(os.getenv("LOG_SAMPLE_INITIAL", "100"))
+    LOG_SAMPLE_THEREAFTER: int = int(os.getenv("LOG_SAMPLE_THEREAFTER", "100"))
+
+    # Prometheus endpoint (/metrics) and request instrumentation
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # Tracing (app/core/tracing.py): exporters "file", "otlp" (comma separated) or "none"
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_EXPORTERS: str = os.getenv("TRACE_EXPORTERS", "none")
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    TRACE_FILE_PATH: str = os.getenv("TRACE_FILE_PATH", "/app/data/traces.jsonl")
+    OTLP_ENDPOINT: str = os.getenv("OTLP_ENDPOINT", "http://localhost:4318")
+    TRACE_SERVICE_NAME: str = os.getenv("TRACE_SERVICE_NAME", "nexus-backend")
+    # Requests slower than this keep their full span tree in the slow log (even if not sampled)
+    SLOW_REQUEST_SECONDS: float = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+    SLOW_REQUEST_LOG_PATH: str = os.getenv("SLOW_REQUEST_LOG_PATH", "/app/data/slow_requests.jsonl")
+    # On-demand profiling of single requests (X-NEXUS-PROFILE: <key>); disabled while empty
+    PROFILING_KEY: str = os.getenv("PROFILING_KEY", "")
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "/app/data/profiles")
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    PROFILE_TRACEMALLOC_FRAMES: int = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "15"))
+    PROFILE_TOP_ALLOCATIONS: int = int(os.getenv("PROFILE_TOP_ALLOCATIONS", "25"))
 
     def __init__(self):
         # Strict security validation for production
@@ -31,5 +151,10 @@ class Settings:
              # Warning only? Or fail? User said "Si no existen las claves... el código debe fallar". 
              # OpenAI key is essential for NEXUS.
             raise ValueError("CRITICAL: OPENAI_API_KEY environment variable is not set.")
+        if self.VECTOR_STORE_MODE not in ("embedded", "server"):
+            raise ValueError(f"VECTOR_STORE_MODE must be 'embedded' or 'server', got '{self.VECTOR_STORE_MODE}'.")
+        if self.OPENAI_BASE_URL:
+            # openai>=1 reads OPENAI_BASE_URL; older LangChain/RAGAS code paths read OPENAI_API_BASE
+            os.environ.setdefault("OPENAI_API_BASE", self.OPENAI_BASE_URL)
 
 settings = Settings()
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import aiosqlite
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = settings.DB_PATH
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content_encrypted BLOB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS usage_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Durable outbox for deferred lead extraction + webhook delivery
+    """
+    CREATE TABLE IF NOT EXISTS lead_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stage TEXT NOT NULL,
+        payload_encrypted BLOB NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        claim_token TEXT,
+        claimed_at REAL,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Model usage aggregated per UTC day / collection / user hash / operation / model
+    """
+    CREATE TABLE IF NOT EXISTS token_usage (
+        day TEXT NOT NULL,
+        collection TEXT NOT NULL,
+        user_hash TEXT NOT NULL,
+        operation TEXT NOT NULL,
+        model TEXT NOT NULL,
+        calls INTEGER NOT NULL DEFAULT 0,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        embedding_tokens INTEGER NOT NULL DEFAULT 0,
+        cost_usd REAL NOT NULL DEFAULT 0,
+        latency_seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, collection, user_hash, operation, model)
+    )
+    """,
+    # Auto slot routing: a few centroid codes per slot (mean of the unit embeddings
+    # assigned to the code, float32 bytes); built_vectors = slot size at the last re-clustering
+    """
+    CREATE TABLE IF NOT EXISTS slot_centroids (
+        collection TEXT NOT NULL,
+        code INTEGER NOT NULL,
+        vectors INTEGER NOT NULL,
+        centroid BLOB NOT NULL,
+        built_vectors INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (collection, code)
+    )
+    """,
+    # History reads: WHERE session_id = ? ORDER BY created_at
+    "CREATE INDEX IF NOT EXISTS idx_chat_sessions_session_time ON chat_sessions (session_id, created_at)",
+    # Retention deletes: WHERE created_at < ?
+    "CREATE INDEX IF NOT EXISTS idx_chat_sessions_time ON chat_sessions (created_at)",
+    # Covers the usage COUNT(*) (session_id + created_at, no table lookup)
+    "CREATE INDEX IF NOT EXISTS idx_usage_logs_session_time ON usage_logs (session_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_usage_logs_time ON usage_logs (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_lead_outbox_stage_due ON lead_outbox (stage, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS idx_lead_outbox_claim ON lead_outbox (claim_token)",
+    # Per-tenant reports: WHERE collection = ? AND day >= ?
+    "CREATE INDEX IF NOT EXISTS idx_token_usage_collection_day ON token_usage (collection, day)",
+    "CREATE INDEX IF NOT EXISTS idx_token_usage_day ON token_usage (day)",
+]
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable]
+
+async def _connect(path: str) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(path)
+    # WAL lets readers run while the writer commits; NORMAL is durable enough with WAL.
+    await conn.execute("PRAGMA journal_mode=WAL")
+    await conn.execute("PRAGMA synchronous=NORMAL")
+    await conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+class Database:
+    """
+    Shared SQLite access for the whole process.
+    - A fixed pool of reader connections (`connection()`).
+    - A single writer connection fed by a queue: concurrent writes are grouped
+      and committed together (`run_write()`), so N inserts cost one fsync.
+    Connections are opened once (at startup, or lazily on first use).
+    """
+
+    def __init__(self, path: str, pool_size: int, write_batch_size: int):
+        self.path = path
+        self.pool_size = pool_size
+        self.write_batch_size = write_batch_size
+        self._readers: Optional[asyncio.Queue] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+
+    async def open(self):
+        if self.is_open:
+            return
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.is_open:
+                return
+            db_dir = os.path.dirname(self.path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+
+            readers = asyncio.Queue()
+            for _ in range(self.pool_size):
+                conn = await _connect(self.path)
+                self._all_readers.append(conn)
+                readers.put_nowait(conn)
+            self._readers = readers
+            self._write_queue = asyncio.Queue()
+            self._writer = await _connect(self.path)
+            self._writer_task = asyncio.create_task(self._writer_loop())
+            logger.info(f"SQLite pool opened at {self.path} ({self.pool_size} readers + 1 writer, WAL).")
+
+    async def close(self):
+        if not self.is_open:
+            return
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        # Flush anything still queued before closing the writer
+        pending = []
+        while not self._write_queue.empty():
+            pending.append(self._write_queue.get_nowait())
+        if pending:
+            await self._commit_batch(pending)
+
+        for conn in self._all_readers:
+            await conn.close()
+        await self._writer.close()
+        self._all_readers = []
+        self._readers = None
+        self._writer = None
+        self._write_queue = None
+        self._writer_task = None
+        self._open_lock = None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrows a reader connection from the pool."""
+        await self.open()
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def run_write(self, op: WriteOp):
+        """
+        Queues `op(db)` on the writer connection and waits until its group is committed.
+        `op` must not commit by itself.
+        """
+        await self.open()
+        future = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((op, future))
+        return await future
+
+    async def _writer_loop(self):
+        while True:
+            batch = [await self._write_queue.get()]
+            while len(batch) < self.write_batch_size and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[Tuple[WriteOp, asyncio.Future]]):
+        done = []
+        # One transaction for the group, one savepoint per op: a failing op's earlier
+        # statements are undone, the rest of the group still commits.
+        if not self._writer.in_transaction:
+            await self._writer.execute("BEGIN")
+        for n, (op, future) in enumerate(batch):
+            await self._writer.execute(f"SAVEPOINT op_{n}")
+            try:
+                result = await op(self._writer)
+            except Exception as e:
+                await self._writer.execute(f"ROLLBACK TO op_{n}")
+                await self._writer.execute(f"RELEASE op_{n}")
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            await self._writer.execute(f"RELEASE op_{n}")
+            done.append((future, result))
+
+        try:
+            await self._writer.commit()
+        except Exception as e:
+            logger.error(f"Group commit failed: {e}")
+            await self._writer.rollback()
+            for future, _ in done:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in done:
+            if not future.done():
+                future.set_result(result)
+
+pool = Database(DB_PATH, settings.DB_POOL_SIZE, settings.DB_WRITE_BATCH_SIZE)
+
+async def init_db():
+    """Creates the SQLite file, tables and indexes, and opens the shared pool."""
+    await pool.open()
+
+    async def _create_schema(conn: aiosqlite.Connection):
+        for statement in SCHEMA:
+            await conn.execute(statement)
+
+    await pool.run_write(_create_schema)
+
+async def close_db():
+    await pool.close()
@@ -0,0 +1,238 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timezone
+
+from app.core import tracing
+from app.core.config import settings
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Client supplied ids are echoed back, so keep them short and printable
+MAX_REQUEST_ID_LENGTH = 128
+
+# Correlation id of the current request. Follows asyncio tasks and
+# run_in_threadpool, so service logs carry the id of the request that caused them.
+_request_id: contextvars.ContextVar = contextvars.ContextVar("nexus_request_id", default=None)
+
+# LogRecord attributes that are not `extra=` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id", "trace_id"}
+
+def current_request_id():
+    return _request_id.get()
+
+class CorrelationFilter(logging.Filter):
+    """Stamps records with the request id and the trace id (runs in the calling thread)."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        record.trace_id = tracing.current_span().trace_id
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Per logging call site and second: the first `initial` records pass, then
+    one of every `thereafter`. WARNING and above are never sampled, so only
+    high-frequency debug/info events (per-request logs under load) are thinned.
+    """
+
+    def __init__(self, initial: int, thereafter: int):
+        super().__init__()
+        self.initial = initial
+        self.thereafter = thereafter
+        self._counts = {}
+        self._second = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.initial <= 0:
+            return True
+        second = int(time.monotonic())
+        # The call site, not the message: f-string messages differ on every call
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            if second != self._second:
+                self._second = second
+                self._counts.clear()
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        if count <= self.initial:
+            return True
+        return self.thereafter > 0 and (count - self.initial) % self.thereafter == 0
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without waiting: when the queue is
+    full the record is dropped and counted (reported with the next record)
+    instead of blocking the request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Only the message is rendered here (args may be mutated after the call);
+        # JSON serialization happens in the listener thread
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                notice = logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"{dropped} log records dropped (queue full)", "request_id": None, "trace_id": None,
+                })
+                notice.message = notice.msg
+                try:
+                    self.queue.put_nowait(notice)
+                except queue.Full:
+                    pass
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields are included as keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage() if record.args else str(record.msg),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "request_id") or record.request_id is None:
+            record.request_id = "-"
+        return super().format(record)
+
+_listener = None
+
+def _parse_levels(value: str) -> dict:
+    """'app.services.rag_service=DEBUG,uvicorn.access=WARNING' -> {logger: level}"""
+    levels = {}
+    for item in value.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging():
+    """
+    Routes every logger (including uvicorn's) through one queue: callers only
+    pay for the message rendering and a put_nowait, the listener thread
+    formats and writes to stdout. Idempotent.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_INITIAL, settings.LOG_SAMPLE_THEREAFTER))
+    queue_handler.addFilter(CorrelationFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+    # uvicorn installs its own synchronous stream handlers: send them through the queue too
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+def shutdown_logging():
+    """Drains the queue (called on shutdown so the last records are not lost)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _valid_request_id(value: bytes):
+    try:
+        text = value.decode("ascii")
+    except UnicodeDecodeError:
+        return None
+    if 0 < len(text) <= MAX_REQUEST_ID_LENGTH and text.isprintable() and " " not in text:
+        return text
+    return None
+
+class RequestIdMiddleware:
+    """
+    Per-request correlation id: continues an incoming X-Request-ID (e.g. from
+    n8n or a proxy) or creates one, exposes it to every log record of the
+    request and returns it in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == REQUEST_ID_HEADER:
+                request_id = _valid_request_id(value)
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = [h for h in message.get("headers", []) if h[0].lower() != REQUEST_ID_HEADER]
+                message = dict(message, headers=headers + [(REQUEST_ID_HEADER, request_id.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_id.reset(token)
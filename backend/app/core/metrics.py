@@ -0,0 +1,227 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# Own registry: only NEXUS metrics (plus what we register) are exposed on /metrics
+registry = CollectorRegistry()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# RAG pipeline stages
+STAGE_LOAD = "load"
+STAGE_SPLIT = "split"
+STAGE_EMBED = "embed"
+STAGE_UPSERT = "upsert"
+STAGE_RETRIEVAL = "retrieval"
+STAGE_GENERATION = "generation"
+STAGE_LEAD_EXTRACTION = "lead_extraction"
+STAGE_SUMMARIZATION = "summarization"
+# LLM calls tagged with one of these are timed under it instead of "generation"
+LLM_STAGE_TAGS = (STAGE_LEAD_EXTRACTION, STAGE_SUMMARIZATION)
+
+HTTP_REQUESTS = Counter(
+    "nexus_http_requests_total", "HTTP requests handled",
+    ["method", "route", "collection", "status"], registry=registry,
+)
+HTTP_LATENCY = Histogram(
+    "nexus_http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "collection"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+STAGE_LATENCY = Histogram(
+    "nexus_rag_stage_duration_seconds", "Duration of RAG pipeline stages",
+    ["stage"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+LLM_TOKENS = Counter(
+    "nexus_llm_tokens_total", "OpenAI tokens reported by the API",
+    ["model", "kind"], registry=registry,
+)
+EMBEDDED_TEXTS = Counter(
+    "nexus_embedded_texts_total", "Texts (chunks) sent to the embedding model", registry=registry,
+)
+CACHE_REQUESTS = Counter(
+    "nexus_cache_requests_total", "Cache lookups (hit ratio = hit / (hit + miss))",
+    ["cache", "result"], registry=registry,
+)
+INGESTION_IN_PROGRESS = Gauge(
+    "nexus_ingestion_jobs_in_progress", "Documents currently being indexed", registry=registry,
+)
+COLLECTIONS_RESIDENT = Gauge(
+    "nexus_collections_resident", "Collections with their vector index loaded in memory", registry=registry,
+)
+COLLECTION_MEMORY_BYTES = Gauge(
+    "nexus_collection_memory_bytes", "Estimated memory of the loaded vector indexes", registry=registry,
+)
+COLLECTION_EVICTIONS = Counter(
+    "nexus_collection_evictions_total", "Idle collections unloaded to stay under the memory budget", registry=registry,
+)
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+class LangChainMetricsHandler(BaseCallbackHandler):
+    """
+    Times retriever and LLM runs (retrieval / generation stages) and counts the
+    tokens reported by OpenAI. Stateless apart from the start times of open runs,
+    so one instance is shared by every chain.
+    """
+
+    def __init__(self):
+        self._starts = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, stage: str):
+        with self._lock:
+            self._starts[run_id] = (time.perf_counter(), stage)
+
+    def _end(self, run_id):
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+        if started is not None:
+            start, stage = started
+            STAGE_LATENCY.labels(stage).observe(time.perf_counter() - start)
+
+    def _llm_stage(self, tags) -> str:
+        for tag in tags or ():
+            if tag in LLM_STAGE_TAGS:
+                return tag
+        return STAGE_GENERATION
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, STAGE_RETRIEVAL)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, self._llm_stage(kwargs.get("tags")))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, self._llm_stage(kwargs.get("tags")))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or {}
+        model = output.get("model_name", "unknown")
+        if usage.get("prompt_tokens"):
+            LLM_TOKENS.labels(model, "prompt").inc(usage["prompt_tokens"])
+        if usage.get("completion_tokens"):
+            LLM_TOKENS.labels(model, "completion").inc(usage["completion_tokens"])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+langchain_handler = LangChainMetricsHandler()
+
+class ThreadpoolCollector:
+    """
+    Threadpool saturation (sync endpoints and run_in_threadpool share anyio's
+    default limiter). Read at scrape time only; must be collected on the event loop.
+    """
+
+    def collect(self):
+        borrowed = GaugeMetricFamily("nexus_threadpool_busy_threads", "Worker threads in use")
+        total = GaugeMetricFamily("nexus_threadpool_max_threads", "Worker thread limit")
+        try:
+            from anyio.to_thread import current_default_thread_limiter
+            limiter = current_default_thread_limiter()
+            borrowed.add_metric([], limiter.borrowed_tokens)
+            total.add_metric([], limiter.total_tokens)
+        except Exception:
+            # Not on the event loop (e.g. tests calling generate_latest directly)
+            return
+        yield borrowed
+        yield total
+
+registry.register(ThreadpoolCollector())
+
+def render_latest():
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: one perf_counter pair and two metric updates per request.
+    Routes are labelled by their template (/api/v1/slots/{slot_id}) and the
+    collection by `collection_name` (query string, or set by the endpoint on
+    request.state.collection for JSON bodies); names that are not slots are
+    labelled "other".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            if route_path != "/metrics":
+                # Unmatched paths (scanners, typos) must not create new label values
+                collection = _request_collection(scope) if route is not None else ""
+                method = scope["method"]
+                HTTP_REQUESTS.labels(method, route_path, collection, str(status["code"])).inc()
+                HTTP_LATENCY.labels(method, route_path, collection).observe(elapsed)
+
+# Collection label of names that are not a slot (clients choose the name: no new label values)
+OTHER_COLLECTION = "other"
+# Labels endpoints set that are not slot names (auto routing, requests over several slots)
+FIXED_COLLECTIONS = {"auto", "federated"}
+# Configured slots (slots.json and slot_settings.json), refreshed off the request
+# path by the "metrics_known_slots" job: the middleware only does a set lookup
+KNOWN_SLOTS_REFRESH_SECONDS = 10.0
+_known_slots = frozenset()
+
+def set_known_slots(names):
+    global _known_slots
+    _known_slots = frozenset(names)
+
+def _collection_label(name: str) -> str:
+    if not name or name in FIXED_COLLECTIONS or name in _known_slots:
+        return name
+    return OTHER_COLLECTION
+
+def _request_collection(scope) -> str:
+    state_collection = (scope.get("state") or {}).get("collection")
+    if state_collection:
+        return _collection_label(state_collection)
+    path_params = scope.get("path_params") or {}
+    if path_params.get("slot_id"):
+        return _collection_label(path_params["slot_id"])
+    query = scope.get("query_string", b"")
+    if b"collection_name=" not in query:
+        return ""
+    values = parse_qs(query.decode("latin-1")).get("collection_name")
+    return _collection_label(values[0]) if values else ""
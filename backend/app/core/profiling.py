@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-nexus-profile"
+# ?__profile_memory=0 skips tracemalloc (CPU profile only)
+PROFILE_MEMORY_PARAM = b"__profile_memory=0"
+PROFILE_ID_CHARS = set("0123456789abcdef")
+# The endpoints that read profiles take the same key; never profile them
+PROFILES_API_PATH = f"{settings.API_V1_STR}/profiles"
+
+class ProfileSession:
+    """
+    Profile of ONE request: a sampling profiler over the threads that run it
+    plus a tracemalloc diff. Threads are registered by tracing spans
+    (threadpool workers) and by the middleware (event loop thread).
+    Worker thread samples belong to this request only; event-loop samples can
+    include other coroutines running at the same time, and so can the
+    allocation diff (tracemalloc is process-wide).
+    """
+
+    def __init__(self, method: str, path: str, memory: bool):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.memory = memory
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._snapshot = None
+        self._started_tracemalloc = False
+        self.started_at = None
+        self.duration_seconds = None
+
+    def add_thread(self, ident: int, label: str):
+        with self._lock:
+            label, count = self._threads.get(ident, (label, 0))
+            self._threads[ident] = (label, count + 1)
+
+    def remove_thread(self, ident: int):
+        with self._lock:
+            label, count = self._threads.get(ident, (None, 0))
+            if count <= 1:
+                self._threads.pop(ident, None)
+            else:
+                self._threads[ident] = (label, count - 1)
+
+    def _sample_loop(self):
+        interval = settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        own = threading.get_ident()
+        while not self._stop.wait(interval):
+            with self._lock:
+                threads = dict(self._threads)
+            frames = sys._current_frames()
+            for ident, (label, _) in threads.items():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                if frame.f_code.co_filename.endswith("selectors.py"):
+                    # Idle event loop waiting for I/O, not time spent on this request
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({_short_path(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(label)
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self.started_at = time.time()
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(settings.PROFILE_TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._sampler.join()
+        self.duration_seconds = time.time() - self.started_at
+        allocations = []
+        if self.memory:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ])
+            stats = snapshot.compare_to(self._snapshot, "traceback")
+            for stat in stats[:settings.PROFILE_TOP_ALLOCATIONS]:
+                allocations.append({
+                    "size_diff_bytes": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size_bytes": stat.size,
+                    # Most recent call first
+                    "traceback": [f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)],
+                })
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration_seconds,
+            "sample_interval_ms": settings.PROFILE_SAMPLE_INTERVAL_MS,
+            "samples": self.samples,
+            "top_allocations": allocations,
+        }
+
+def _short_path(filename: str) -> str:
+    for marker in ("site-packages/", "/app/"):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return os.path.basename(filename)
+
+_session: contextvars.ContextVar = contextvars.ContextVar("nexus_profile_session", default=None)
+# One profile at a time: tracemalloc and the sampler are process-wide
+_active_lock = threading.Lock()
+
+def enter_thread():
+    """Called on span entry: adds the current thread to the active profile (if any)."""
+    session = _session.get()
+    if session is None:
+        return None
+    ident = threading.get_ident()
+    session.add_thread(ident, f"thread:{threading.current_thread().name}")
+    return session, ident
+
+def exit_thread(token):
+    if token is not None:
+        session, ident = token
+        session.remove_thread(ident)
+
+def _profile_path(profile_id: str, extension: str) -> str:
+    return os.path.join(settings.PROFILE_DIR, f"{profile_id}.{extension}")
+
+def save_profile(session: ProfileSession, report: dict):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    # Collapsed stacks: `flamegraph.pl`, speedscope and inferno read this directly
+    with open(_profile_path(session.id, "folded"), "w") as f:
+        for stack, count in session.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(_profile_path(session.id, "json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    if not profile_id or not set(profile_id) <= PROFILE_ID_CHARS:
+        return None
+    path = _profile_path(profile_id, "json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def folded_path(profile_id: str) -> Optional[str]:
+    if not profile_id or not set(profile_id) <= PROFILE_ID_CHARS:
+        return None
+    path = _profile_path(profile_id, "folded")
+    return path if os.path.exists(path) else None
+
+def list_profiles() -> list:
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(settings.PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            report = load_profile(name[:-5])
+            if report:
+                profiles.append({k: report[k] for k in ("id", "method", "path", "started_at", "duration_seconds", "samples")})
+    return sorted(profiles, key=lambda p: p["started_at"], reverse=True)
+
+def is_admin_key(value: str) -> bool:
+    return bool(settings.PROFILING_KEY) and hmac.compare_digest((value or "").encode(), settings.PROFILING_KEY.encode())
+
+def _requested_key(scope) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == PROFILE_HEADER:
+            return value.decode("latin-1")
+    # Header only: a key in the query string ends up in access logs and browser history
+    return None
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request when it carries the admin PROFILING_KEY in the
+    X-NEXUS-PROFILE header. Other requests only pay one
+    header scan. The profile id comes back in X-Profile-Id; the report and
+    the collapsed stacks are stored under PROFILE_DIR.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.PROFILING_KEY or scope["path"].startswith(PROFILES_API_PATH):
+            await self.app(scope, receive, send)
+            return
+        requested = _requested_key(scope)
+        if requested is None:
+            await self.app(scope, receive, send)
+            return
+        if not is_admin_key(requested) or not _active_lock.acquire(blocking=False):
+            # Wrong key or a profile already running: serve the request normally
+            status = b"denied" if not is_admin_key(requested) else b"busy"
+            await self.app(scope, receive, _with_headers(send, [(b"x-profile-status", status)]))
+            return
+
+        memory = PROFILE_MEMORY_PARAM not in scope.get("query_string", b"")
+        session = ProfileSession(scope["method"], scope["path"], memory)
+        token = _session.set(session)
+        loop_thread = threading.get_ident()
+        session.add_thread(loop_thread, "event-loop")
+        # tracemalloc snapshots, their diff and the report writes take a while on
+        # a big heap: in a worker thread, so the other requests keep being served
+        try:
+            await asyncio.to_thread(session.start)
+            await self.app(scope, receive, _with_headers(send, [(b"x-profile-id", session.id.encode())]))
+        finally:
+            session.remove_thread(loop_thread)
+            _session.reset(token)
+            try:
+                report = await asyncio.to_thread(session.stop)
+                await asyncio.to_thread(save_profile, session, report)
+                logger.info(f"Profiled {scope['method']} {scope['path']}: {session.samples} samples -> {session.id}")
+            except Exception as e:
+                logger.error(f"Could not store profile {session.id}: {e}")
+            finally:
+                _active_lock.release()
+
+def _with_headers(send, extra: list):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message = dict(message, headers=list(message.get("headers", [])) + extra)
+        await send(message)
+    return send_wrapper
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no cross-process lock, every process is leader
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A periodic maintenance job plus its timing metrics."""
+
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval_seconds: float, description: str = "",
+                 per_process: bool = False):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.description = description
+        # Clears this process's own state: runs in every worker, without the leader/job locks
+        self.per_process = per_process
+        self.lock = asyncio.Lock()
+        # Metrics
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_duration = 0.0
+        self.last_duration: Optional[float] = None
+        self.max_duration = 0.0
+        self.last_started_at: Optional[str] = None
+        self.next_run_at: Optional[str] = None
+        self.last_result = None
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "interval_seconds": self.interval_seconds,
+            "per_process": self.per_process,
+            "running": self.lock.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_started_at": self.last_started_at,
+            "next_run_at": self.next_run_at,
+            "last_duration_ms": round(self.last_duration * 1000, 2) if self.last_duration is not None else None,
+            "avg_duration_ms": round(self.total_duration / self.runs * 1000, 2) if self.runs else None,
+            "max_duration_ms": round(self.max_duration * 1000, 2),
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+class Scheduler:
+    """
+    Small in-process scheduler started from the app lifespan.
+    - Every job runs on its own loop with +/- jitter so workers don't fire in lockstep.
+    - Only the worker holding the leader file lock runs scheduled jobs
+      (uvicorn --workers N would otherwise run every job N times).
+    - Every run (scheduled or manual) also takes a per-job file lock, so the same
+      job never runs twice at once across processes.
+    - `per_process` jobs (eviction of in-memory caches) skip both locks and run
+      in every worker, also when SCHEDULER_ENABLED=false.
+    """
+
+    def __init__(self, lock_dir: str, jitter: float = 0.1):
+        self.lock_dir = lock_dir
+        self.jitter = jitter
+        self.jobs: Dict[str, Job] = {}
+        self._tasks = []
+        self._leader_fd = None
+
+    def register(self, name: str, func: Callable[[], Awaitable], interval_seconds: float, description: str = "",
+                 per_process: bool = False):
+        self.jobs[name] = Job(name, func, interval_seconds, description, per_process)
+
+    @property
+    def is_leader(self) -> bool:
+        return fcntl is None or self._leader_fd is not None
+
+    def _try_lock(self, filename: str):
+        """Non-blocking exclusive lock on a file in lock_dir. Returns the fd or None."""
+        if fcntl is None:
+            return -1
+        os.makedirs(self.lock_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.lock_dir, filename), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def _release_lock(self, fd):
+        if fcntl is None or fd is None or fd < 0:
+            return
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    def _ensure_leader(self) -> bool:
+        # Re-tried on every tick: if the leader worker dies, another one takes over.
+        if not self.is_leader:
+            self._leader_fd = self._try_lock("scheduler.leader.lock")
+            if self._leader_fd is not None:
+                logger.info(f"Scheduler leadership acquired by pid {os.getpid()}.")
+        return self.is_leader
+
+    def _next_delay(self, job: Job) -> float:
+        spread = job.interval_seconds * self.jitter
+        return max(1.0, job.interval_seconds + random.uniform(-spread, spread))
+
+    async def run_job(self, name: str) -> dict:
+        """Runs a job now. Returns its metrics; skipped if it is already running anywhere."""
+        job = self.jobs[name]
+        if job.lock.locked():
+            job.skipped += 1
+            return {"status": "skipped", "reason": "already running", "job": job.to_dict()}
+
+        async with job.lock:
+            fd = -1 if job.per_process else self._try_lock(f"job_{name}.lock")
+            if fd is None:
+                job.skipped += 1
+                return {"status": "skipped", "reason": "running in another worker", "job": job.to_dict()}
+
+            job.last_started_at = datetime.utcnow().isoformat()
+            start = time.perf_counter()
+            try:
+                job.last_result = await job.func()
+                job.last_error = None
+                status = "success"
+            except Exception as e:
+                logger.error(f"Scheduled job '{name}' failed: {e}")
+                job.failures += 1
+                job.last_error = str(e)
+                status = "failed"
+            finally:
+                duration = time.perf_counter() - start
+                job.runs += 1
+                job.total_duration += duration
+                job.last_duration = duration
+                job.max_duration = max(job.max_duration, duration)
+                self._release_lock(fd)
+
+        return {"status": status, "job": job.to_dict()}
+
+    async def _job_loop(self, job: Job):
+        # First run is also jittered so all workers don't hit SQLite right after a deploy
+        delay = random.uniform(0, job.interval_seconds * max(self.jitter, 0.01))
+        while True:
+            job.next_run_at = datetime.utcfromtimestamp(time.time() + delay).isoformat()
+            await asyncio.sleep(delay)
+            if job.per_process or self._ensure_leader():
+                await self.run_job(job.name)
+            delay = self._next_delay(job)
+
+    def start(self, per_process_only: bool = False):
+        """Starts the job loops; `per_process_only` (scheduler disabled) starts the per-process jobs alone."""
+        if self._tasks:
+            return
+        jobs = [job for job in self.jobs.values() if job.per_process or not per_process_only]
+        if not per_process_only:
+            self._ensure_leader()
+        for job in jobs:
+            self._tasks.append(asyncio.create_task(self._job_loop(job)))
+        logger.info(f"Scheduler started with {len(jobs)} jobs.")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._release_lock(self._leader_fd)
+        self._leader_fd = None
+
+    def list_jobs(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "is_leader": self.is_leader,
+            "running": bool(self._tasks),
+            "jobs": [job.to_dict() for job in self.jobs.values()],
+        }
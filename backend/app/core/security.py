@@ -0,0 +1,19 @@
+import base64
+import hashlib
+import hmac
+from cryptography.fernet import Fernet
+from app.core.config import settings
+
+# Fernet needs a 32-byte urlsafe base64 key; we derive it from SECRET_KEY
+# so there is a single secret to manage.
+_fernet = Fernet(base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest()))
+
+def hash_user_id(user_id: str) -> str:
+    """One-way hash of the user identifier (we never store raw ids)."""
+    return hmac.new(settings.SECRET_KEY.encode(), str(user_id).encode(), hashlib.sha256).hexdigest()
+
+def encrypt_data(content: str) -> bytes:
+    return _fernet.encrypt(content.encode("utf-8"))
+
+def decrypt_data(encrypted: bytes) -> str:
+    return _fernet.decrypt(encrypted).decode("utf-8")
@@ -1,12 +1,34 @@
-import aiosqlite
+import asyncio
+import glob
 import logging
+import os
+import shutil
+import time
 from datetime import datetime, timedelta
+from app.core import metrics
 from app.core.config import settings
-from app.core.database import DB_PATH
+from app.core.database import pool
+from app.core.scheduler import Scheduler
 from app.services import crud
+from app.services.rate_limiter import rate_limiter
+from app.services.slot_router import slot_router
 
 logger = logging.getLogger(__name__)
 
+async def _delete_in_batches(delete_fn, cutoff: str) -> int:
+    """
+    Runs `delete_fn` in bounded batches, each one its own short write transaction,
+    so chat/usage inserts queued in between are never blocked for long.
+    """
+    batch_size = settings.DB_DELETE_BATCH_SIZE
+    total = 0
+    while True:
+        deleted = await pool.run_write(lambda db: delete_fn(db, cutoff, batch_size))
+        total += deleted
+        if deleted < batch_size:
+            return total
+        await asyncio.sleep(0)
+
 async def cleanup_database():
     """
     Periodic task to clean up old data.
@@ -14,15 +36,131 @@ async def cleanup_database():
     - Usage logs: Deleted after 24 hours (Cost Control)
     """
     logger.info("Starting database cleanup task...")
-    async with aiosqlite.connect(DB_PATH) as db:
-        # 1. Cleanup Chat Sessions
-        chat_cutoff = (datetime.utcnow() - timedelta(hours=settings.CHAT_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
-        deleted_chats = await crud.delete_old_chat_sessions(db, chat_cutoff)
-        
-        # 2. Cleanup Usage Logs
-        log_cutoff = (datetime.utcnow() - timedelta(hours=settings.LOG_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
-        deleted_logs = await crud.delete_old_usage_logs(db, log_cutoff)
-        
-        logger.info(f"Database cleanup complete. Removed {deleted_chats} chat sessions and {deleted_logs} usage logs.")
+    # 1. Cleanup Chat Sessions
+    chat_cutoff = (datetime.utcnow() - timedelta(hours=settings.CHAT_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    deleted_chats = await _delete_in_batches(crud.delete_old_chat_sessions, chat_cutoff)
+    
+    # 2. Cleanup Usage Logs
+    log_cutoff = (datetime.utcnow() - timedelta(hours=settings.LOG_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    deleted_logs = await _delete_in_batches(crud.delete_old_usage_logs, log_cutoff)
+    
+    logger.info(f"Database cleanup complete. Removed {deleted_chats} chat sessions and {deleted_logs} usage logs.")
         
     return {"deleted_chats": deleted_chats, "deleted_logs": deleted_logs}
+
+async def evict_caches():
+    """Drops in-memory state nobody is using any more."""
+    evicted_users = rate_limiter.evict_idle()
+    return {"rate_limiter_idle_users": evicted_users}
+
+def _load_known_slots() -> set:
+    from app.services import rag_service, slot_settings
+
+    return set(rag_service.get_slot_config()) | set(slot_settings.load_all())
+
+async def refresh_metric_labels():
+    """Reloads the configured slot names, the collection label values of /metrics (anything else is "other")."""
+    names = await asyncio.to_thread(_load_known_slots)
+    metrics.set_known_slots(names)
+    return {"known_slots": len(names)}
+
+def _remove_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+def _collect_orphan_files() -> dict:
+    # Imported here: rag_service pulls in LangChain/Chroma, which the DB-only tasks don't need
+    from app.services import rag_service, upload_store
+
+    max_age = settings.ORPHAN_FILE_MAX_AGE_HOURS * 3600
+    now = time.time()
+    removed_artifacts = []
+    removed_uploads = []
+
+    # 1. Leftovers from interrupted exports/imports
+    app_dir = os.path.dirname(rag_service.CHROMA_DB_DIR)
+    for pattern in ("export_*", "import_temp_*"):
+        for path in glob.glob(os.path.join(app_dir, pattern)):
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    _remove_path(path)
+                    removed_artifacts.append(os.path.basename(path))
+            except OSError as e:
+                logger.warning(f"Could not remove stale artifact {path}: {e}")
+
+    # 2. Flat uploads (stored before content addressing) no collection references
+    if os.path.isdir(rag_service.UPLOAD_DIR):
+        referenced = rag_service.get_referenced_sources()
+        for filename in os.listdir(rag_service.UPLOAD_DIR):
+            if upload_store.is_internal(filename):
+                continue
+            path = os.path.join(rag_service.UPLOAD_DIR, filename)
+            try:
+                if path not in referenced and now - os.path.getmtime(path) > max_age:
+                    _remove_path(path)
+                    removed_uploads.append(filename)
+            except OSError as e:
+                logger.warning(f"Could not remove orphan upload {path}: {e}")
+
+    # 3. Upload blobs no slot references (deleted documents, reset slots, failed indexing)
+    blobs = upload_store.collect_garbage(rag_service.UPLOAD_DIR, max_age)
+
+    return {"stale_artifacts": removed_artifacts, "orphan_uploads": removed_uploads,
+            "orphan_blobs": blobs["blobs"], "orphan_blob_bytes": blobs["bytes"]}
+
+async def cleanup_orphan_files():
+    """Deletes stale export/import artifacts and uploads that no collection references."""
+    result = await asyncio.to_thread(_collect_orphan_files)
+    logger.info(
+        f"Orphan file GC complete. Removed {len(result['stale_artifacts'])} artifacts, {len(result['orphan_uploads'])} uploads "
+        f"and {len(result['orphan_blobs'])} blobs ({result['orphan_blob_bytes']} bytes)."
+    )
+    return result
+
+def _compact_storage() -> dict:
+    from app.services import rag_service
+
+    return rag_service.compact_storage(
+        settings.MAINTENANCE_TOMBSTONE_RATIO, settings.MAINTENANCE_VACUUM_FRAGMENTATION, settings.MAINTENANCE_REBUILD_INDEXES
+    )
+
+async def compact_storage():
+    """Purges Chroma's write log, VACUUMs SQLite when fragmented and reports (opt-in: rebuilds) indexes full of deleted elements."""
+    result = await asyncio.to_thread(_compact_storage)
+    logger.info(
+        f"Storage maintenance complete. Rebuilt {len(result['rebuilt'])} collections, "
+        f"{len(result['compaction_due'])} slots due for a compaction.", extra={"result": result}
+    )
+    return result
+
+scheduler = Scheduler(
+    lock_dir=os.path.dirname(settings.DB_PATH) or ".",
+    jitter=settings.SCHEDULER_JITTER,
+)
+scheduler.register(
+    "db_retention", cleanup_database, settings.CLEANUP_INTERVAL_SECONDS,
+    "Deletes expired chat sessions and usage logs."
+)
+scheduler.register(
+    "cache_eviction", evict_caches, settings.CACHE_EVICTION_INTERVAL_SECONDS,
+    "Evicts idle in-memory state (rate limiter windows).", per_process=True
+)
+scheduler.register(
+    "metrics_known_slots", refresh_metric_labels, metrics.KNOWN_SLOTS_REFRESH_SECONDS,
+    "Reloads the slot names /metrics may use as collection labels.", per_process=True
+)
+if settings.ROUTER_ENABLED:
+    scheduler.register(
+        "slot_routing_rebuild", slot_router.rebuild, settings.ROUTER_REBUILD_INTERVAL_SECONDS,
+        "Re-clusters the auto-routing centroids of new or drifted slots."
+    )
+scheduler.register(
+    "orphan_file_gc", cleanup_orphan_files, settings.ORPHAN_GC_INTERVAL_SECONDS,
+    "Removes stale export/import artifacts and unreferenced uploads."
+)
+scheduler.register(
+    "storage_maintenance", compact_storage, settings.MAINTENANCE_INTERVAL_SECONDS,
+    "Purges the vector store's write log, vacuums it and reports indexes with many deleted elements."
+)
@@ -0,0 +1,438 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.core import profiling
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+class Span:
+    """One timed operation. Finished spans are kept by their trace until the local root ends."""
+
+    __slots__ = ("trace", "trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name: str, parent_id: Optional[str], attributes: dict):
+        self.trace = trace
+        self.trace_id = trace.trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.error = None
+
+    def set_attribute(self, key: str, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException):
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.trace.span_ended(self)
+
+    @property
+    def duration_seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_seconds * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+class _NoopSpan:
+    trace_id = span_id = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error):
+        pass
+
+    def end(self):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class _Trace:
+    """
+    Spans of one trace created in this process. Exported when the local root
+    ends: sampled traces go to the exporters, slow ones always go to the slow log.
+    """
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.root: Optional[Span] = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def span_ended(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+        if span is self.root:
+            tracer.trace_finished(self)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("nexus_current_span", default=None)
+# Remote parent (incoming traceparent header): (trace_id, span_id)
+_remote_parent: contextvars.ContextVar = contextvars.ContextVar("nexus_remote_parent", default=None)
+
+class FileExporter:
+    """One JSON line per span (local file, easy to grep or load into pandas)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OTLPExporter:
+    """OTLP/HTTP with JSON encoding (no protobuf dependency); works with any OpenTelemetry collector."""
+
+    def __init__(self, endpoint: str, service_name: str):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self._client = httpx.Client(timeout=5)
+
+    def export(self, spans: list):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "nexus"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": 1,
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+        self._client.post(self.url, json=body).raise_for_status()
+
+def span_tree(spans: list) -> list:
+    """Nests spans under their parents (roots = spans whose parent is not in the list)."""
+    nodes = {span.span_id: dict(span.to_dict(), children=[]) for span in spans}
+    roots = []
+    for span in sorted(spans, key=lambda s: s.start_ns):
+        node = nodes[span.span_id]
+        parent = nodes.get(span.parent_id)
+        (parent["children"] if parent else roots).append(node)
+    return roots
+
+class Tracer:
+    """
+    Minimal in-process tracer: spans live in a contextvar (so they follow
+    asyncio tasks and run_in_threadpool), finished traces are handed to a
+    background thread that writes them out. Request threads never do I/O.
+    """
+
+    def __init__(self):
+        self.exporters = []
+        self._queue: "queue.Queue" = queue.Queue(maxsize=1000)
+        self._thread = None
+        self._configured = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.TRACING_ENABLED
+
+    def _configure(self):
+        with self._lock:
+            if self._configured:
+                return
+            for name in (e.strip() for e in settings.TRACE_EXPORTERS.split(",")):
+                if name == "file":
+                    self.exporters.append(FileExporter(settings.TRACE_FILE_PATH))
+                elif name == "otlp":
+                    self.exporters.append(OTLPExporter(settings.OTLP_ENDPOINT, settings.TRACE_SERVICE_NAME))
+                elif name and name != "none":
+                    logger.warning(f"Unknown trace exporter '{name}' ignored")
+            self._thread = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+            self._thread.start()
+            self._configured = True
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        if not self._configured:
+            self._configure()
+        parent = parent or _current_span.get()
+        if parent is not None and parent is not NOOP_SPAN:
+            return Span(parent.trace, name, parent.span_id, attributes)
+
+        remote = _remote_parent.get()
+        if remote:
+            trace = _Trace(remote[0], sampled=True)
+            parent_id = remote[1]
+        else:
+            trace = _Trace("%032x" % random.getrandbits(128), sampled=random.random() < settings.TRACE_SAMPLE_RATE)
+            parent_id = None
+        span = Span(trace, name, parent_id, attributes)
+        trace.root = span
+        return span
+
+    def trace_finished(self, trace: _Trace):
+        slow = trace.root.duration_seconds >= settings.SLOW_REQUEST_SECONDS
+        if not trace.sampled and not slow:
+            return
+        try:
+            self._queue.put_nowait((trace, slow))
+        except queue.Full:
+            # Never block a request on telemetry
+            pass
+
+    def _export_loop(self):
+        while True:
+            trace, slow = self._queue.get()
+            if trace.sampled:
+                for exporter in self.exporters:
+                    try:
+                        exporter.export(trace.spans)
+                    except Exception as e:
+                        logger.warning(f"Trace export to {type(exporter).__name__} failed: {e}")
+            if slow:
+                self._write_slow_log(trace)
+
+    def _write_slow_log(self, trace: _Trace):
+        root = trace.root
+        logger.warning(f"Slow request: {root.name} took {root.duration_seconds:.2f}s (trace {trace.trace_id})")
+        entry = {
+            "trace_id": trace.trace_id,
+            "name": root.name,
+            "duration_ms": round(root.duration_seconds * 1000, 3),
+            "spans": span_tree(trace.spans),
+        }
+        try:
+            os.makedirs(os.path.dirname(settings.SLOW_REQUEST_LOG_PATH) or ".", exist_ok=True)
+            with open(settings.SLOW_REQUEST_LOG_PATH, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write slow request log: {e}")
+
+tracer = Tracer()
+
+# --- PUBLIC API ---
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+@contextmanager
+def span(name: str, **attributes):
+    """Runs the block inside a child span of the current one (or a new trace)."""
+    # Spans also mark the threads a profiled request runs on (app/core/profiling.py)
+    thread_token = profiling.enter_thread()
+    current = tracer.start_span(name, **attributes)
+    token = _current_span.set(current) if current is not NOOP_SPAN else None
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+        current.end()
+        profiling.exit_thread(thread_token)
+
+def traced(name: str):
+    """Decorator form of `span`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def wrap(func):
+    """
+    Binds `func` to the current context, for executors that don't copy it
+    (ThreadPoolExecutor.submit, threading.Thread). run_in_threadpool already does.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+@contextmanager
+def extract(carrier: dict):
+    """Continues the trace of an incoming W3C traceparent header in this context."""
+    match = TRACEPARENT_RE.match((carrier or {}).get("traceparent", ""))
+    token = _remote_parent.set((match.group(1), match.group(2))) if match else None
+    try:
+        yield
+    finally:
+        if token is not None:
+            _remote_parent.reset(token)
+
+class LangChainTracingHandler(BaseCallbackHandler):
+    """
+    Turns LangChain runs into spans, so the condense-question call, the
+    retriever and the answer generation inside ConversationalRetrievalChain
+    show up separately, with token usage on the LLM spans.
+    """
+
+    def __init__(self):
+        self._spans = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, parent_run_id, name: str, **attributes):
+        with self._lock:
+            parent = self._spans.get(parent_run_id)
+        started = tracer.start_span(name, parent=parent, **attributes)
+        if started is not NOOP_SPAN:
+            with self._lock:
+                self._spans[run_id] = started
+
+    def _end(self, run_id, error: BaseException = None, **attributes):
+        with self._lock:
+            started = self._spans.pop(run_id, None)
+        if started is not None:
+            started.set_attributes(**attributes)
+            if error is not None:
+                started.record_error(error)
+            started.end()
+
+    @staticmethod
+    def _name(serialized, kind: str, kwargs) -> str:
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        if not name and (serialized or {}).get("id"):
+            name = serialized["id"][-1]
+        return f"langchain.{kind}.{name or 'run'}"
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, "chain", kwargs))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, "retriever", kwargs))
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, "llm", kwargs))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, self._name(serialized, "llm", kwargs))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or {}
+        self._end(
+            run_id,
+            model=output.get("model_name"),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            total_tokens=usage.get("total_tokens"),
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+langchain_handler = LangChainTracingHandler()
+
+class TracingMiddleware:
+    """
+    Root span per HTTP request. Continues an incoming `traceparent` header and
+    returns the trace id in `X-Trace-Id` so a slow call can be looked up.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {}
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                carrier["traceparent"] = value.decode("latin-1")
+
+        with extract(carrier):
+            with span(f"{scope['method']} {scope['path']}", **{"http.method": scope["method"]}) as root:
+                async def send_wrapper(message):
+                    if message["type"] == "http.response.body" and not message.get("more_body"):
+                        # Background tasks run after this and still count towards the span
+                        root.set_attribute("http.response_sent_ms", round(root.duration_seconds * 1000, 3) if root.trace_id else None)
+                    if message["type"] == "http.response.start":
+                        root.set_attribute("http.status_code", message["status"])
+                        if root.trace_id:
+                            headers = list(message.get("headers", []))
+                            headers.append((b"x-trace-id", root.trace_id.encode()))
+                            message = dict(message, headers=headers)
+                    await send(message)
+
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    route = scope.get("route")
+                    if route is not None and root is not NOOP_SPAN:
+                        # Low-cardinality name (template instead of the raw path)
+                        root.name = f"{scope['method']} {route.path}"
+                        root.set_attribute("http.route", route.path)
+                    collection = (scope.get("state") or {}).get("collection")
+                    root.set_attribute("nexus.collection", collection)
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Response
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from app.api import ingest
 from app.api import chat
@@ -6,30 +7,96 @@ from app.api import status as status_api
 from app.api import documents
 from app.api import admin
 from app.api import evaluation
+from app.api import usage
+from app.api import search
 from app.core.auth_simple import verify_api_key
+from app.core.config import settings
+from app.core import metrics, tracing, profiling, logs
+from app.core.database import init_db, close_db
+from app.core.tasks import scheduler
+from app.services.rate_limiter import rate_limiter
+from app.services.lead_outbox import lead_outbox
+from app.services.token_accounting import token_usage
+from app.services.warmup import slot_warmup
+from app.services.collection_memory import collection_memory
+from app.services.slot_router import slot_router
+from app.services import vector_store
+from app.services.rag_service import CHROMA_DB_DIR
 
 load_dotenv()
+logs.configure_logging()
 
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: 
-    # removed init_db() as we are now pure RAG
+    # Startup: embedded Chroma allows one process per store (multi-worker needs VECTOR_STORE_MODE=server)
+    if not vector_store.server_mode():
+        vector_store.acquire_embedded_lock(CHROMA_DB_DIR)
+    # Open the shared SQLite pool (backs rate limiting and encrypted chat storage)
+    await init_db()
+    await rate_limiter.start()
+    lead_outbox.start()
+    token_usage.start()
+    slot_router.start()
+    # Disabled: per-process jobs (cache eviction) still run in this worker
+    scheduler.start(per_process_only=not settings.SCHEDULER_ENABLED)
+    # Warm the slots in the background; /readyz flips once it is done
+    slot_warmup.start()
+    collection_memory.start()
     yield
-    # Shutdown: Clean up if needed (nothing for now)
+    # Shutdown: leave the load balancer first, stop jobs, then flush pending usage logs so quotas survive restarts
+    await slot_warmup.stop()
+    await collection_memory.stop()
+    await scheduler.stop()
+    await lead_outbox.stop()
+    await rate_limiter.stop()
+    await token_usage.stop()
+    await slot_router.stop()
+    await close_db()
+    logs.shutdown_logging()
 
 app = FastAPI(title="NEXUS RAG API", version="1.0.0", lifespan=lifespan)
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
+# Outermost, so the root span covers the other middlewares too
+app.add_middleware(tracing.TracingMiddleware)
+# Correlation id for every log line of the request (including the tracing/metrics ones)
+app.add_middleware(logs.RequestIdMiddleware)
+
 # Include routers with global security dependency
 app.include_router(ingest.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
 app.include_router(chat.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
 app.include_router(status_api.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
 app.include_router(documents.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
 app.include_router(admin.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
-app.include_router(evaluation.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
+if settings.EVALUATION_ENABLED:
+    app.include_router(evaluation.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
+app.include_router(usage.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
+app.include_router(search.router, prefix="/api/v1", dependencies=[Depends(verify_api_key)])
 
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to NEXUS API. Systems Online."}
+
+@app.get("/livez", include_in_schema=False)
+async def liveness():
+    # The event loop answers: the process is alive (warm or not)
+    return {"status": "alive"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    # Only warm instances receive traffic (503 while warming up or shutting down)
+    status = slot_warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # Prometheus scrape target. Async on purpose: the threadpool gauges are read on the event loop.
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    body, content_type = metrics.render_latest()
+    return Response(content=body, media_type=content_type)
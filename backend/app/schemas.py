@@ -12,6 +12,21 @@ class UniversalLead(BaseModel):
     summary_note: str = Field(description="Resumen comercial de 1 frase (Max 15 palabras) con lo esencial para la venta.")
     urgency_level: Literal["High", "Medium", "Low"] = Field(description="Nivel de urgencia detectado en el lenguaje del usuario.")
 
+class AnswerWithLead(BaseModel):
+    """
+    Respuesta RAG + lead en una sola llamada estructurada (modo 'fused').
+    """
+    answer: str = Field(description="Respuesta a la pregunta del usuario, basada únicamente en el contexto proporcionado.")
+    lead: UniversalLead = Field(description="Datos de lead extraídos del mensaje del usuario y de la respuesta.")
+
+class BatchedLead(UniversalLead):
+    """UniversalLead de una conversación concreta dentro de un lote (modo 'deferred')."""
+    conversation_id: int = Field(description="ID de la conversación analizada, tal y como aparece en la entrada.")
+
+class LeadBatch(BaseModel):
+    """Resultado de extraer leads de varias conversaciones en una sola llamada."""
+    leads: List[BatchedLead] = Field(description="Un elemento por cada conversación recibida.")
+
 class ChatRequest(BaseModel):
     message: str
     collection_name: Optional[str] = "nexus_slot_1"
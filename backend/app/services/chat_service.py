@@ -1,103 +1,413 @@
 import os
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_openai import ChatOpenAI
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferWindowMemory
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from app.schemas import UniversalLead
+from langchain_core.retrievers import BaseRetriever
+from app.core.config import settings
+from app.core import metrics, tracing
+from app.services import token_accounting
+from app.services.token_accounting import AccountedEmbeddings
+from app.services.collection_memory import collection_memory
+from app.services.numpy_store import NumpyCollection
+from app.services import sharding, vector_store
+from app.services.slot_router import slot_router, AUTO_COLLECTION
+from app.schemas import UniversalLead, AnswerWithLead, LeadBatch
 
 # Configuration
 CHROMA_DB_DIR = "/app/chroma_db"
-from app.services.rag_service import DEFAULT_COLLECTION_NAME
+# Lead extraction strategies (when business_context is set)
+LEAD_MODE_SEPARATE = "separate"  # RAG chain, then a second extraction call
+LEAD_MODE_FUSED = "fused"        # one structured-output call returns answer + lead
+LEAD_MODE_DEFERRED = "deferred"  # answer now, extraction queued to the lead outbox worker
+# Chunks retrieved per question
+RETRIEVAL_K = 6
+from app.services.rag_service import DEFAULT_COLLECTION_NAME, get_slot_config
 
-def get_answer(query: str, collection_name: str = DEFAULT_COLLECTION_NAME, history: list = [], business_context: str = None):
+logger = logging.getLogger(__name__)
+
+# Every LangChain run reports to the metrics and the tracer
+CALLBACKS = [metrics.langchain_handler, tracing.langchain_handler, token_accounting.langchain_handler]
+
+def _run_config(stage: str = None) -> dict:
+    """RunnableConfig for `.invoke(..., config=...)`, optionally tagged with a metrics stage."""
+    config = {"callbacks": CALLBACKS}
+    if stage:
+        config["tags"] = [stage]
+    return config
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+def get_embeddings():
+    """
+    Process-wide embeddings client for retrieval: its HTTP connection pool
+    (and the TLS handshake with the API) is reused across requests and can be
+    warmed up at startup.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                _embeddings = AccountedEmbeddings()
+    return _embeddings
+
+def get_vector_db(collection_name: str, embeddings=None):
+    """
+    Vector store handle used for retrieval. Built per request, like every
+    other Chroma(...) in the app (benchmarks/bench_retrieval.py measures it).
+    """
+    # chromadb keeps one client per persist directory (or per worker for the
+    # gateway); a miss means opening the store
+    cached = vector_store.client_cached(CHROMA_DB_DIR)
+    metrics.record_cache("vector_store_client", cached)
+    with tracing.span("chroma.open", collection=collection_name, client_cached=cached):
+        vector_db = vector_store.open_store(collection_name, embeddings or get_embeddings(), CHROMA_DB_DIR)
+    # LRU bookkeeping for the memory budget (app/services/collection_memory.py), per shard
+    # (numpy engine slots are plain memory maps the OS pages in and out)
+    for collection in sharding.physical_collections(vector_db._collection):
+        if not isinstance(collection, NumpyCollection):
+            collection_memory.touch(collection.name, collection.id)
+    return vector_db
+
+def get_retriever(vector_db, k: int = RETRIEVAL_K):
+    return vector_db.as_retriever(search_kwargs={"k": k})
+
+# --- FEDERATED SEARCH (several slots, one query) ---
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+def _get_search_executor() -> ThreadPoolExecutor:
+    # Own pool: slot lookups may in turn wait on shard calls (app/services/sharding.py)
+    global _search_executor
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(
+                    max_workers=settings.FEDERATED_SEARCH_WORKERS, thread_name_prefix="federated"
+                )
+    return _search_executor
+
+def resolve_collections(collection_names: List[str]) -> List[str]:
+    """Validated, de-duplicated slot list of a federated request. Raises ValueError."""
+    names = list(dict.fromkeys(name for name in collection_names if name))
+    if not names:
+        raise ValueError("collection_names cannot be empty")
+    if len(names) > settings.FEDERATED_MAX_SLOTS:
+        raise ValueError(f"At most {settings.FEDERATED_MAX_SLOTS} slots per request")
+    if any(".." in name for name in names):
+        raise ValueError("Invalid collection name")
+    return names
+
+def _similarity(distance: float, space: str) -> float:
+    """
+    Chroma distance -> cosine similarity, so scores of different collections
+    are comparable (OpenAI embeddings are unit length: squared L2 = 2 - 2cos).
+    """
+    if space == "l2":
+        return 1.0 - distance / 2.0
+    return 1.0 - distance  # "cosine" and "ip" are 1 - similarity
+
+def _search_slot(collection_name: str, embedding: list, k: int) -> list:
+    collection = get_vector_db(collection_name)._collection
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    result = collection.query(query_embeddings=[embedding], n_results=k, include=["documents", "metadatas", "distances"])
+    return [
+        (_similarity(distance, space), collection_name, text, metadata or {})
+        for text, metadata, distance in zip(result["documents"][0], result["metadatas"][0], result["distances"][0])
+    ]
+
+@tracing.traced("chat.federated_search")
+def federated_search(query: str, collection_names: List[str], k: int = RETRIEVAL_K, embedding: list = None) -> List[Document]:
+    """
+    Top-k chunks across several slots: the query is embedded once (unless
+    `embedding` is given), every slot is searched concurrently with that
+    vector and the hits are merged by similarity. Each chunk's metadata
+    carries its `slot` and `score`. A slot that fails is skipped (logged)
+    unless all of them do.
+    """
+    tracing.current_span().set_attributes(slots=len(collection_names), k=k)
+    if embedding is None:
+        embedding = get_embeddings().embed_query(query)
+    executor = _get_search_executor()
+    futures = [
+        executor.submit(tracing.wrap(functools.partial(_search_slot, name, embedding, k)))
+        for name in collection_names
+    ]
+    hits, errors = [], []
+    for name, future in zip(collection_names, futures):
+        try:
+            hits.extend(future.result())
+        except Exception as e:
+            logger.warning(f"Federated search: slot {name} failed: {e}")
+            errors.append(e)
+    if errors and len(errors) == len(collection_names):
+        raise errors[0]
+    hits.sort(key=lambda hit: hit[0], reverse=True)
+    return [
+        Document(page_content=text, metadata={**metadata, "slot": slot, "score": round(score, 4)})
+        for score, slot, text, metadata in hits[:k]
+    ]
+
+@tracing.traced("chat.auto_search")
+def auto_search(query: str, k: int = RETRIEVAL_K, top_n: int = None) -> Tuple[List[Document], List[dict]]:
+    """
+    collection_name="auto": routes the query embedding to the most likely
+    slots (slot_router) and searches them with that same vector. Returns the
+    chunks and the routing decision. Without routing data yet, falls back to
+    the slots in slots.json.
+    """
+    embedding = get_embeddings().embed_query(query)
+    routed = slot_router.route(embedding, top_n)
+    tracing.current_span().set_attributes(routed=",".join(r["collection"] for r in routed))
+    if routed:
+        collection_names = [r["collection"] for r in routed]
+    else:
+        collection_names = list(get_slot_config().keys())[:settings.FEDERATED_MAX_SLOTS]
+        logger.warning("Auto routing has no slot centroids yet, searching every configured slot")
+    return federated_search(query, collection_names, k, embedding=embedding), routed
+
+class FederatedRetriever(BaseRetriever):
+    """federated_search (or auto_search, without collection_names) as a LangChain retriever."""
+    collection_names: List[str] = []
+    k: int = RETRIEVAL_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        if not self.collection_names:
+            return auto_search(query, self.k)[0]
+        return federated_search(query, self.collection_names, self.k)
+
+def build_chat_history(history: list, summary: str = None) -> list:
+    """
+    Turns stored exchanges into chat messages for the chain:
+    the rolling summary (if any) followed by the last SESSION_WINDOW_TURNS exchanges.
+    """
+    messages = []
+    if summary:
+        messages.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+    for exchange in history[-settings.SESSION_WINDOW_TURNS:]:
+        if "user" in exchange and "assistant" in exchange:
+            messages.append(HumanMessage(content=exchange["user"]))
+            messages.append(AIMessage(content=exchange["assistant"]))
+    return messages
+
+@tracing.traced("chat.summarize")
+def summarize_conversation(previous_summary: str, exchanges: list) -> str:
+    """
+    Folds `exchanges` into the running summary (incremental: the old turns are
+    never re-sent once summarized).
+    """
+    transcript = "\n".join(f"User: {e['user']}\nAssistant: {e['assistant']}" for e in exchanges)
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+    prompt = ChatPromptTemplate.from_messages([
+        ("system",
+         "Progressively summarize the conversation. Extend the current summary with the new lines "
+         "and return a new summary of at most 120 words. Keep names, contact details, products and "
+         "open questions. Answer in the language of the conversation."),
+        ("human", "Current summary:\n{summary}\n\nNew lines:\n{transcript}")
+    ])
+    with token_accounting.usage_scope(operation=token_accounting.OP_SUMMARY):
+        result = (prompt | llm).invoke(
+            {"summary": previous_summary or "(empty)", "transcript": transcript},
+            config=_run_config(metrics.STAGE_SUMMARIZATION)
+        )
+    return result.content.strip()
+
+@tracing.traced("chat.extract_lead")
+def extract_lead(query: str, answer: str, business_context: str):
+    """
+    Second LLM call ('separate' mode): classifies the last exchange as a lead.
+    Returns a UniversalLead or None (extraction never fails the chat request).
+    """
+    try:
+        # Prepare a focused extraction prompt
+        # We analyze the LAST interaction (query + answer) mainly, 
+        # but might need history if provided. 
+        extraction_llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+        structured_llm = extraction_llm.with_structured_output(UniversalLead)
+        
+        system_prompt = f"""
+        You are a Lead Extraction Expert for a business.
+        
+        BUSINESS CONTEXT INSTRUCTIONS:
+        "{business_context}"
+        
+        Analyze the user's latest message and the assistant's reply to determine if this is a lead.
+        Extract the data into the JSON structure provided.
+        If the user is just asking general info without clear intent, set 'is_lead' to False.
+        """
+        
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "{system_prompt}"),
+            ("human", "User Query: {query}\nAssistant Reply: {answer}")
+        ])
+        
+        chain = prompt | structured_llm
+        with token_accounting.usage_scope(operation=token_accounting.OP_LEAD_EXTRACTION):
+            return chain.invoke(
+                {"system_prompt": system_prompt, "query": query, "answer": answer},
+                config=_run_config(metrics.STAGE_LEAD_EXTRACTION)
+            )
+        
+    except Exception as e:
+        logger.warning(f"Lead extraction failed: {e}")
+        # We do not fail the main request if extraction fails
+        return None
+
+@tracing.traced("chat.extract_leads_batch")
+def extract_leads_batch(conversations: list, business_context: str) -> dict:
+    """
+    Extracts leads for several conversations (same business_context) in ONE call.
+    conversations: [{"id", "query", "answer"}]. Returns {id: UniversalLead}.
+    Raises on LLM errors so the caller can retry; ids the model skipped are
+    extracted one by one.
+    """
+    system_prompt = f"""
+    You are a Lead Extraction Expert for a business.
+    
+    BUSINESS CONTEXT INSTRUCTIONS:
+    "{business_context}"
+    
+    You will receive several independent conversations, each with its ID.
+    For EACH conversation, analyze the user's message and the assistant's reply to determine if it is a lead,
+    and return one entry with the same conversation_id.
+    If the user is just asking general info without clear intent, set 'is_lead' to False.
+    """
+    tracing.current_span().set_attribute("conversations", len(conversations))
+    transcript = "\n\n".join(
+        f"Conversation {c['id']}:\nUser Query: {c['query']}\nAssistant Reply: {c['answer']}"
+        for c in conversations
+    )
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "{system_prompt}"),
+        ("human", "{transcript}")
+    ])
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0).with_structured_output(LeadBatch)
+    with token_accounting.usage_scope(operation=token_accounting.OP_LEAD_EXTRACTION):
+        batch = (prompt | llm).invoke(
+            {"system_prompt": system_prompt, "transcript": transcript},
+            config=_run_config(metrics.STAGE_LEAD_EXTRACTION)
+        )
+
+    expected = {c["id"] for c in conversations}
+    leads = {}
+    for lead in batch.leads:
+        if lead.conversation_id in expected:
+            leads[lead.conversation_id] = UniversalLead(**lead.dict(exclude={"conversation_id"}))
+
+    for c in conversations:
+        if c["id"] not in leads:
+            lead = extract_lead(c["query"], c["answer"], business_context)
+            if lead is not None:
+                leads[c["id"]] = lead
+    return leads
+
+def _format_history(chat_history: list) -> str:
+    roles = {"human": "User", "ai": "Assistant", "system": "Memory"}
+    return "\n".join(f"{roles.get(m.type, m.type)}: {m.content}" for m in chat_history) or "(none)"
+
+@tracing.traced("chat.answer_with_lead")
+def _answer_with_lead(retriever, query: str, chat_history: list, business_context: str):
+    """
+    'fused' mode: retrieval + ONE structured-output call that returns the grounded
+    answer and the UniversalLead fields together (no condense-question call,
+    no second extraction call).
+    """
+    docs = retriever.get_relevant_documents(query, callbacks=CALLBACKS)
+    context = "\n\n".join(doc.page_content for doc in docs)
+
+    system_prompt = f"""
+    You are NEXUS, a knowledge assistant. Answer the user's question using ONLY the context below.
+    If the answer is not in the context, say you don't know. Answer in the user's language.
+
+    At the same time, act as a Lead Extraction Expert for the business.
+    BUSINESS CONTEXT INSTRUCTIONS:
+    "{business_context}"
+    Fill 'lead' from the user's latest message and your answer.
+    If the user is just asking general info without clear intent, set 'is_lead' to False.
+    """
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "{system_prompt}"),
+        ("human", "Conversation so far:\n{history}\n\nContext:\n{context}\n\nQuestion: {question}")
+    ])
+    llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0).with_structured_output(AnswerWithLead)
+    result = (prompt | llm).invoke({
+        "system_prompt": system_prompt,
+        "history": _format_history(chat_history),
+        "context": context,
+        "question": query,
+    }, config=_run_config())
+
+    sources = [{"text": doc.page_content, "metadata": doc.metadata} for doc in docs]
+    return result.answer, sources, result.lead
+
+@tracing.traced("chat.get_answer")
+def get_answer(query: str, collection_name: str = DEFAULT_COLLECTION_NAME, history: list = [], business_context: str = None, summary: str = None, lead_mode: str = LEAD_MODE_SEPARATE, collection_names: List[str] = None):
     """
     1. Embeds the query.
-    2. Searches ChromaDB for relevant chunks.
-    3. Sends chunks + query + history to LLM for Answer.
+    2. Searches ChromaDB for relevant chunks (across every slot in
+       `collection_names` when given: see federated_search).
+    3. Sends chunks + query + history (rolling summary + last turns) to LLM for Answer.
     4. (Parallel/Post) Sends context to LLM for Lead Extraction.
+       With lead_mode='fused', steps 3 and 4 are a single structured-output call.
     5. Returns answer + sources + lead_data.
     """
+    tracing.current_span().set_attributes(
+        collection=",".join(collection_names) if collection_names else collection_name, lead_mode=lead_mode, history_turns=len(history), has_summary=bool(summary)
+    )
     try:
-        # 1. Initialize Vector DB Connection
-        embeddings = OpenAIEmbeddings()
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR,
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
+        # 1. Initialize Vector DB Connection (or the federated retriever over several / routed slots)
+        if collection_names:
+            retriever = FederatedRetriever(collection_names=collection_names)
+        elif collection_name == AUTO_COLLECTION:
+            retriever = FederatedRetriever()
+        else:
+            retriever = get_retriever(get_vector_db(collection_name))
+
+        # 2. Conversation context (sliding window + summary of older turns)
+        chat_history = build_chat_history(history, summary)
 
-        # 2. Initialize LLM (The Brain)
+        if business_context and lead_mode == LEAD_MODE_FUSED:
+            answer, sources, lead_data = _answer_with_lead(retriever, query, chat_history, business_context)
+            tracing.current_span().set_attributes(sources=len(sources), is_lead=bool(lead_data and lead_data.is_lead))
+            return {
+                "answer": answer,
+                "sources": sources,
+                "lead_data": lead_data
+            }
+
+        # 3. Initialize LLM (The Brain)
         llm_chat = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-        
-        # 3. Initialize Memory
-        memory = ConversationBufferWindowMemory(
-            memory_key="chat_history", 
-            return_messages=True, 
-            k=5,
-            output_key="answer"
-        )
-        
-        # Reconstruct Memory from History
-        for exchange in history:
-            if "user" in exchange and "assistant" in exchange:
-                memory.save_context(
-                    {"input": exchange["user"]}, 
-                    {"answer": exchange["assistant"]}
-                )
 
         # 4. RAG Chain for Answer
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=llm_chat,
-            retriever=vector_db.as_retriever(search_kwargs={"k": 6}),
-            memory=memory,
+            retriever=retriever,
             return_source_documents=True,
             output_key="answer"
         )
 
         # 5. Ask the question (RAG)
-        result = qa_chain({"question": query})
+        result = qa_chain({"question": query, "chat_history": chat_history}, callbacks=CALLBACKS)
         answer = result["answer"]
         sources = [{"text": doc.page_content, "metadata": doc.metadata} for doc in result["source_documents"]]
 
         # 6. Extract Lead Data (Multi-Tenant / Business Agnostic)
         lead_data = None
         if business_context:
-            try:
-                # Prepare a focused extraction prompt
-                # We analyze the LAST interaction (query + answer) mainly, 
-                # but might need history if provided. 
-                extraction_llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-                structured_llm = extraction_llm.with_structured_output(UniversalLead)
-                
-                system_prompt = f"""
-                You are a Lead Extraction Expert for a business.
-                
-                BUSINESS CONTEXT INSTRUCTIONS:
-                "{business_context}"
-                
-                Analyze the user's latest message and the assistant's reply to determine if this is a lead.
-                Extract the data into the JSON structure provided.
-                If the user is just asking general info without clear intent, set 'is_lead' to False.
-                """
-                
-                prompt = ChatPromptTemplate.from_messages([
-                    ("system", system_prompt),
-                    ("human", f"User Query: {query}\nAssistant Reply: {answer}")
-                ])
-                
-                chain = prompt | structured_llm
-                lead_data = chain.invoke({})
-                
-            except Exception as e:
-                print(f"Lead extraction failed: {e}")
-                # We do not fail the main request if extraction fails
-                lead_data = None
+            lead_data = extract_lead(query, answer, business_context)
+        tracing.current_span().set_attributes(sources=len(sources), is_lead=bool(lead_data and lead_data.is_lead))
 
         return {
             "answer": answer,
@@ -106,5 +416,5 @@ def get_answer(query: str, collection_name: str = DEFAULT_COLLECTION_NAME, histo
         }
 
     except Exception as e:
-        print(f"Error generating answer: {e}")
-        raise e
\ No newline at end of file
+        logger.exception(f"Error generating answer: {e}")
+        raise e
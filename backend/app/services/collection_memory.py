@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from chromadb.api.client import SharedSystemClient
+from chromadb.segment import SegmentManager
+from chromadb.types import SegmentScope
+from chromadb.utils.read_write_lock import WriteRWLock
+from starlette.concurrency import run_in_threadpool
+
+from app.core import metrics
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DB_DIR = "/app/chroma_db"
+# Python-side bookkeeping per vector (three id maps with string keys)
+ID_MAP_BYTES_PER_VECTOR = 200
+
+def estimate_index_bytes(instance) -> int:
+    """
+    Approximate resident size of a loaded HNSW segment: the hnswlib graph is
+    allocated for its capacity (max_elements), not its count, plus the id maps
+    and the brute-force buffer of not yet indexed vectors.
+    """
+    index = getattr(instance, "_index", None)
+    dim = getattr(instance, "_dimensionality", None) or 0
+    if index is None or not dim:
+        return 0
+    M = getattr(instance._params, "M", 16)
+    capacity = getattr(index, "max_elements", None) or len(instance._id_to_label)
+    # vector + level-0 links (2*M) + link count + label; upper levels add ~1/M of that
+    per_element = dim * 4 + (2 * M + 1) * 4 + 8
+    per_element += (M * 4 + 4) // max(M - 1, 1)
+    batch_size = getattr(instance._params, "batch_size", 0)
+    return capacity * per_element + len(instance._id_to_label) * ID_MAP_BYTES_PER_VECTOR + batch_size * dim * 4
+
+class CollectionMemoryManager:
+    """
+    Keeps the HNSW indexes loaded by the embedded Chroma under a memory budget.
+    Every retrieval touches its collection (LRU order); a background check
+    unloads the least recently used collections idle for at least
+    COLLECTION_IDLE_SECONDS while the estimated total is over
+    COLLECTION_MEMORY_BUDGET_MB. An evicted collection is reloaded from disk by
+    Chroma on its next access (same path as after a restart: the persisted
+    index plus a replay of its pending writes).
+    """
+
+    def __init__(self, budget_mb: float, idle_seconds: float, check_interval: float):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        self._last_access: Dict[str, float] = {}   # collection id -> monotonic time
+        self._names: Dict[str, str] = {}            # collection id -> name
+        self._evicted = set()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.evictions = 0
+        self.reloads = 0
+        self.evicted_bytes = 0
+        self.last_check = None
+
+    def _segment_manager(self):
+        system = SharedSystemClient._identifer_to_system.get(CHROMA_DB_DIR)
+        if system is None:
+            return None
+        manager = system.instance(SegmentManager)
+        # Only the local (embedded) segment manager keeps indexes in this process
+        return manager if hasattr(manager, "_instances") and hasattr(manager, "_segment_cache") else None
+
+    def _vector_instance(self, manager, collection_id):
+        segment = manager._segment_cache.get(collection_id, {}).get(SegmentScope.VECTOR)
+        if segment is None:
+            return None, None
+        return segment, manager._instances.get(segment["id"])
+
+    def touch(self, collection_name: str, collection_id):
+        """Called on every retrieval. Also counts index cache hits/misses."""
+        key = str(collection_id)
+        manager = self._segment_manager()
+        if manager is not None:
+            _, instance = self._vector_instance(manager, collection_id)
+            metrics.record_cache("collection_index", instance is not None)
+        with self._lock:
+            self._last_access[key] = time.monotonic()
+            self._names[key] = collection_name
+            if key in self._evicted:
+                self._evicted.discard(key)
+                self.reloads += 1
+
+    def resident(self) -> list:
+        """Loaded vector indexes, least recently used first."""
+        manager = self._segment_manager()
+        if manager is None:
+            return []
+        now = time.monotonic()
+        collections = []
+        for collection_id in list(manager._segment_cache.keys()):
+            segment, instance = self._vector_instance(manager, collection_id)
+            if instance is None:
+                continue
+            key = str(collection_id)
+            with self._lock:
+                # Loaded by a path that does not touch (ingest, export...): idle from now on
+                last_access = self._last_access.setdefault(key, now)
+                name = self._names.get(key, key)
+            collections.append({
+                "collection_id": collection_id,
+                "name": name,
+                "vectors": len(getattr(instance, "_id_to_label", {})),
+                "estimated_bytes": estimate_index_bytes(instance),
+                "idle_seconds": round(now - last_access, 1),
+            })
+        return sorted(collections, key=lambda c: c["idle_seconds"], reverse=True)
+
+    def evict(self, collection_id) -> int:
+        """Unloads the collection's vector index. Returns the estimated bytes freed."""
+        manager = self._segment_manager()
+        if manager is None:
+            return 0
+        segment, instance = self._vector_instance(manager, collection_id)
+        if instance is None:
+            return 0
+        freed = estimate_index_bytes(instance)
+        # Wait for in-flight queries/writes on this index, then detach it from the
+        # manager so the next access builds a fresh instance from disk
+        with WriteRWLock(instance._lock):
+            with manager._lock:
+                if manager._instances.get(segment["id"]) is not instance:
+                    return 0
+                instance.stop()
+                manager._instances.pop(segment["id"], None)
+                manager._segment_cache.get(collection_id, {}).pop(SegmentScope.VECTOR, None)
+                file_handles = getattr(manager, "_vector_instances_file_handle_cache", None)
+                if file_handles is not None:
+                    file_handles.cache.pop(collection_id, None)
+            if hasattr(instance, "close_persistent_index"):
+                instance.close_persistent_index()
+        key = str(collection_id)
+        with self._lock:
+            self._evicted.add(key)
+            self.evictions += 1
+            self.evicted_bytes += freed
+        metrics.COLLECTION_EVICTIONS.inc()
+        return freed
+
+    def enforce(self) -> dict:
+        """Evicts idle collections (LRU first) until the estimate is under budget."""
+        collections = self.resident()
+        total = sum(c["estimated_bytes"] for c in collections)
+        evicted = []
+        if self.budget_bytes > 0 and total > self.budget_bytes:
+            for collection in collections:
+                if total <= self.budget_bytes:
+                    break
+                if collection["idle_seconds"] < self.idle_seconds:
+                    # Sorted by idle time: everything after this one is busier
+                    break
+                try:
+                    freed = self.evict(collection["collection_id"])
+                except Exception as e:
+                    logger.warning(f"Could not unload collection {collection['name']}: {e}")
+                    continue
+                if freed or collection["estimated_bytes"] == 0:
+                    total -= collection["estimated_bytes"]
+                    evicted.append(collection["name"])
+            if evicted:
+                logger.info(f"Unloaded {len(evicted)} idle collections", extra={"collections": evicted, "resident_bytes": total})
+            elif total > self.budget_bytes:
+                logger.warning(
+                    f"Collection memory over budget ({total / 1048576:.0f} MB > {self.budget_bytes / 1048576:.0f} MB) "
+                    f"but nothing has been idle for {self.idle_seconds}s"
+                )
+        metrics.COLLECTIONS_RESIDENT.set(len(collections) - len(evicted))
+        metrics.COLLECTION_MEMORY_BYTES.set(total)
+        self.last_check = time.time()
+        return {"evicted": evicted, "resident_bytes": total}
+
+    def stats(self) -> dict:
+        collections = self.resident()
+        for collection in collections:
+            collection["collection_id"] = str(collection["collection_id"])
+        return {
+            "budget_bytes": self.budget_bytes,
+            "idle_seconds": self.idle_seconds,
+            "resident_collections": len(collections),
+            "resident_bytes": sum(c["estimated_bytes"] for c in collections),
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+            "evicted_bytes": self.evicted_bytes,
+            "last_check": self.last_check,
+            "collections": collections,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await run_in_threadpool(self.enforce)
+            except Exception as e:
+                logger.error(f"Collection memory check failed: {e}")
+
+    def start(self):
+        if self._task is None and self.budget_bytes > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+collection_memory = CollectionMemoryManager(
+    budget_mb=settings.COLLECTION_MEMORY_BUDGET_MB,
+    idle_seconds=settings.COLLECTION_IDLE_SECONDS,
+    check_interval=settings.COLLECTION_MEMORY_CHECK_SECONDS,
+)
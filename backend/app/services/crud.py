@@ -1,27 +1,51 @@
 import aiosqlite
 from datetime import datetime
 
+# NOTE: Write helpers do not commit. They run on the shared writer connection
+# through `pool.run_write(...)`, which group-commits concurrent writes.
+
 async def create_chat_session(db: aiosqlite.Connection, session_id: str, role: str, encrypted_content: bytes):
     """Inserts a new chat message/session record."""
     await db.execute(
         "INSERT INTO chat_sessions (session_id, role, content_encrypted) VALUES (?, ?, ?)",
         (session_id, role, encrypted_content)
     )
-    await db.commit()
 
 async def get_chat_history(db: aiosqlite.Connection, session_id: str):
-    """Retrieves encrypted chat history for a session."""
-    # Ordered by creation time
+    """Retrieves encrypted chat history (id, role, content) for a session."""
+    # Ordered by creation time (served by idx_chat_sessions_session_time)
     cursor = await db.execute(
-        "SELECT role, content_encrypted FROM chat_sessions WHERE session_id = ? ORDER BY created_at ASC",
+        "SELECT id, role, content_encrypted FROM chat_sessions WHERE session_id = ? ORDER BY created_at ASC, id ASC",
         (session_id,)
     )
     return await cursor.fetchall()
 
+async def delete_chat_messages(db: aiosqlite.Connection, session_id: str, message_ids: list) -> int:
+    """Deletes specific messages of a session (used when compacting history into a summary)."""
+    if not message_ids:
+        return 0
+    placeholders = ",".join("?" for _ in message_ids)
+    cursor = await db.execute(
+        f"DELETE FROM chat_sessions WHERE session_id = ? AND id IN ({placeholders})",
+        (session_id, *message_ids)
+    )
+    return cursor.rowcount
+
 async def log_usage(db: aiosqlite.Connection, session_id: str):
     """Logs a user interaction for rate limiting purposes."""
     await db.execute("INSERT INTO usage_logs (session_id) VALUES (?)", (session_id,))
-    await db.commit()
+
+async def log_usage_batch(db: aiosqlite.Connection, rows: list):
+    """Logs many (session_id, created_at) interactions at once."""
+    await db.executemany("INSERT INTO usage_logs (session_id, created_at) VALUES (?, ?)", rows)
+
+async def get_usage_logs_since(db: aiosqlite.Connection, since_timestamp: str):
+    """Returns (session_id, created_at) for every usage log since a specific timestamp."""
+    cursor = await db.execute(
+        "SELECT session_id, created_at FROM usage_logs WHERE created_at > ? ORDER BY created_at ASC",
+        (since_timestamp,)
+    )
+    return await cursor.fetchall()
 
 async def get_usage_count_since(db: aiosqlite.Connection, session_id: str, since_timestamp: str) -> int:
     """Counts usage logs for a session since a specific timestamp."""
@@ -32,20 +56,185 @@ async def get_usage_count_since(db: aiosqlite.Connection, session_id: str, since
     row = await cursor.fetchone()
     return row[0] if row else 0
 
-async def delete_old_chat_sessions(db: aiosqlite.Connection, before_timestamp: str) -> int:
-    """Deletes chat sessions older than the given timestamp."""
+async def delete_old_chat_sessions(db: aiosqlite.Connection, before_timestamp: str, limit: int) -> int:
+    """Deletes up to `limit` chat sessions older than the given timestamp."""
     cursor = await db.execute(
-        "DELETE FROM chat_sessions WHERE created_at < ?",
-        (before_timestamp,)
+        "DELETE FROM chat_sessions WHERE id IN (SELECT id FROM chat_sessions WHERE created_at < ? LIMIT ?)",
+        (before_timestamp, limit)
     )
-    await db.commit()
     return cursor.rowcount
 
-async def delete_old_usage_logs(db: aiosqlite.Connection, before_timestamp: str) -> int:
-    """Deletes usage logs older than the given timestamp."""
+async def delete_old_usage_logs(db: aiosqlite.Connection, before_timestamp: str, limit: int) -> int:
+    """Deletes up to `limit` usage logs older than the given timestamp."""
     cursor = await db.execute(
-        "DELETE FROM usage_logs WHERE created_at < ?",
-        (before_timestamp,)
+        "DELETE FROM usage_logs WHERE id IN (SELECT id FROM usage_logs WHERE created_at < ? LIMIT ?)",
+        (before_timestamp, limit)
     )
-    await db.commit()
     return cursor.rowcount
+
+# --- LEAD OUTBOX ---
+async def enqueue_lead(db: aiosqlite.Connection, stage: str, payload_encrypted: bytes) -> int:
+    """Adds a conversation to the lead outbox. Returns its id."""
+    cursor = await db.execute(
+        "INSERT INTO lead_outbox (stage, payload_encrypted) VALUES (?, ?)",
+        (stage, payload_encrypted)
+    )
+    return cursor.lastrowid
+
+async def claim_leads(db: aiosqlite.Connection, stage: str, token: str, now: float, lease_cutoff: float, limit: int) -> int:
+    """
+    Atomically claims up to `limit` due items of a stage (single UPDATE, so two
+    workers never claim the same row). Claims older than `lease_cutoff` are
+    considered abandoned and can be re-claimed.
+    """
+    cursor = await db.execute(
+        """
+        UPDATE lead_outbox SET claim_token = ?, claimed_at = ?
+        WHERE id IN (
+            SELECT id FROM lead_outbox
+            WHERE stage = ? AND next_attempt_at <= ? AND (claim_token IS NULL OR claimed_at < ?)
+            ORDER BY id LIMIT ?
+        )
+        """,
+        (token, now, stage, now, lease_cutoff, limit)
+    )
+    return cursor.rowcount
+
+async def get_claimed_leads(db: aiosqlite.Connection, token: str):
+    """Returns (id, payload_encrypted, attempts) for the rows claimed with `token`."""
+    cursor = await db.execute(
+        "SELECT id, payload_encrypted, attempts FROM lead_outbox WHERE claim_token = ? ORDER BY id",
+        (token,)
+    )
+    return await cursor.fetchall()
+
+async def advance_lead(db: aiosqlite.Connection, lead_id: int, stage: str, payload_encrypted: bytes):
+    """Moves an item to the next stage with its updated payload, releasing the claim."""
+    await db.execute(
+        """
+        UPDATE lead_outbox
+        SET stage = ?, payload_encrypted = ?, attempts = 0, next_attempt_at = 0,
+            claim_token = NULL, claimed_at = NULL, last_error = NULL
+        WHERE id = ?
+        """,
+        (stage, payload_encrypted, lead_id)
+    )
+
+async def retry_leads(db: aiosqlite.Connection, rows: list, dead_stage: str, max_attempts: int):
+    """
+    Releases claimed items after a failure. `rows` are (next_attempt_at, error, id).
+    Items reaching `max_attempts` are parked in `dead_stage`.
+    """
+    await db.executemany(
+        """
+        UPDATE lead_outbox
+        SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?,
+            claim_token = NULL, claimed_at = NULL,
+            stage = CASE WHEN attempts + 1 >= ? THEN ? ELSE stage END
+        WHERE id = ?
+        """,
+        [(next_attempt_at, error, max_attempts, dead_stage, lead_id) for next_attempt_at, error, lead_id in rows]
+    )
+
+async def delete_leads(db: aiosqlite.Connection, lead_ids: list) -> int:
+    if not lead_ids:
+        return 0
+    placeholders = ",".join("?" for _ in lead_ids)
+    cursor = await db.execute(f"DELETE FROM lead_outbox WHERE id IN ({placeholders})", tuple(lead_ids))
+    return cursor.rowcount
+
+async def count_leads_by_stage(db: aiosqlite.Connection) -> dict:
+    cursor = await db.execute("SELECT stage, COUNT(*) FROM lead_outbox GROUP BY stage")
+    return {stage: count for stage, count in await cursor.fetchall()}
+
+# --- TOKEN USAGE ---
+async def add_token_usage_batch(db: aiosqlite.Connection, rows: list):
+    """
+    Adds usage deltas. `rows` are (day, collection, user_hash, operation, model,
+    calls, prompt_tokens, completion_tokens, embedding_tokens, cost_usd, latency_seconds).
+    """
+    await db.executemany(
+        """
+        INSERT INTO token_usage (day, collection, user_hash, operation, model, calls, prompt_tokens,
+                                 completion_tokens, embedding_tokens, cost_usd, latency_seconds)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (day, collection, user_hash, operation, model) DO UPDATE SET
+            calls = calls + excluded.calls,
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            completion_tokens = completion_tokens + excluded.completion_tokens,
+            embedding_tokens = embedding_tokens + excluded.embedding_tokens,
+            cost_usd = cost_usd + excluded.cost_usd,
+            latency_seconds = latency_seconds + excluded.latency_seconds
+        """,
+        rows
+    )
+
+async def get_token_usage(db: aiosqlite.Connection, since_day: str, group_by: list, collection: str = None, user_hash: str = None):
+    """
+    Sums usage since `since_day` grouped by `group_by` (columns of token_usage,
+    validated by the caller), most expensive first. An empty `group_by` gives
+    one totals row, zeros when nothing matches.
+    """
+    columns = ", ".join(group_by)
+    where = ["day >= ?"]
+    params = [since_day]
+    if collection is not None:
+        where.append("collection = ?")
+        params.append(collection)
+    if user_hash is not None:
+        where.append("user_hash = ?")
+        params.append(user_hash)
+    select = f"{columns}, " if columns else ""
+    group = f"GROUP BY {columns}" if columns else ""
+    cursor = await db.execute(
+        f"""
+        SELECT {select}COALESCE(SUM(calls), 0), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(completion_tokens), 0),
+               COALESCE(SUM(embedding_tokens), 0), COALESCE(SUM(cost_usd), 0), COALESCE(SUM(latency_seconds), 0)
+        FROM token_usage WHERE {" AND ".join(where)} {group}
+        ORDER BY SUM(cost_usd) DESC
+        """,
+        tuple(params)
+    )
+    return await cursor.fetchall()
+
+async def get_slot_centroids(db: aiosqlite.Connection):
+    cursor = await db.execute(
+        "SELECT collection, code, vectors, centroid, built_vectors FROM slot_centroids ORDER BY collection, code"
+    )
+    return await cursor.fetchall()
+
+async def get_slot_centroids_version(db: aiosqlite.Connection):
+    """Changes whenever any worker wrote centroids (cheap staleness check)."""
+    cursor = await db.execute("SELECT COUNT(*), MAX(updated_at), SUM(vectors) FROM slot_centroids")
+    return await cursor.fetchone()
+
+async def replace_slot_centroids(db: aiosqlite.Connection, collection: str, rows: list, updated_at: float):
+    """Replaces every code of a slot. `rows` are (code, vectors, centroid, built_vectors)."""
+    await db.execute("DELETE FROM slot_centroids WHERE collection = ?", (collection,))
+    await db.executemany(
+        """
+        INSERT INTO slot_centroids (collection, code, vectors, centroid, built_vectors, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [(collection, code, vectors, centroid, built, updated_at) for code, vectors, centroid, built in rows]
+    )
+
+async def get_slot_centroid(db: aiosqlite.Connection, collection: str, code: int):
+    cursor = await db.execute(
+        "SELECT vectors, centroid, built_vectors FROM slot_centroids WHERE collection = ? AND code = ?",
+        (collection, code)
+    )
+    return await cursor.fetchone()
+
+async def upsert_slot_centroid(db: aiosqlite.Connection, collection: str, code: int, vectors: int,
+                               centroid: bytes, built_vectors: int, updated_at: float):
+    await db.execute(
+        """
+        INSERT OR REPLACE INTO slot_centroids (collection, code, vectors, centroid, built_vectors, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (collection, code, vectors, centroid, built_vectors, updated_at)
+    )
+
+async def delete_slot_centroid(db: aiosqlite.Connection, collection: str, code: int):
+    await db.execute("DELETE FROM slot_centroids WHERE collection = ? AND code = ?", (collection, code))
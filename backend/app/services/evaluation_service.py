@@ -1,4 +1,5 @@
 import os
+import logging
 import openai
 from datasets import Dataset
 from ragas import evaluate
@@ -12,13 +13,18 @@ from ragas.testset import TestsetGenerator
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader
 from langchain.docstore.document import Document
-from app.services.rag_service import get_all_documents, CHROMA_DB_DIR
+from langchain_community.callbacks import get_openai_callback
+from app.services.rag_service import get_all_documents, CHROMA_DB_DIR, DEFAULT_COLLECTION_NAME
 from app.services.chat_service import get_answer
+from app.services import token_accounting, upload_store
+from app.core import tracing
+
+logger = logging.getLogger(__name__)
 
 # RAGAS requires OPENAI_API_KEY to be in the environment.
 # It should already be set by docker-compose or .env.
 if not os.getenv("OPENAI_API_KEY"):
-    print("WARNING: OPENAI_API_KEY not found in environment")
+    logger.warning("OPENAI_API_KEY not found in environment")
 
 def load_all_local_documents():
     """
@@ -48,11 +54,16 @@ def load_all_local_documents():
     
     documents = []
     if not os.path.exists(base_path):
-         print(f"Warning: Data directory {base_path} not found.")
+         logger.warning(f"Data directory {base_path} not found.")
          return []
          
-    for filename in os.listdir(base_path):
-        file_path = os.path.join(base_path, filename)
+    # Flat uploads (older ones) and the content-addressed blobs slots reference
+    file_paths = [
+        os.path.join(base_path, filename) for filename in os.listdir(base_path)
+        if not upload_store.is_internal(filename)
+    ] + upload_store.referenced_paths(base_path)
+    for file_path in file_paths:
+        filename = os.path.basename(file_path)
         ext = os.path.splitext(filename)[1].lower()
         try:
             if ext == ".pdf":
@@ -65,10 +76,11 @@ def load_all_local_documents():
                 loader = TextLoader(file_path)
                 documents.extend(loader.load())
         except Exception as e:
-            print(f"Error loading {filename} for evaluation: {e}")
+            logger.error(f"Error loading {filename} for evaluation: {e}")
             
     return documents
 
+@tracing.traced("evaluation.generate_testset")
 def generate_evaluation_testset(limit: int = 15):
     """
     Generates a synthetic testset using RAGAS.
@@ -83,13 +95,18 @@ def generate_evaluation_testset(limit: int = 15):
     
     # Generate
     # In 0.0.22, generate() accepts LangChain docs directly
-    testset = generator.generate(
-        documents,
-        test_size=limit
-    )
+    tracing.current_span().set_attributes(documents=len(documents), test_size=limit)
+    with token_accounting.usage_scope(operation=token_accounting.OP_EVALUATION), get_openai_callback() as cb:
+        testset = generator.generate(
+            documents,
+            test_size=limit
+        )
+        # RAGAS builds its own LLM clients: only aggregated totals are available
+        token_accounting.token_usage.record_totals("ragas", cb.successful_requests, cb.prompt_tokens, cb.completion_tokens, cb.total_cost)
     
     return testset.to_pandas().to_dict(orient="records")
 
+@tracing.traced("evaluation.run")
 def run_evaluation(testset_data: list):
     """
     Runs the RAG pipeline on the testset and evaluates results.
@@ -113,11 +130,12 @@ def run_evaluation(testset_data: list):
         # Fallback if keys are different (just in case)
         if not q:
             # Try finding 'user_input' or similar if question is missing, though we verified it exists
-            print(f"Skipping item with missing question: {item.keys()}")
+            logger.warning(f"Skipping item with missing question: {list(item.keys())}")
             continue
             
         # Call into our actual system
-        response = get_answer(q)
+        with token_accounting.usage_scope(DEFAULT_COLLECTION_NAME, operation=token_accounting.OP_EVALUATION):
+            response = get_answer(q)
         
         results["question"].append(q)
         results["answer"].append(response["answer"])
@@ -130,16 +148,21 @@ def run_evaluation(testset_data: list):
         
     # 2. Evaluate using RAGAS
     dataset = Dataset.from_dict(results)
+    tracing.current_span().set_attribute("questions", len(results["question"]))
     
-    scores = evaluate(
-        dataset=dataset,
-        metrics=[
-            faithfulness,
-            answer_relevancy,
-            context_precision,
-            context_recall
-        ]
-    )
+    with tracing.span("evaluation.ragas"), \
+            token_accounting.usage_scope(DEFAULT_COLLECTION_NAME, operation=token_accounting.OP_EVALUATION), \
+            get_openai_callback() as cb:
+        scores = evaluate(
+            dataset=dataset,
+            metrics=[
+                faithfulness,
+                answer_relevancy,
+                context_precision,
+                context_recall
+            ]
+        )
+        token_accounting.token_usage.record_totals("ragas", cb.successful_requests, cb.prompt_tokens, cb.completion_tokens, cb.total_cost)
     
     # Ragas Result object causes serialization issues in FastAPI
     # We convert it to a simple dict of floats
@@ -149,7 +172,7 @@ def run_evaluation(testset_data: list):
         for k, v in scores.items():
             final_scores[str(k)] = float(v)
     except Exception as e:
-        print(f"Error converting scores to dict: {e}")
+        logger.error(f"Error converting scores to dict: {e}")
         # Fallback: stringify
         return {"raw_scores": str(scores)}
         
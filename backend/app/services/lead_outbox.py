@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import pool
+from app.core.security import encrypt_data, decrypt_data
+from app.services import crud, token_accounting
+from app.services.chat_service import extract_leads_batch
+
+logger = logging.getLogger(__name__)
+
+# Outbox stages
+STAGE_EXTRACT = "extract"   # waiting for the LLM extraction
+STAGE_DELIVER = "deliver"   # lead extracted, waiting for webhook delivery
+STAGE_DEAD = "dead"         # gave up after LEAD_MAX_ATTEMPTS (kept for inspection)
+
+def _backoff(attempts: int) -> float:
+    """Exponential backoff: base * 2^attempts, capped at LEAD_RETRY_MAX_SECONDS."""
+    return min(settings.LEAD_RETRY_BASE_SECONDS * (2 ** attempts), settings.LEAD_RETRY_MAX_SECONDS)
+
+class LeadOutboxWorker:
+    """
+    Deferred lead extraction ('deferred' lead mode).
+    - /chat answers immediately and enqueues the exchange in the `lead_outbox` table
+      (payload encrypted, survives restarts).
+    - A background worker claims pending items, extracts leads for several
+      conversations per LLM call, then POSTs them in batches to LEAD_WEBHOOK_URL.
+    - Failures are retried with exponential backoff; items are only removed
+      once the webhook accepted them.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.LEAD_WEBHOOK_URL)
+
+    async def enqueue(self, query: str, answer: str, business_context: str, collection_name: str, user_id: str = None) -> int:
+        payload = {
+            "query": query,
+            "answer": answer,
+            "business_context": business_context,
+            "collection_name": collection_name,
+            "user_id": user_id,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        encrypted = encrypt_data(json.dumps(payload))
+        lead_id = await pool.run_write(lambda db: crud.enqueue_lead(db, STAGE_EXTRACT, encrypted))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return lead_id
+
+    async def _claim(self, stage: str):
+        token = f"{self._worker_id}-{uuid.uuid4().hex[:8]}"
+        now = time.time()
+        lease_cutoff = now - settings.LEAD_CLAIM_LEASE_SECONDS
+        claimed = await pool.run_write(
+            lambda db: crud.claim_leads(db, stage, token, now, lease_cutoff, settings.LEAD_BATCH_SIZE)
+        )
+        if not claimed:
+            return []
+        async with pool.connection() as db:
+            rows = await crud.get_claimed_leads(db, token)
+        return [
+            {"id": lead_id, "payload": json.loads(decrypt_data(encrypted)), "attempts": attempts}
+            for lead_id, encrypted, attempts in rows
+        ]
+
+    async def _retry(self, items: list, error: str):
+        now = time.time()
+        rows = [(now + _backoff(item["attempts"]), error[:500], item["id"]) for item in items]
+        await pool.run_write(lambda db: crud.retry_leads(db, rows, STAGE_DEAD, settings.LEAD_MAX_ATTEMPTS))
+
+    async def _extract_pending(self) -> int:
+        items = await self._claim(STAGE_EXTRACT)
+        if not items:
+            return 0
+
+        # One LLM call per business context and collection (so token usage is billed to one tenant)
+        groups = {}
+        for item in items:
+            key = (item["payload"]["business_context"], item["payload"].get("collection_name") or "")
+            groups.setdefault(key, []).append(item)
+
+        for (business_context, collection_name), group in groups.items():
+            conversations = [
+                {"id": item["id"], "query": item["payload"]["query"], "answer": item["payload"]["answer"]}
+                for item in group
+            ]
+            try:
+                # Federated chats carry "slot_a,slot_b": the extraction is split across the slots
+                with token_accounting.usage_scope(collection_name.split(",") if collection_name else None,
+                                                  operation=token_accounting.OP_LEAD_EXTRACTION):
+                    leads = await run_in_threadpool(extract_leads_batch, conversations, business_context)
+            except Exception as e:
+                logger.error(f"Deferred lead extraction failed for {len(group)} items: {e}")
+                await self._retry(group, str(e))
+                continue
+
+            failed = []
+            for item in group:
+                lead = leads.get(item["id"])
+                if lead is None:
+                    failed.append(item)
+                    continue
+                payload = dict(item["payload"], lead_data=lead.dict())
+                encrypted = encrypt_data(json.dumps(payload))
+                await pool.run_write(lambda db, i=item["id"], e=encrypted: crud.advance_lead(db, i, STAGE_DELIVER, e))
+            if failed:
+                await self._retry(failed, "Extraction returned no lead")
+        return len(items)
+
+    async def _deliver_pending(self) -> int:
+        items = await self._claim(STAGE_DELIVER)
+        if not items:
+            return 0
+
+        body = {
+            "leads": [
+                {
+                    "lead_id": item["id"],
+                    "user_id": item["payload"].get("user_id"),
+                    "collection_name": item["payload"].get("collection_name"),
+                    "query": item["payload"].get("query"),
+                    "created_at": item["payload"].get("created_at"),
+                    "lead_data": item["payload"].get("lead_data"),
+                }
+                for item in items
+            ]
+        }
+        try:
+            async with httpx.AsyncClient(timeout=settings.LEAD_WEBHOOK_TIMEOUT_SECONDS) as client:
+                response = await client.post(settings.LEAD_WEBHOOK_URL, json=body)
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Lead webhook delivery failed for {len(items)} items, will retry: {e}")
+            await self._retry(items, str(e))
+            return 0
+
+        await pool.run_write(lambda db: crud.delete_leads(db, [item["id"] for item in items]))
+        return len(items)
+
+    async def process_once(self) -> dict:
+        """Drains what is due right now. Returns how many items moved through each stage."""
+        extracted = delivered = 0
+        while True:
+            batch_extracted = await self._extract_pending()
+            batch_delivered = await self._deliver_pending()
+            extracted += batch_extracted
+            delivered += batch_delivered
+            if not batch_extracted and not batch_delivered:
+                return {"extracted": extracted, "delivered": delivered}
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.LEAD_WORKER_INTERVAL_SECONDS)
+                # Give concurrent chats a moment to join the same batch
+                await asyncio.sleep(settings.LEAD_BATCH_WINDOW_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.process_once()
+            except Exception as e:
+                logger.error(f"Lead outbox worker error: {e}")
+
+    def start(self):
+        if self._task is None and self.enabled:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Pending items stay in SQLite and are picked up after restart
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def stats(self) -> dict:
+        async with pool.connection() as db:
+            counts = await crud.count_leads_by_stage(db)
+        return {"enabled": self.enabled, "running": self._task is not None, "stages": counts}
+
+lead_outbox = LeadOutboxWorker()
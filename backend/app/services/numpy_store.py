@@ -0,0 +1,477 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Slots on the numpy engine (slot_settings "engine") live in <persist_directory>/numpy/<collection>/
+NUMPY_DIR = "numpy"
+SIDECAR_FILE = "columns.json"
+LOCK_FILE = ".lock"
+# Rows allocated ahead in the vectors file, so most ingestions append in place
+MIN_CAPACITY = 1024
+METADATA_TYPES = (str, int, float, bool)
+
+_collections: Dict[tuple, "NumpyCollection"] = {}
+_collections_lock = threading.Lock()
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _directory(persist_directory: str, collection_name: str) -> str:
+    if not collection_name or os.path.basename(collection_name) != collection_name or collection_name.startswith("."):
+        raise ValueError(f"Invalid collection name: {collection_name!r}")
+    return os.path.join(persist_directory, NUMPY_DIR, collection_name)
+
+class _State:
+    """One version of a collection. Writes publish a new one, so readers never lock."""
+
+    def __init__(self, ids: list, documents: list, columns: dict, vectors: np.ndarray,
+                 dim: Optional[int], file: Optional[str], generation: int):
+        self.ids = ids
+        self.rows = {record_id: row for row, record_id in enumerate(ids)}
+        self.documents = documents
+        self.columns = columns        # metadata key -> one value per row (None: key absent)
+        self.vectors = vectors        # (rows, dim) float32, memory-mapped
+        self.dim = dim
+        self.file = file
+        self.generation = generation
+        self._arrays = {}
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], {}, np.zeros((0, 0), np.float32), None, None, 0)
+
+    def column(self, key: str) -> np.ndarray:
+        """A metadata column as an object array (filters compare whole columns at once)."""
+        array = self._arrays.get(key)
+        if array is None:
+            array = np.empty(len(self.ids), dtype=object)
+            values = self.columns.get(key)
+            if values is not None:
+                array[:] = values
+            self._arrays[key] = array
+        return array
+
+    def metadata(self, row: int) -> Optional[dict]:
+        metadata = {key: values[row] for key, values in self.columns.items() if values[row] is not None}
+        return metadata or None
+
+class NumpyCollection:
+    """
+    Exact search for small and medium slots, without Chroma's SQLite and HNSW:
+    the slot's embeddings are one memory-mapped float32 matrix of unit rows and
+    a query is a single matrix product plus argpartition. Ids, documents and
+    metadata sit in a columnar sidecar (columns.json, one list per metadata
+    key) that `where` filters are evaluated against. Implements the part of
+    the chromadb Collection API the app and LangChain's Chroma use, like
+    ShardedCollection; distances are cosine (1 - similarity).
+
+    Appends write past the live rows of the matrix file, then publish the new
+    row count with an atomic replace of the sidecar; updates and deletes write
+    the next generation of the file. The sidecar never points at half-written
+    rows, other workers reload when it changes and writers hold an flock on
+    the slot directory.
+    """
+
+    def __init__(self, name: str, persist_directory: str):
+        self.name = name
+        self.directory = _directory(persist_directory, name)
+        self.id = uuid.uuid5(uuid.NAMESPACE_URL, self.directory)
+        self.metadata = {"hnsw:space": "cosine", "engine": "numpy"}
+        self._state = _State.empty()
+        self._version = None
+        self._load_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    # --- Storage ---
+    def _path(self, file: str) -> str:
+        return os.path.join(self.directory, file)
+
+    def _sidecar_version(self):
+        try:
+            stat = os.stat(self._path(SIDECAR_FILE))
+        except FileNotFoundError:
+            return None
+        # Replaced (new inode) on every write
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> _State:
+        try:
+            with open(self._path(SIDECAR_FILE), "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return _State.empty()
+        count, dim = len(data["ids"]), data["dim"]
+        if count:
+            vectors = np.memmap(self._path(data["file"]), dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            vectors = np.zeros((0, dim or 0), np.float32)
+        return _State(data["ids"], data["documents"], data["columns"], vectors, dim, data["file"], data["generation"])
+
+    def _current(self) -> _State:
+        version = self._sidecar_version()
+        if version != self._version:
+            with self._load_lock:
+                if version != self._version:
+                    self._state = self._load()
+                    self._version = version
+        return self._state
+
+    @contextmanager
+    def _writing(self):
+        """Serialises writers (threads and worker processes). Yields the latest state."""
+        with self._write_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(LOCK_FILE), "w") as lock_file:
+                try:
+                    import fcntl
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                except ImportError:
+                    pass
+                yield self._current()
+
+    def _publish(self, state: _State):
+        temp_path = self._path(f"{SIDECAR_FILE}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(temp_path, "w") as f:
+            json.dump({
+                "dim": state.dim,
+                "file": state.file,
+                "generation": state.generation,
+                "ids": state.ids,
+                "documents": state.documents,
+                "columns": state.columns,
+            }, f)
+        os.replace(temp_path, self._path(SIDECAR_FILE))
+        with self._load_lock:
+            self._state = self._load()
+            self._version = self._sidecar_version()
+
+    def _append(self, state: _State, ids: list, vectors: np.ndarray, documents: list, metadatas: list):
+        count, dim = len(state.ids), state.dim or vectors.shape[1]
+        file = state.file or f"vectors.{state.generation}.f32"
+        path = self._path(file)
+        capacity = os.path.getsize(path) // (dim * 4) if state.file and os.path.exists(path) else 0
+        if count + len(ids) > capacity:
+            capacity = max(count + len(ids), 2 * capacity, MIN_CAPACITY)
+            with open(path, "ab") as f:
+                f.truncate(capacity * dim * 4)
+        tail = np.memmap(path, dtype=np.float32, mode="r+", offset=count * dim * 4, shape=(len(ids), dim))
+        tail[:] = vectors
+        tail.flush()
+        del tail
+        keys = set(state.columns).union(*(metadata or {} for metadata in metadatas))
+        columns = {
+            key: (state.columns.get(key) or [None] * count) + [(metadata or {}).get(key) for metadata in metadatas]
+            for key in keys
+        }
+        self._publish(_State(state.ids + ids, state.documents + documents, columns, None, dim, file, state.generation))
+
+    def _rewrite(self, state: _State, ids: list, vectors: np.ndarray, documents: list, columns: dict):
+        generation = state.generation + 1
+        file = f"vectors.{generation}.f32" if ids else None
+        if ids:
+            matrix = np.memmap(self._path(file), dtype=np.float32, mode="w+", shape=(max(len(ids), MIN_CAPACITY), vectors.shape[1]))
+            matrix[:len(ids)] = vectors
+            matrix.flush()
+            del matrix
+        columns = {key: values for key, values in columns.items() if any(value is not None for value in values)}
+        self._publish(_State(ids, documents, columns, None, state.dim, file, generation))
+        if state.file and state.file != file:
+            # Readers still mapping it keep their pages until they reload
+            try:
+                os.remove(self._path(state.file))
+            except OSError:
+                pass
+
+    def _stray_files(self, state: _State) -> list:
+        """Vector files of older generations a writer could not remove."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.startswith("vectors.") and name != state.file)
+
+    def storage(self) -> dict:
+        """Rows, allocated capacity and bytes on disk of the slot, and whether the files agree."""
+        state = self._current()
+        count = len(state.ids)
+        path = self._path(state.file) if state.file else None
+        file_bytes = os.path.getsize(path) if path and os.path.exists(path) else 0
+        capacity = file_bytes // (state.dim * 4) if state.dim else 0
+        stray = self._stray_files(state)
+        sidecar = self._path(SIDECAR_FILE)
+        return {
+            "records": count,
+            "capacity": capacity,
+            "vector_bytes": file_bytes,
+            "sidecar_bytes": os.path.getsize(sidecar) if os.path.exists(sidecar) else 0,
+            "stray_files": stray,
+            "stray_bytes": sum(os.path.getsize(self._path(name)) for name in stray),
+            "consistent": (
+                len(state.documents) == count and capacity >= count
+                and all(len(values) == count for values in state.columns.values())
+            ),
+        }
+
+    def compact(self) -> int:
+        """
+        Rewrites the matrix without the capacity reserved for appends and
+        removes stray files of older generations. Returns the bytes freed.
+        """
+        before = self.storage()
+        with self._writing() as state:
+            if state.file and before["capacity"] > max(len(state.ids), MIN_CAPACITY):
+                self._rewrite(state, state.ids, np.asarray(state.vectors), state.documents, state.columns)
+                state = self._current()
+            for name in self._stray_files(state):
+                try:
+                    os.remove(self._path(name))
+                except OSError as e:
+                    logger.warning(f"Could not remove {name} of {self.name}: {e}")
+        after = self.storage()
+        return (before["vector_bytes"] + before["stray_bytes"]) - (after["vector_bytes"] + after["stray_bytes"])
+
+    def _vectors(self, state: _State, embeddings, count: int) -> np.ndarray:
+        if embeddings is None:
+            raise ValueError("The numpy engine stores precomputed embeddings only")
+        vectors = _unit(embeddings)
+        if len(vectors) != count:
+            raise ValueError(f"Got {len(vectors)} embeddings for {count} ids")
+        if state.dim and vectors.shape[1] != state.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality {state.dim}")
+        return vectors
+
+    @staticmethod
+    def _check_batch(ids: list, metadatas: list):
+        if len(set(ids)) != len(ids):
+            raise ValueError("Expected IDs to be unique")
+        for metadata in metadatas:
+            for key, value in (metadata or {}).items():
+                if not isinstance(value, METADATA_TYPES):
+                    raise ValueError(f"Expected metadata value to be a str, int, float or bool, got {value!r} for {key!r}")
+
+    def _write(self, ids, embeddings, metadatas, documents, insert: bool, update: bool):
+        """
+        Adds the new ids (`insert`) and/or updates the existing ones (`update`)
+        like Chroma does: vectors and documents are replaced when given,
+        metadata is merged into the stored one.
+        """
+        ids = [ids] if isinstance(ids, str) else list(ids)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        self._check_batch(ids, metadatas)
+        with self._writing() as state:
+            vectors = self._vectors(state, embeddings, len(ids)) if embeddings is not None or insert else None
+            new = [i for i, record_id in enumerate(ids) if record_id not in state.rows] if insert else []
+            changed = [i for i, record_id in enumerate(ids) if record_id in state.rows] if update else []
+            if not update and len(new) < len(ids):
+                logger.warning(f"{self.name}: {len(ids) - len(new)} ids already exist, not added")
+            if not changed:
+                if new:
+                    self._append(state, [ids[i] for i in new], vectors[new],
+                                 [documents[i] for i in new], [metadatas[i] for i in new])
+                return
+            # Existing rows change: write the next generation of the matrix
+            all_ids = state.ids + [ids[i] for i in new]
+            matrix = np.empty((len(all_ids), state.dim), dtype=np.float32)
+            matrix[:len(state.ids)] = state.vectors
+            all_documents = state.documents + [documents[i] for i in new]
+            columns = {key: list(values) + [None] * len(new) for key, values in state.columns.items()}
+            rows = [(state.rows[ids[i]], i) for i in changed] + [(len(state.ids) + n, i) for n, i in enumerate(new)]
+            for row, i in rows:
+                if vectors is not None:
+                    matrix[row] = vectors[i]
+                if documents[i] is not None:
+                    all_documents[row] = documents[i]
+                for key, value in (metadatas[i] or {}).items():
+                    columns.setdefault(key, [None] * len(all_ids))[row] = value
+            self._rewrite(state, all_ids, matrix, all_documents, columns)
+
+    # --- chromadb Collection API ---
+    def count(self) -> int:
+        return len(self._current().ids)
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        self._write(ids, embeddings, metadatas, documents, insert=True, update=False)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        self._write(ids, embeddings, metadatas, documents, insert=True, update=True)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        self._write(ids, embeddings, metadatas, documents, insert=False, update=True)
+
+    def _match(self, state: _State, where: dict) -> np.ndarray:
+        """Boolean row mask of a chromadb `where` filter, one column comparison per condition."""
+        mask = np.ones(len(state.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._match(state, clause)
+                continue
+            if key == "$or":
+                matched = np.zeros(len(state.ids), dtype=bool)
+                for clause in condition:
+                    matched |= self._match(state, clause)
+                mask &= matched
+                continue
+            column = state.column(key)
+            present = column != None  # noqa: E711 (elementwise on the object array)
+            operator, value = next(iter(condition.items())) if isinstance(condition, dict) else ("$eq", condition)
+            if operator == "$eq":
+                matched = column == value
+            elif operator == "$ne":
+                matched = column != value
+            elif operator in ("$in", "$nin"):
+                values = set(value)
+                matched = np.fromiter((v in values for v in column), dtype=bool, count=len(column))
+                if operator == "$nin":
+                    matched = ~matched
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                numeric = present & np.fromiter(
+                    (isinstance(v, (int, float)) and not isinstance(v, bool) for v in column), dtype=bool, count=len(column)
+                )
+                matched = np.zeros(len(column), dtype=bool)
+                values = column[numeric].astype(np.float64)
+                compare = {"$gt": np.greater, "$gte": np.greater_equal, "$lt": np.less, "$lte": np.less_equal}[operator]
+                matched[numeric] = compare(values, value)
+            else:
+                raise ValueError(f"Unsupported where operator {operator!r}")
+            mask &= present & np.asarray(matched, dtype=bool)
+        return mask
+
+    def _match_document(self, state: _State, where_document: dict) -> np.ndarray:
+        operator, value = next(iter(where_document.items()))
+        if operator in ("$and", "$or"):
+            masks = [self._match_document(state, clause) for clause in value]
+            return np.logical_and.reduce(masks) if operator == "$and" else np.logical_or.reduce(masks)
+        if operator not in ("$contains", "$not_contains"):
+            raise ValueError(f"Unsupported where_document operator {operator!r}")
+        matched = np.fromiter((value in (document or "") for document in state.documents), dtype=bool, count=len(state.ids))
+        return matched if operator == "$contains" else ~matched
+
+    def _select(self, state: _State, ids=None, where=None, where_document=None) -> np.ndarray:
+        if ids is not None:
+            ids = [ids] if isinstance(ids, str) else ids
+            rows = np.array([state.rows[record_id] for record_id in ids if record_id in state.rows], dtype=np.int64)
+        else:
+            rows = np.arange(len(state.ids))
+        if where or where_document:
+            mask = np.ones(len(state.ids), dtype=bool)
+            if where:
+                mask &= self._match(state, where)
+            if where_document:
+                mask &= self._match_document(state, where_document)
+            rows = rows[mask[rows]]
+        return rows
+
+    def _columns(self, state: _State, rows, include: list) -> dict:
+        return {
+            "ids": [state.ids[row] for row in rows],
+            "embeddings": state.vectors[rows].tolist() if "embeddings" in include else None,
+            "documents": [state.documents[row] for row in rows] if "documents" in include else None,
+            "uris": None,
+            "data": None,
+            "metadatas": [state.metadata(row) for row in rows] if "metadatas" in include else None,
+        }
+
+    def get(self, ids=None, where=None, limit=None, offset=None, where_document=None,
+            include=("metadatas", "documents"), **kwargs):
+        state = self._current()
+        rows = self._select(state, ids, where, where_document)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._columns(state, rows, include)
+
+    def delete(self, ids=None, where=None, where_document=None, **kwargs):
+        if ids is None and not where and not where_document:
+            raise ValueError("delete needs ids, where or where_document")
+        with self._writing() as state:
+            removed = self._select(state, ids, where, where_document)
+            if not len(removed):
+                return
+            keep = np.ones(len(state.ids), dtype=bool)
+            keep[removed] = False
+            rows = np.flatnonzero(keep)
+            self._rewrite(
+                state,
+                [state.ids[row] for row in rows],
+                np.asarray(state.vectors[rows]),
+                [state.documents[row] for row in rows],
+                {key: [values[row] for row in rows] for key, values in state.columns.items()},
+            )
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None, where_document=None,
+              include=("metadatas", "documents", "distances"), **kwargs):
+        if query_embeddings is None:
+            raise ValueError("The numpy engine needs query_embeddings")
+        state = self._current()
+        queries = _unit(query_embeddings)
+        if state.dim and queries.shape[1] != state.dim:
+            raise ValueError(f"Embedding dimension {queries.shape[1]} does not match collection dimensionality {state.dim}")
+        rows = self._select(state, None, where, where_document)
+        vectors = state.vectors if len(rows) == len(state.ids) else state.vectors[rows]
+        # One product for every row and query: (rows, dim) @ (dim, queries)
+        similarities = vectors @ queries.T if len(rows) else np.zeros((0, len(queries)), np.float32)
+        k = min(n_results, len(rows))
+        result = {key: [] for key in ("ids", "embeddings", "documents", "uris", "data", "metadatas", "distances")}
+        for q in range(len(queries)):
+            scores = similarities[:, q]
+            top = np.argpartition(-scores, k - 1)[:k] if 0 < k < len(rows) else np.arange(len(rows))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            columns = self._columns(state, rows[top], include)
+            for key, values in columns.items():
+                result[key].append(values)
+            result["distances"].append((1.0 - scores[top]).tolist())
+        for key in ("embeddings", "documents", "uris", "data", "metadatas", "distances"):
+            if key not in include:
+                result[key] = None
+        return result
+
+class NumpyClient:
+    """Stands in for the chromadb client LangChain's Chroma(...) asks for its collection."""
+
+    def __init__(self, persist_directory: str):
+        self.persist_directory = persist_directory
+
+    def get_or_create_collection(self, name: str, **kwargs) -> NumpyCollection:
+        return get_collection(name, self.persist_directory)
+
+def get_collection(collection_name: str, persist_directory: str) -> NumpyCollection:
+    """One instance per slot and process, so the mapped matrix outlives the request."""
+    key = (persist_directory, collection_name)
+    collection = _collections.get(key)
+    if collection is None:
+        with _collections_lock:
+            collection = _collections.get(key)
+            if collection is None:
+                collection = NumpyCollection(collection_name, persist_directory)
+                _collections[key] = collection
+    return collection
+
+def list_collections(persist_directory: str) -> List[str]:
+    root = os.path.join(persist_directory, NUMPY_DIR)
+    try:
+        names = os.listdir(root)
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in names if os.path.exists(os.path.join(root, name, SIDECAR_FILE)))
+
+def delete_collection(collection_name: str, persist_directory: str) -> bool:
+    directory = _directory(persist_directory, collection_name)
+    if not os.path.isdir(directory):
+        return False
+    with _collections_lock:
+        _collections.pop((persist_directory, collection_name), None)
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
@@ -3,6 +3,9 @@ import shutil
 import zipfile
 import json
 import uuid
+import time
+import logging
+import threading
 import openai
 from dotenv import load_dotenv
 
@@ -10,14 +13,20 @@ load_dotenv()
 
 from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
+from contextlib import contextmanager
+from app.core import metrics, tracing
+from app.services.token_accounting import AccountedEmbeddings
+from app.services import numpy_store, sharding, slot_settings, store_maintenance, upload_store, vector_store
+from app.services.slot_router import slot_router
 
 # Configuration
 CHROMA_DB_DIR = "/app/chroma_db"
+UPLOAD_DIR = "/app/data_uploads"
 DEFAULT_COLLECTION_NAME = "nexus_slot_1"
 
+logger = logging.getLogger(__name__)
+
 def transcribe_audio(file_path: str) -> str:
     """
     Transcribes audio using OpenAI Whisper API.
@@ -31,7 +40,7 @@ def transcribe_audio(file_path: str) -> str:
             )
         return transcript.text
     except Exception as e:
-        print(f"Error transcribing audio: {e}")
+        logger.exception(f"Error transcribing audio: {e}")
         raise e
 
 def load_document(file_path: str):
@@ -56,46 +65,97 @@ def load_document(file_path: str):
     else:
         raise ValueError(f"Unsupported file format: {ext}")
 
-def index_document(file_path: str, collection_name: str = DEFAULT_COLLECTION_NAME):
+# Max records per Chroma upsert call (chromadb rejects very large batches)
+UPSERT_BATCH_SIZE = 5000
+
+@contextmanager
+def _ingest_stage(name: str, metric_stage: str, timings: dict):
+    """Times one ingestion stage into `timings`, the stage histogram and a trace span."""
+    start = time.perf_counter()
+    with tracing.span(f"rag.{name}") as stage_span:
+        yield stage_span
+    timings[name] = time.perf_counter() - start
+    metrics.observe_stage(metric_stage, timings[name])
+
+@tracing.traced("rag.index_document")
+def index_document(file_path: str, collection_name: str = DEFAULT_COLLECTION_NAME,
+                   source: str = None, file_hash: str = None):
     """
     1. Loads the file (PDF, DOCX, TXT, MD, Audio)
     2. Splits into chunks
-    3. Embeds and stores in ChromaDB
+    3. Embeds the chunks
+    4. Stores them in ChromaDB
+    `source` replaces the file path in the chunks' metadata (uploads are read
+    from their content-addressed blob but listed by filename).
+    Returns the per-stage timings (seconds) alongside the result.
     """
+    metrics.INGESTION_IN_PROGRESS.inc()
+    tracing.current_span().set_attributes(
+        collection=collection_name, file_type=os.path.splitext(file_path)[1].lower(), file_bytes=os.path.getsize(file_path)
+    )
     try:
+        timings = {}
+
         # 1. Load Document
-        documents = load_document(file_path)
+        with _ingest_stage("load", metrics.STAGE_LOAD, timings) as stage_span:
+            documents = load_document(file_path)
+            for document in documents:
+                if source:
+                    document.metadata["source"] = source
+                if file_hash:
+                    document.metadata["file_hash"] = file_hash
+            stage_span.set_attribute("pages", len(documents))
         
         # 2. Split Text (Chunks)
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        chunks = text_splitter.split_documents(documents)
+        with _ingest_stage("split", metrics.STAGE_SPLIT, timings) as stage_span:
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                separators=["\n\n", "\n", " ", ""]
+            )
+            chunks = text_splitter.split_documents(documents)
+            stage_span.set_attribute("chunks", len(chunks))
         
-        # 3. Embed & Store
+        # 3. Embed
         # We assume OPENAI_API_KEY is in os.environ via python-dotenv
-        embeddings = OpenAIEmbeddings()
-        
-        vector_db = Chroma.from_documents(
-            documents=chunks,
-            embedding=embeddings,
-            persist_directory=CHROMA_DB_DIR,
-            collection_name=collection_name
-        )
+        with _ingest_stage("embed", metrics.STAGE_EMBED, timings) as stage_span:
+            embeddings = AccountedEmbeddings()
+            texts = [chunk.page_content for chunk in chunks]
+            vectors = embeddings.embed_documents(texts) if texts else []
+            metrics.EMBEDDED_TEXTS.inc(len(texts))
+            stage_span.set_attribute("texts", len(texts))
         
-        vector_db.persist()
+        # 4. Store (same as Chroma.from_documents, but with the vectors we already have)
+        with _ingest_stage("store", metrics.STAGE_UPSERT, timings) as stage_span:
+            ids = [str(uuid.uuid4()) for _ in chunks]
+            metadatas = [chunk.metadata for chunk in chunks]
+            # Opened under the lock: a rebuild swaps the slot's collections
+            with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+                vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
+                for i in range(0, len(chunks), UPSERT_BATCH_SIZE):
+                    vector_db._collection.upsert(
+                        ids=ids[i:i + UPSERT_BATCH_SIZE],
+                        embeddings=vectors[i:i + UPSERT_BATCH_SIZE],
+                        metadatas=metadatas[i:i + UPSERT_BATCH_SIZE],
+                        documents=texts[i:i + UPSERT_BATCH_SIZE]
+                    )
+            vector_db.persist()
+            stage_span.set_attribute("batches", (len(chunks) + UPSERT_BATCH_SIZE - 1) // UPSERT_BATCH_SIZE)
+        # Auto routing: fold the new vectors into the slot's centroids
+        slot_router.record_added(collection_name, vectors)
         
         return {
             "status": "success", 
             "chunks_created": len(chunks),
-            "collection": collection_name
+            "collection": collection_name,
+            "timings": timings
         }
         
     except Exception as e:
-        print(f"Error indexing document: {e}")
+        logger.exception(f"Error indexing document: {e}")
         raise e
+    finally:
+        metrics.INGESTION_IN_PROGRESS.dec()
 
 def get_document_count(collection_name: str = DEFAULT_COLLECTION_NAME):
     """
@@ -112,12 +172,8 @@ def get_all_documents(collection_name: str = DEFAULT_COLLECTION_NAME):
     Returns a list of all unique documents currently indexed.
     """
     try:
-        embeddings = OpenAIEmbeddings()
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR, 
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
+        embeddings = AccountedEmbeddings()
+        vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
         
         # Get all metadata to find unique sources
         collection_data = vector_db._collection.get(include=["metadatas"])
@@ -132,7 +188,7 @@ def get_all_documents(collection_name: str = DEFAULT_COLLECTION_NAME):
                 
         return list(unique_files)
     except Exception as e:
-        print(f"Error fetching documents: {e}")
+        logger.exception(f"Error fetching documents: {e}")
         return []
 
 def delete_document(filename: str, collection_name: str = DEFAULT_COLLECTION_NAME):
@@ -140,12 +196,8 @@ def delete_document(filename: str, collection_name: str = DEFAULT_COLLECTION_NAM
     Deletes a document from the vector store and the filesystem.
     """
     try:
-        embeddings = OpenAIEmbeddings()
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR, 
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
+        embeddings = AccountedEmbeddings()
+        vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
         
         # Reconstruct potential source path (best effort)
         # We know ingest saves to /app/data_uploads/{filename}
@@ -163,61 +215,66 @@ def delete_document(filename: str, collection_name: str = DEFAULT_COLLECTION_NAM
         # However, to be robust, let's find all chunks that have this filename in their source path
         # Currently we just use the exact path we controlled in ingest.py
         
-        vector_db._collection.delete(where={"source": target_source_path})
+        # Auto routing needs the vectors that leave the slot
+        with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+            vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
+            removed = vector_db._collection.get(where={"source": target_source_path}, include=["embeddings"])
+            vector_db._collection.delete(where={"source": target_source_path})
         vector_db.persist()
+        slot_router.record_removed(collection_name, removed.get("embeddings"))
         
-        # Now delete the actual file
-        file_path = os.path.join("/app/data_uploads", filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # Drop this slot's reference to the file: other slots may hold the same
+        # content, the orphan GC deletes the blob once nothing references it
+        upload_store.remove_reference(collection_name, filename, UPLOAD_DIR)
             
         return True
     except Exception as e:
-        print(f"Error deleting document {filename}: {e}")
+        logger.exception(f"Error deleting document {filename}: {e}")
         return False
 
+def get_referenced_sources() -> set:
+    """
+    Returns every source path referenced by any collection in the store
+    (not only the ones in slots.json: n8n can write to arbitrary collection names).
+    """
+    client = vector_store.get_client(CHROMA_DB_DIR)
+    collections = client.list_collections() + [
+        numpy_store.get_collection(name, CHROMA_DB_DIR) for name in numpy_store.list_collections(CHROMA_DB_DIR)
+    ]
+    referenced = set()
+    for collection in collections:
+        data = collection.get(include=["metadatas"])
+        for meta in data.get("metadatas") or []:
+            if meta and meta.get("source"):
+                referenced.add(meta["source"])
+    return referenced
+
 def reset_knowledge_base(collection_name: str = DEFAULT_COLLECTION_NAME):
     """
     Deletes the specific collection.
     """
     try:
-        embeddings = OpenAIEmbeddings()
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR,
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
-        # Delete using the public API if possible, or correct private usage
-        # vector_db.delete_collection() completely removes it. 
-        # But we want to keep the slot, just empty it.
-        # So we delete all where "source" exists (which is all our docs)
-        
-        # Method 1: Delete Collection
-        try:
-             vector_db.delete_collection()
-        except:
-             pass 
-             
-        # Re-init to ensure it exists empty
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR,
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
+        embeddings = AccountedEmbeddings()
+        # We want to keep the slot, just empty it: drop its collection(s)
+        # (every shard) and re-create it empty
+        with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+            try:
+                vector_store.delete_store(collection_name, CHROMA_DB_DIR)
+            except Exception as e:
+                logger.warning(f"Could not delete collection {collection_name}: {e}")
+                 
+            # Re-init to ensure it exists empty
+            vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
         vector_db.persist()
+        slot_router.record_reset(collection_name)
         
-        # Also clear the uploaded files for this slot?
-        # Our uploads are in a flat dir /app/data_uploads. We should clean them.
-        # But wait, data_uploads isn't separated by slot.
-        # If we delete "CV.pdf" from slot 1, but it was also used in slot 2?
-        # Current implementation shares /app/data_uploads.
-        # Ideally we don't delete files from disk if they might be used elsewhere.
-        # But the user expects "Erase All" to wipe data.
-        # For now, let's just wipe the Vector DB content.
+        # Uploads are shared by content across slots: drop this slot's references,
+        # the orphan GC deletes the files no other slot holds
+        upload_store.remove_references(collection_name, UPLOAD_DIR)
         
         return True
     except Exception as e:
-        print(f"Error reseting knowledge base: {e}")
+        logger.exception(f"Error reseting knowledge base: {e}")
         return False
 
 def create_backup():
@@ -232,9 +289,10 @@ def create_backup():
         shutil.make_archive("/app/backup", 'zip', CHROMA_DB_DIR)
         return backup_path
     except Exception as e:
-        print(f"Error creating backup: {e}")
+        logger.exception(f"Error creating backup: {e}")
         raise e
 
+@tracing.traced("rag.export_slot_data")
 def export_slot_data(collection_name: str) -> str:
     """
     Exports the vectors and source files of a specific slot to a zip.
@@ -244,34 +302,46 @@ def export_slot_data(collection_name: str) -> str:
         os.makedirs(export_dir, exist_ok=True)
         
         # 1. Fetch Data from Chroma
-        embeddings = OpenAIEmbeddings()
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR,
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
+        embeddings = AccountedEmbeddings()
+        vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
         
         # Get all data including embeddings to avoid re-calculating cost
         data = vector_db._collection.get(include=['embeddings', 'metadatas', 'documents'])
+        tracing.current_span().set_attributes(collection=collection_name, records=len(data['ids']))
         
         # 2. Save Vectors
         vectors_path = os.path.join(export_dir, "vectors.json")
         with open(vectors_path, "w") as f:
             json.dump(data, f)
             
-        # 3. Collect Source Files
+        # 3. Collect Source Files, once per content: files/<hash><ext> plus
+        # files.json mapping each filename to its blob
         files_dir = os.path.join(export_dir, "files")
         os.makedirs(files_dir, exist_ok=True)
+        stored = upload_store.references(collection_name, UPLOAD_DIR)
+        manifest = {}
         
         if data['metadatas']:
             for meta in data['metadatas']:
                 if meta and "source" in meta:
                     # We expect source to be /app/data_uploads/filename
                     filename = os.path.basename(meta["source"])
-                    src_path = f"/app/data_uploads/{filename}"
-                    dst_path = os.path.join(files_dir, filename)
-                    if os.path.exists(src_path) and not os.path.exists(dst_path):
-                        shutil.copy2(src_path, dst_path)
+                    if filename in manifest:
+                        continue
+                    if filename in stored and os.path.exists(stored[filename]["path"]):
+                        src_path, blob = stored[filename]["path"], stored[filename]["blob"]
+                    else:
+                        # Uploaded before content-addressed storage
+                        src_path = os.path.join(UPLOAD_DIR, filename)
+                        if not os.path.isfile(src_path):
+                            continue
+                        blob = upload_store.blob_name(upload_store.file_hash(src_path), filename)
+                    dst_path = os.path.join(files_dir, blob)
+                    if not os.path.exists(dst_path):
+                        upload_store.link_or_copy(src_path, dst_path)
+                    manifest[filename] = blob
+        with open(os.path.join(export_dir, "files.json"), "w") as f:
+            json.dump(manifest, f)
                         
         # 4. Zip
         zip_path = f"/app/export_{collection_name}.zip"
@@ -282,9 +352,10 @@ def export_slot_data(collection_name: str) -> str:
         
         return zip_path
     except Exception as e:
-        print(f"Error exporting slot: {e}")
+        logger.exception(f"Error exporting slot: {e}")
         return None
 
+@tracing.traced("rag.import_slot_data")
 def import_slot_data(collection_name: str, zip_path: str):
     """
     Imports vectors and files into the specified slot.
@@ -304,38 +375,49 @@ def import_slot_data(collection_name: str, zip_path: str):
             
         with open(vectors_path, "r") as f:
             data = json.load(f)
+        tracing.current_span().set_attributes(collection=collection_name, records=len(data['ids']))
             
-        # 3. Copy Files
+        # 3. Store Files (content already stored here is not copied again)
         files_dir = os.path.join(temp_dir, "files")
-        if os.path.exists(files_dir):
-            for filename in os.listdir(files_dir):
-                shutil.copy2(os.path.join(files_dir, filename), os.path.join("/app/data_uploads", filename))
+        manifest_path = os.path.join(temp_dir, "files.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        else:
+            # Exports of flat uploads: files/<filename>
+            manifest = {filename: filename for filename in os.listdir(files_dir)} if os.path.exists(files_dir) else {}
+        uploads = {}
+        for filename, blob in manifest.items():
+            filename, blob = os.path.basename(filename), os.path.basename(blob)
+            src_path = os.path.join(files_dir, blob)
+            if os.path.isfile(src_path) or os.path.exists(upload_store.blob_path(UPLOAD_DIR, blob)):
+                uploads[filename] = upload_store.save_file(src_path, filename, UPLOAD_DIR, blob=blob)
                 
         # 4. Inject into Chroma
-        embeddings = OpenAIEmbeddings()
-        vector_db = Chroma(
-            persist_directory=CHROMA_DB_DIR,
-            embedding_function=embeddings,
-            collection_name=collection_name
-        )
+        embeddings = AccountedEmbeddings()
         
         # Upsert (Add or Update)
         # Chroma expects lists
-        if data['ids']:
-            vector_db._collection.upsert(
-                ids=data['ids'],
-                embeddings=data['embeddings'],
-                metadatas=data['metadatas'],
-                documents=data['documents']
-            )
+        with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+            vector_db = vector_store.open_store(collection_name, embeddings, CHROMA_DB_DIR)
+            if data['ids']:
+                vector_db._collection.upsert(
+                    ids=data['ids'],
+                    embeddings=data['embeddings'],
+                    metadatas=data['metadatas'],
+                    documents=data['documents']
+                )
             # Persist if needed (older chroma versions), newer autosaves
             vector_db.persist()
+            slot_router.record_added(collection_name, data['embeddings'])
+        for filename, upload in uploads.items():
+            upload_store.add_reference(collection_name, filename, upload, UPLOAD_DIR)
             
         # Cleanup
         shutil.rmtree(temp_dir)
         return True
     except Exception as e:
-        print(f"Error importing slot: {e}")
+        logger.exception(f"Error importing slot: {e}")
         return False
         
 def get_slot_config():
@@ -345,16 +427,17 @@ def get_slot_config():
     }
     
     if not os.path.exists(config_path):
-        print(f"DEBUG: Config file not found at {config_path}. Using default.")
+        logger.debug("Slot config not found, using default", extra={"path": config_path})
         return default_config
         
     try:
         with open(config_path, "r") as f:
             data = json.load(f)
-            print(f"DEBUG: Loaded config from {config_path}: {data}")
+            # Hot path (every chat/status call): never dump the whole dict
+            logger.debug("Loaded slot config", extra={"path": config_path, "slots": len(data)})
             return data
     except Exception as e:
-        print(f"DEBUG: Error loading config from {config_path}: {e}")
+        logger.error(f"Error loading slot config from {config_path}: {e}")
         return default_config
 
 def save_slot_config(config: dict):
@@ -362,17 +445,263 @@ def save_slot_config(config: dict):
     os.makedirs(CHROMA_DB_DIR, exist_ok=True)
     config_path = os.path.join(CHROMA_DB_DIR, "slots.json")
     try:
-        print(f"DEBUG: Saving config to {config_path}: {config}")
-        with open(config_path, "w") as f:
+        logger.info("Saving slot config", extra={"path": config_path, "slots": len(config)})
+        # Write + rename: other workers never read a half-written file
+        temp_path = f"{config_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, "w") as f:
             json.dump(config, f)
+        os.replace(temp_path, config_path)
         return True
     except Exception as e:
-        print(f"Error saving config: {e}")
+        logger.exception(f"Error saving config: {e}")
         return False
 
-def create_slot(name: str):
+class SlotNotEmptyError(ValueError):
+    pass
+
+def get_slot_settings(collection_name: str) -> dict:
+    return slot_settings.get_slot_settings(collection_name)
+
+def update_slot_settings(collection_name: str, updates: dict) -> dict:
+    """
+    Changes a slot's storage settings (slot_settings.json). Records are placed
+    by shard count and engine, so these only change while the slot is empty:
+    reset it first, or export -> reset -> change -> import to move existing data.
+    Raises ValueError (invalid settings) or SlotNotEmptyError.
+    """
+    # Under the slot's write lock: an ingest between the emptiness check and the
+    # save would write under the old layout/engine, where nothing reads it
+    with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+        current = slot_settings.get_slot_settings(collection_name)
+        slot_settings.validate(updates, current)
+        changed = [key for key in ("shards", "engine") if key in updates and updates[key] != current[key]]
+        if changed:
+            vector_db = vector_store.open_store(collection_name, AccountedEmbeddings(), CHROMA_DB_DIR)
+            count = vector_db._collection.count()
+            if count:
+                raise SlotNotEmptyError(
+                    f"'{collection_name}' holds {count} chunks; reset it (or export, reset and re-import) to change its {', '.join(changed)}."
+                )
+        saved = slot_settings.save_slot_settings(collection_name, updates)
+        if saved["engine"] != current["engine"]:
+            # Drop the (empty) storage of the previous engine
+            vector_store.delete_store(collection_name, CHROMA_DB_DIR, engine=current["engine"])
+        elif saved["shards"] != current["shards"]:
+            # Drop the (empty) collections of the old layout
+            client = vector_store.get_client(CHROMA_DB_DIR)
+            stale = set(sharding.shard_names(collection_name, current["shards"])) - set(sharding.shard_names(collection_name, saved["shards"]))
+            for name in stale:
+                try:
+                    client.delete_collection(name)
+                except ValueError:
+                    pass
+    return saved
+
+def get_slot_index(collection_name: str) -> dict:
+    """
+    HNSW parameters configured for a slot vs the ones its collections were
+    built with (`rebuild_required` once they differ).
+    """
+    options = slot_settings.get_slot_settings(collection_name)
+    configured = slot_settings.hnsw_metadata(options) or {}
+    if options["engine"] != slot_settings.ENGINE_CHROMA:
+        return {"collection": collection_name, "engine": options["engine"], "configured": configured,
+                "collections": [], "rebuild_required": False}
+    vector_db = vector_store.open_store(collection_name, AccountedEmbeddings(), CHROMA_DB_DIR)
+    collections = [
+        {"name": collection.name, "hnsw": vector_store.index_params(collection), "count": collection.count()}
+        for collection in sharding.physical_collections(vector_db._collection)
+    ]
+    return {
+        "collection": collection_name,
+        "engine": options["engine"],
+        "configured": configured,
+        "collections": collections,
+        "rebuild_required": any(c["hnsw"] != configured for c in collections),
+    }
+
+@tracing.traced("rag.rebuild_slot_index")
+def rebuild_slot_index(collection_name: str) -> dict:
+    """
+    Rebuilds the slot's Chroma collections (every shard) with its configured
+    HNSW parameters. Raises ValueError for slots without an HNSW index.
+    """
+    options = slot_settings.get_slot_settings(collection_name)
+    if options["engine"] != slot_settings.ENGINE_CHROMA:
+        raise ValueError(f"'{collection_name}' uses the {options['engine']} engine, which has no HNSW index")
+    metadata = slot_settings.hnsw_metadata(options)
+    start = time.perf_counter()
+    # Opening creates missing shards, so every physical collection exists
+    vector_store.open_store(collection_name, AccountedEmbeddings(), CHROMA_DB_DIR)
+    # Ingestion, import and deletes of the slot wait until the swap
+    with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+        rebuilt = {
+            name: vector_store.rebuild_collection(name, metadata, CHROMA_DB_DIR)
+            for name in sharding.shard_names(collection_name, options["shards"])
+        }
+    seconds = time.perf_counter() - start
+    tracing.current_span().set_attributes(collection=collection_name, records=sum(rebuilt.values()))
+    logger.info(f"Rebuilt the index of {collection_name}", extra={"collection": collection_name, "hnsw": metadata, "seconds": seconds})
+    return {"collection": collection_name, "hnsw": metadata or {}, "records": rebuilt, "seconds": round(seconds, 3)}
+
+class MaintenanceRunningError(RuntimeError):
+    pass
+
+# One maintenance run at a time (rebuilds of the same collection would race)
+_maintenance_lock = threading.Lock()
+
+def _slot_storage(collection_name: str, options: dict) -> dict:
+    if options["engine"] == slot_settings.ENGINE_NUMPY:
+        return {"numpy": numpy_store.get_collection(collection_name, CHROMA_DB_DIR).storage()}
+    if not store_maintenance.available(CHROMA_DB_DIR):
+        raise ValueError(f"The Chroma files are not in {CHROMA_DB_DIR} (remote Chroma server): storage maintenance runs on the server")
+    return {
+        "collections": [
+            store_maintenance.collection_stats(CHROMA_DB_DIR, name)
+            for name in sharding.shard_names(collection_name, options["shards"])
+        ],
+        "store": store_maintenance.store_stats(CHROMA_DB_DIR),
+    }
+
+def get_slot_storage(collection_name: str) -> dict:
+    """
+    Storage report of a slot: per collection records, HNSW tombstones and
+    metadata/index consistency, plus the SQLite file they share (size, free
+    pages, write log rows and leftovers of dropped collections a purge frees).
+    """
+    options = slot_settings.get_slot_settings(collection_name)
+    return {"collection": collection_name, "engine": options["engine"], **_slot_storage(collection_name, options)}
+
+def _compact_indexes(collection_name: str, options: dict, storage: dict, min_tombstone_ratio: float) -> dict:
+    """Rebuilds the slot's collections with deleted elements left in their HNSW graph (numpy: drops slack)."""
+    if options["engine"] == slot_settings.ENGINE_NUMPY:
+        return {"numpy_bytes_freed": numpy_store.get_collection(collection_name, CHROMA_DB_DIR).compact()}
+    client = vector_store.get_client(CHROMA_DB_DIR)
+    rebuilt = {}
+    for stats in storage["collections"]:
+        if not stats["exists"] or not stats["tombstones"] or stats["tombstone_ratio"] < min_tombstone_ratio:
+            continue
+        if stats["missing_from_index"]["count"]:
+            # The copy reads every embedding back from the index
+            logger.warning(f"Skipping the rebuild of {stats['name']}: ids missing from its index",
+                           extra={"collection": stats["name"], "missing": stats["missing_from_index"]})
+            continue
+        # Same parameters: applying new ones is the index rebuild's job
+        with vector_store.slot_write_lock(collection_name, CHROMA_DB_DIR):
+            metadata = client.get_collection(stats["name"]).metadata
+            rebuilt[stats["name"]] = vector_store.rebuild_collection(stats["name"], metadata, CHROMA_DB_DIR)
+    return {"rebuilt": rebuilt}
+
+def _compact_store(vacuum: bool, min_fragmentation: float = 0.0) -> dict:
+    purged = store_maintenance.purge(CHROMA_DB_DIR)
+    fragmentation = store_maintenance.store_stats(CHROMA_DB_DIR)["sqlite_fragmentation"]
+    vacuumed = vacuum and fragmentation > 0 and fragmentation >= min_fragmentation
+    if vacuumed:
+        store_maintenance.vacuum(CHROMA_DB_DIR)
+    return {"purged": purged, "vacuumed": vacuumed}
+
+def _reclaimed(before: dict, after: dict) -> dict:
+    if "numpy" in before:
+        keys, before, after = ("vector_bytes", "stray_bytes", "sidecar_bytes"), before["numpy"], after["numpy"]
+    else:
+        keys, before, after = ("sqlite_bytes", "segment_bytes"), before["store"], after["store"]
+    return {key: before[key] - after[key] for key in keys}
+
+@tracing.traced("rag.compact_slot")
+def compact_slot(collection_name: str, rebuild: bool = True, vacuum: bool = True) -> dict:
+    """
+    Online storage maintenance of a slot: rebuilds its HNSW indexes that hold
+    deleted elements, purges Chroma's consumed write log and the leftovers of
+    dropped collections, then VACUUMs the SQLite file (store-wide, writes wait
+    meanwhile). Returns the storage report before and after and the bytes
+    reclaimed. Raises MaintenanceRunningError while another run is going.
+    """
+    if not _maintenance_lock.acquire(blocking=False):
+        raise MaintenanceRunningError("Storage maintenance is already running")
+    try:
+        options = slot_settings.get_slot_settings(collection_name)
+        start = time.perf_counter()
+        before = _slot_storage(collection_name, options)
+        result = _compact_indexes(collection_name, options, before, 0.0) if rebuild else {}
+        if options["engine"] == slot_settings.ENGINE_CHROMA:
+            result.update(_compact_store(vacuum))
+        after = _slot_storage(collection_name, options)
+    finally:
+        _maintenance_lock.release()
+    seconds = time.perf_counter() - start
+    reclaimed = _reclaimed(before, after)
+    tracing.current_span().set_attributes(collection=collection_name, reclaimed_bytes=sum(reclaimed.values()))
+    logger.info(f"Compacted the storage of {collection_name}", extra={"collection": collection_name, "reclaimed": reclaimed, "seconds": seconds})
+    return {
+        "collection": collection_name,
+        "engine": options["engine"],
+        **result,
+        "reclaimed_bytes": reclaimed,
+        "before": before,
+        "after": after,
+        "seconds": round(seconds, 3),
+    }
+
+def _needs_compaction(storage: dict, min_tombstone_ratio: float) -> list:
+    if "numpy" in storage:
+        numpy_storage = storage["numpy"]
+        return [] if numpy_storage["capacity"] <= numpy_storage["records"] and not numpy_storage["stray_files"] else ["numpy"]
+    return [
+        stats["name"] for stats in storage["collections"]
+        if stats["exists"] and stats["tombstones"] and stats["tombstone_ratio"] >= min_tombstone_ratio
+    ]
+
+def compact_storage(min_tombstone_ratio: float, min_fragmentation: float, rebuild_indexes: bool = False) -> dict:
+    """
+    Scheduled maintenance of the whole store: purges Chroma's consumed write
+    log and VACUUMs once `min_fragmentation` of SQLite is free. Collections
+    with at least `min_tombstone_ratio` deleted elements (and numpy slots
+    with slack) are only reported under `compaction_due`, unless
+    `rebuild_indexes`: rewriting them is POST /slots/{id}/storage/compact.
+    """
+    if not _maintenance_lock.acquire(blocking=False):
+        raise MaintenanceRunningError("Storage maintenance is already running")
+    try:
+        local = store_maintenance.available(CHROMA_DB_DIR)
+        due, rebuilt, numpy_freed = {}, {}, 0
+        for name in vector_store.list_slots(CHROMA_DB_DIR):
+            options = slot_settings.get_slot_settings(name)
+            if options["engine"] == slot_settings.ENGINE_CHROMA and not local:
+                continue
+            try:
+                storage = _slot_storage(name, options)
+                if not rebuild_indexes:
+                    collections = _needs_compaction(storage, min_tombstone_ratio)
+                    if collections:
+                        due[name] = collections
+                    continue
+                result = _compact_indexes(name, options, storage, min_tombstone_ratio)
+            except Exception as e:
+                logger.warning(f"Storage maintenance of {name} failed: {e}", extra={"collection": name})
+                continue
+            rebuilt.update(result.get("rebuilt", {}))
+            numpy_freed += result.get("numpy_bytes_freed", 0)
+        if due:
+            logger.info(f"Storage maintenance: {len(due)} slots would gain from a compaction", extra={"compaction_due": due})
+        result = {"compaction_due": due, "rebuilt": rebuilt, "numpy_bytes_freed": numpy_freed}
+        if local:
+            before = store_maintenance.store_stats(CHROMA_DB_DIR)
+            result.update(_compact_store(True, min_fragmentation))
+            after = store_maintenance.store_stats(CHROMA_DB_DIR)
+            result["reclaimed_bytes"] = {key: before[key] - after[key] for key in ("sqlite_bytes", "segment_bytes")}
+        return result
+    finally:
+        _maintenance_lock.release()
+
+def create_slot(name: str, shards: int = 1, engine: str = slot_settings.ENGINE_CHROMA):
     config = get_slot_config()
     slot_id = f"nexus_slot_{uuid.uuid4().hex[:8]}"
+    options = {
+        key: value for key, value in {"shards": shards, "engine": engine}.items()
+        if value != slot_settings.DEFAULTS[key]
+    }
+    if options:
+        slot_settings.save_slot_settings(slot_id, options)
     config[slot_id] = name
     if save_slot_config(config):
         return slot_id
@@ -384,6 +713,7 @@ def delete_slot(slot_id: str):
         # 1. Delete the actual data
         reset_knowledge_base(slot_id)
         # 2. Remove from config
+        slot_settings.delete_slot_settings(slot_id)
         del config[slot_id]
         return save_slot_config(config)
     return False
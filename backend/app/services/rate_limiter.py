@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Tuple
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import pool
+from app.services import crud
+
+logger = logging.getLogger(__name__)
+
+SQLITE_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _to_sqlite_ts(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(SQLITE_TS_FORMAT)
+
+def _from_sqlite_ts(value: str) -> float:
+    return datetime.strptime(value[:19], SQLITE_TS_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+
+class SlidingWindowRateLimiter:
+    """
+    Per-user-hash sliding window kept in memory.
+    - Checks are O(1) amortized and never touch disk.
+    - Accepted hits are queued and flushed to `usage_logs` in batches by a background task.
+    - On startup the window is rebuilt from `usage_logs`, so restarts don't reset quotas.
+    """
+
+    def __init__(self, limit: int, window_seconds: float, flush_interval: float):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.flush_interval = flush_interval
+        self._hits: Dict[str, Deque[float]] = {}
+        self._pending: List[Tuple[str, str]] = []
+        # threading.Lock (not asyncio) because sync endpoints call us from the threadpool
+        self._lock = threading.Lock()
+        self._flush_task = None
+
+    def _prune(self, hits: Deque[float], now: float):
+        cutoff = now - self.window_seconds
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+
+    def acquire(self, user_hash: str) -> Tuple[bool, int]:
+        """
+        Records a hit if the user is under the limit.
+        Returns (allowed, current_usage).
+        """
+        now = time.time()
+        with self._lock:
+            hits = self._hits.get(user_hash)
+            metrics.record_cache("rate_limit_window", hits is not None)
+            if hits is None:
+                hits = self._hits[user_hash] = deque()
+            self._prune(hits, now)
+            if len(hits) >= self.limit:
+                return False, len(hits)
+            hits.append(now)
+            self._pending.append((user_hash, _to_sqlite_ts(now)))
+            return True, len(hits)
+
+    def current_usage(self, user_hash: str) -> int:
+        now = time.time()
+        with self._lock:
+            hits = self._hits.get(user_hash)
+            if not hits:
+                return 0
+            self._prune(hits, now)
+            return len(hits)
+
+    def evict_idle(self) -> int:
+        """Drops users with no hits left in the window, so memory tracks active users only."""
+        now = time.time()
+        evicted = 0
+        with self._lock:
+            for user_hash in list(self._hits):
+                self._prune(self._hits[user_hash], now)
+                if not self._hits[user_hash]:
+                    del self._hits[user_hash]
+                    evicted += 1
+        return evicted
+
+    async def load_from_db(self):
+        """Rebuilds the in-memory windows from the persisted usage logs."""
+        since = _to_sqlite_ts(time.time() - self.window_seconds)
+        async with pool.connection() as db:
+            rows = await crud.get_usage_logs_since(db, since)
+
+        with self._lock:
+            self._hits.clear()
+            for user_hash, created_at in rows:
+                self._hits.setdefault(user_hash, deque()).append(_from_sqlite_ts(created_at))
+        logger.info(f"Rate limiter state rebuilt from {len(rows)} usage logs.")
+
+    async def flush(self) -> int:
+        """Writes pending hits to SQLite in a single group commit."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        if not pending:
+            return 0
+
+        try:
+            await pool.run_write(lambda db: crud.log_usage_batch(db, pending))
+        except Exception as e:
+            logger.error(f"Rate limiter flush failed, will retry: {e}")
+            with self._lock:
+                self._pending = pending + self._pending
+            return 0
+        return len(pending)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        await self.load_from_db()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+class SharedRateLimiter:
+    """
+    Sliding window kept in the `usage_logs` table itself, for several worker
+    processes (VECTOR_STORE_MODE=server with WEB_CONCURRENCY > 1): each check
+    counts and records the hit in one IMMEDIATE transaction, so workers can't
+    both let the last allowed request through. Same interface as
+    SlidingWindowRateLimiter; one short write transaction per hit.
+    """
+
+    def __init__(self, path: str, limit: int, window_seconds: float):
+        self.path = path
+        self.limit = limit
+        self.window_seconds = window_seconds
+        # sqlite3 connections stay in the thread that opened them
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return conn
+
+    def _count(self, conn: sqlite3.Connection, user_hash: str, now: float) -> int:
+        return conn.execute(
+            "SELECT COUNT(*) FROM usage_logs WHERE session_id = ? AND created_at > ?",
+            (user_hash, _to_sqlite_ts(now - self.window_seconds))
+        ).fetchone()[0]
+
+    def acquire(self, user_hash: str) -> Tuple[bool, int]:
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            count = self._count(conn, user_hash, now)
+            if count >= self.limit:
+                conn.execute("ROLLBACK")
+                return False, count
+            conn.execute("INSERT INTO usage_logs (session_id, created_at) VALUES (?, ?)", (user_hash, _to_sqlite_ts(now)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True, count + 1
+
+    def current_usage(self, user_hash: str) -> int:
+        return self._count(self._connection(), user_hash, time.time())
+
+    def evict_idle(self) -> int:
+        # Nothing held in memory
+        return 0
+
+    async def flush(self) -> int:
+        # Hits are written as they are accepted
+        return 0
+
+    async def start(self):
+        logger.info("Rate limiter shares usage_logs with the other workers.")
+
+    async def stop(self):
+        pass
+
+def _build_rate_limiter():
+    window_seconds = timedelta(hours=settings.LOG_RETENTION_HOURS).total_seconds()
+    # Several processes serve requests only with a Chroma server; in-memory windows would be per worker
+    if settings.VECTOR_STORE_MODE == "server":
+        return SharedRateLimiter(pool.path, settings.MAX_REQUESTS_LIMIT, window_seconds)
+    return SlidingWindowRateLimiter(
+        limit=settings.MAX_REQUESTS_LIMIT,
+        window_seconds=window_seconds,
+        flush_interval=settings.RATE_LIMIT_FLUSH_SECONDS,
+    )
+
+rate_limiter = _build_rate_limiter()
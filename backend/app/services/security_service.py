@@ -1,11 +1,11 @@
-from datetime import datetime, timedelta
-import aiosqlite
 from fastapi import HTTPException, status
 
 from app.core.config import settings
 from app.core.security import hash_user_id, encrypt_data, decrypt_data
+from app.schemas import UsageMetadata
 from app.services import crud
-from app.core.database import DB_PATH
+from app.services.rate_limiter import rate_limiter
+from app.core.database import pool
 
 class RateLimitExceeded(HTTPException):
     def __init__(self):
@@ -14,65 +14,76 @@ class RateLimitExceeded(HTTPException):
             detail="Rate limit exceeded. Daily limit reached."
         )
 
+def consume_quota(user_id: str) -> UsageMetadata:
+    """
+    Counts one interaction against the user's daily quota (in memory; in
+    server mode a short write to usage_logs, shared by the workers).
+    Returns the updated usage metadata.
+    Raises RateLimitExceeded if blocked.
+    """
+    user_hash = hash_user_id(user_id)
+    allowed, count = rate_limiter.acquire(user_hash)
+    if not allowed:
+        raise RateLimitExceeded()
+    return _build_usage(count)
+
 async def validate_user_access(user_id: str) -> str:
     """
     Checks rate limits for a user.
     Returns the hashed user ID if allowed.
     Raises RateLimitExceeded if blocked.
     """
-    user_hash = hash_user_id(user_id)
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Calculate cutoff for 24h window
-        since = (datetime.utcnow() - timedelta(hours=settings.LOG_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Check usage
-        count = await crud.get_usage_count_since(db, user_hash, since)
-        if count >= settings.MAX_REQUESTS_LIMIT:
-            raise RateLimitExceeded()
-            
-        # Log this new interaction
-        await crud.log_usage(db, user_hash)
-        
-    return user_hash
+    consume_quota(user_id)
+    return hash_user_id(user_id)
 
-async def save_secure_message(user_id: str, role: str, content: str):
-    """Encrypts and saves a message to the ephemeral chat storage."""
-    # We re-hash here to be safe, or we could pass the hash. 
-    # Hashing is fast enough to do again.
-    user_hash = hash_user_id(user_id)
+# chat_sessions key prefix of admin UI conversations
+UI_SESSION_PREFIX = "ui:"
+
+def session_key(user_id: str = None, ui_session_id: str = None) -> str:
+    """
+    Key a conversation is stored under in chat_sessions: the hashed user_id,
+    or for the admin UI (no user_id) its hashed session id, prefixed.
+    """
+    if user_id:
+        return hash_user_id(user_id)
+    return f"{UI_SESSION_PREFIX}{hash_user_id(ui_session_id)}"
+
+async def save_secure_message(session: str, role: str, content: str):
+    """Encrypts and saves a message to the ephemeral chat storage (`session` from session_key)."""
     encrypted = encrypt_data(content)
     
-    async with aiosqlite.connect(DB_PATH) as db:
-        await crud.create_chat_session(db, user_hash, role, encrypted)
+    await pool.run_write(lambda db: crud.create_chat_session(db, session, role, encrypted))
 
-async def get_secure_history(user_id: str):
-    """Retrieves and decrypts chat history for a user."""
-    user_hash = hash_user_id(user_id)
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        rows = await crud.get_chat_history(db, user_hash)
+async def get_secure_history(session: str):
+    """Retrieves and decrypts the chat history stored under `session`."""
+    async with pool.connection() as db:
+        rows = await crud.get_chat_history(db, session)
         
     history = []
-    for role, encrypted_content in rows:
+    for message_id, role, encrypted_content in rows:
         decrypted = decrypt_data(encrypted_content)
-        history.append({"role": role, "content": decrypted})
+        history.append({"id": message_id, "role": role, "content": decrypted})
         
     return history
 
-from app.schemas import UsageMetadata
+async def replace_secure_messages(session: str, message_ids: list, role: str, content: str):
+    """
+    Atomically deletes the given messages and stores `content` in their place
+    (same transaction, so readers never see both or neither).
+    """
+    encrypted = encrypt_data(content)
+
+    async def _replace(db):
+        await crud.delete_chat_messages(db, session, message_ids)
+        await crud.create_chat_session(db, session, role, encrypted)
+
+    await pool.run_write(_replace)
 
 async def get_usage_stats(user_id: str) -> UsageMetadata:
     """Calculates usage statistics for a user."""
-    user_hash = hash_user_id(user_id)
-    
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Calculate cutoff for 24h window
-        since = (datetime.utcnow() - timedelta(hours=settings.LOG_RETENTION_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Check usage
-        count = await crud.get_usage_count_since(db, user_hash, since)
-        
+    return _build_usage(rate_limiter.current_usage(hash_user_id(user_id)))
+
+def _build_usage(count: int) -> UsageMetadata:
     limit = settings.MAX_REQUESTS_LIMIT
     remaining = max(0, limit - count)
     
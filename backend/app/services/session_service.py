@@ -0,0 +1,79 @@
+import logging
+from typing import List, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services import security_service
+from app.services.chat_service import summarize_conversation
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_ROLE = "summary"
+
+# Sessions being compacted right now (one compaction per session at a time)
+_compacting = set()
+
+def _split_history(messages: List[dict]) -> Tuple[Optional[dict], List[dict]]:
+    """
+    Splits decrypted rows into (latest summary row, exchanges).
+    Each exchange is {"user", "assistant", "ids"}, the shape get_answer expects.
+    """
+    summary = None
+    exchanges = []
+    pending_user = None
+    for message in messages:
+        if message["role"] == SUMMARY_ROLE:
+            summary = message
+        elif message["role"] == "user":
+            pending_user = message
+        elif message["role"] == "assistant" and pending_user is not None:
+            exchanges.append({
+                "user": pending_user["content"],
+                "assistant": message["content"],
+                "ids": [pending_user["id"], message["id"]],
+            })
+            pending_user = None
+    return summary, exchanges
+
+async def load_session(session: str) -> Tuple[Optional[str], List[dict]]:
+    """Returns (rolling summary, recent exchanges) of a server-side session (key from security_service.session_key)."""
+    messages = await security_service.get_secure_history(session)
+    summary, exchanges = _split_history(messages)
+    return (summary["content"] if summary else None), exchanges
+
+async def append_exchange(session: str, query: str, answer: str):
+    """Stores the new turn (encrypted). Sequential so user always precedes assistant."""
+    await security_service.save_secure_message(session, "user", query)
+    await security_service.save_secure_message(session, "assistant", answer)
+
+async def compact_session(session: str):
+    """
+    Folds exchanges older than the window into the rolling summary.
+    Meant to run after the response is sent (BackgroundTasks), so the extra LLM
+    call never adds latency to the chat reply.
+    """
+    if session in _compacting:
+        return
+    _compacting.add(session)
+    try:
+        messages = await security_service.get_secure_history(session)
+        summary_row, exchanges = _split_history(messages)
+        window = settings.SESSION_WINDOW_TURNS
+        if len(exchanges) <= window:
+            return
+
+        overflow = exchanges[:-window]
+        previous_summary = summary_row["content"] if summary_row else None
+        new_summary = await run_in_threadpool(summarize_conversation, previous_summary, overflow)
+
+        # Replace the compacted turns and every old summary row with the new summary
+        stale_ids = [m["id"] for m in messages if m["role"] == SUMMARY_ROLE]
+        for exchange in overflow:
+            stale_ids.extend(exchange["ids"])
+        await security_service.replace_secure_messages(session, stale_ids, SUMMARY_ROLE, new_summary)
+    except Exception as e:
+        # Not fatal: the turns stay verbatim and we retry on the next message
+        logger.error(f"Session compaction failed: {e}")
+    finally:
+        _compacting.discard(session)
@@ -0,0 +1,172 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from app.core import tracing
+from app.core.config import settings
+
+# Physical collection of shard i: "<slot>__shard<i>" (a slot with one shard is its own collection)
+SHARD_SUFFIX = "__shard"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def shard_names(collection_name: str, shards: int) -> List[str]:
+    if shards <= 1:
+        return [collection_name]
+    return [f"{collection_name}{SHARD_SUFFIX}{i}" for i in range(shards)]
+
+def is_shard_name(name: str, collection_name: str) -> bool:
+    prefix = f"{collection_name}{SHARD_SUFFIX}"
+    return name.startswith(prefix) and name[len(prefix):].isdigit()
+
+def slot_name(name: str) -> str:
+    """Slot a physical collection belongs to."""
+    prefix, separator, index = name.rpartition(SHARD_SUFFIX)
+    return prefix if separator and index.isdigit() else name
+
+def shard_of(record_id: str, shards: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    digest = hashlib.blake2b(str(record_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % shards
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Separate from the request threadpool: a request thread waits on its shard calls here
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.SHARD_FANOUT_WORKERS, thread_name_prefix="shard")
+    return _executor
+
+def physical_collections(collection) -> list:
+    """The chromadb collections behind a (possibly sharded) collection."""
+    return list(collection.collections) if isinstance(collection, ShardedCollection) else [collection]
+
+class ShardedCollection:
+    """
+    A slot split across several Chroma collections, behind the subset of the
+    chromadb Collection API the app (and LangChain's Chroma) uses. Records go
+    to the shard picked by a stable hash of their id; writes to different
+    shards and every read run concurrently, and queries merge the shards'
+    top-k by distance (all shards share the same embedding space and metric).
+    """
+
+    def __init__(self, name: str, collections: list):
+        self.name = name
+        self.collections = collections
+        self.metadata = collections[0].metadata
+
+    @property
+    def id(self):
+        return self.collections[0].id
+
+    def _map(self, operation: str, calls: list) -> list:
+        """Runs [(shard index, fn)] concurrently; returns the results in the same order."""
+        with tracing.span("chroma.shards", collection=self.name, operation=operation, shards=len(calls)):
+            if len(calls) == 1:
+                return [calls[0][1]()]
+            executor = _get_executor()
+            futures = [executor.submit(tracing.wrap(fn)) for _, fn in calls]
+            return [future.result() for future in futures]
+
+    def _route(self, ids: list) -> dict:
+        """shard index -> positions in `ids`"""
+        routed = {}
+        for position, record_id in enumerate(ids):
+            routed.setdefault(shard_of(record_id, len(self.collections)), []).append(position)
+        return routed
+
+    def _write(self, method: str, ids: list, **columns):
+        calls = []
+        for shard, positions in self._route(ids).items():
+            part = {
+                key: [values[p] for p in positions] if values is not None else None
+                for key, values in columns.items()
+            }
+            part_ids = [ids[p] for p in positions]
+            target = getattr(self.collections[shard], method)
+            calls.append((shard, lambda target=target, part_ids=part_ids, part=part: target(ids=part_ids, **part)))
+        if calls:
+            self._map(method, calls)
+
+    def upsert(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        self._write("upsert", list(ids), embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def add(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        self._write("add", list(ids), embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def update(self, ids, embeddings=None, metadatas=None, documents=None, **kwargs):
+        self._write("update", list(ids), embeddings=embeddings, metadatas=metadatas, documents=documents)
+
+    def count(self) -> int:
+        return sum(self._map("count", [(i, c.count) for i, c in enumerate(self.collections)]))
+
+    def get(self, ids=None, where=None, limit=None, offset=None, where_document=None, **kwargs):
+        if ids is not None:
+            ids = [ids] if isinstance(ids, str) else list(ids)
+            targets = {shard: [ids[p] for p in positions] for shard, positions in self._route(ids).items()}
+        else:
+            targets = {shard: None for shard in range(len(self.collections))}
+        # Every shard may hold the first `offset + limit` records: fetch that much, slice after merging
+        shard_limit = (limit + (offset or 0)) if limit is not None else None
+        calls = [
+            (shard, lambda c=self.collections[shard], shard_ids=shard_ids: c.get(
+                ids=shard_ids, where=where, limit=shard_limit, where_document=where_document, **kwargs
+            ))
+            for shard, shard_ids in targets.items()
+        ]
+        results = self._map("get", calls) if calls else []
+        merged = {"ids": []}
+        for result in results:
+            for key, values in result.items():
+                if values is None:
+                    merged.setdefault(key, None)
+                elif merged.get(key) is None:
+                    merged[key] = list(values)
+                else:
+                    merged[key].extend(values)
+        if offset or limit is not None:
+            end = (offset or 0) + limit if limit is not None else None
+            merged = {key: values[offset or 0:end] if values is not None else None for key, values in merged.items()}
+        return merged
+
+    def delete(self, ids=None, where=None, where_document=None, **kwargs):
+        if ids is not None:
+            ids = [ids] if isinstance(ids, str) else list(ids)
+            targets = {shard: [ids[p] for p in positions] for shard, positions in self._route(ids).items()}
+        else:
+            targets = {shard: None for shard in range(len(self.collections))}
+        self._map("delete", [
+            (shard, lambda c=self.collections[shard], shard_ids=shard_ids: c.delete(
+                ids=shard_ids, where=where, where_document=where_document, **kwargs
+            ))
+            for shard, shard_ids in targets.items()
+        ])
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None, where_document=None, **kwargs):
+        results = self._map("query", [
+            (i, lambda c=c: c.query(
+                query_embeddings=query_embeddings, query_texts=query_texts, n_results=n_results,
+                where=where, where_document=where_document, **kwargs
+            ))
+            for i, c in enumerate(self.collections)
+        ])
+        # Global top-k per query: the k nearest across every shard's local top-k
+        keys = [key for key in results[0].keys() if key != "distances"]
+        merged = {key: None if results[0][key] is None else [] for key in keys}
+        merged["distances"] = []
+        for q in range(len(results[0]["ids"])):
+            hits = [
+                (distance, r, position)
+                for r, result in enumerate(results)
+                for position, distance in enumerate(result["distances"][q])
+            ]
+            hits.sort(key=lambda hit: hit[0])
+            hits = hits[:n_results]
+            merged["distances"].append([distance for distance, _, _ in hits])
+            for key in keys:
+                if merged[key] is not None:
+                    merged[key].append([results[r][key][q][position] for _, r, position in hits])
+        return merged
@@ -0,0 +1,455 @@
+import asyncio
+import logging
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import pool
+from app.services import crud, vector_store
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DB_DIR = "/app/chroma_db"
+# collection_name that routes the query to the most likely slots
+AUTO_COLLECTION = "auto"
+# Every worker must project with the same matrix
+PROJECTION_SEED = 20240601
+KMEANS_ITERATIONS = 10
+# Contiguous reads a rebuild's sample of each collection is made of
+SAMPLE_WINDOWS = 8
+
+def _unit(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def sample_embeddings(collection, sample_size: int, rng: np.random.Generator = None) -> list:
+    """
+    Up to `sample_size` embeddings spread over a slot: each shard gets a share
+    by its size, read as SAMPLE_WINDOWS windows at random offsets, one per
+    stratum (get(limit) alone returns the oldest records of the first shard).
+    """
+    rng = rng or np.random.default_rng()
+    parts = getattr(collection, "collections", None) or [collection]
+    counts = [part.count() for part in parts]
+    total = sum(counts)
+    if not total:
+        return []
+    sample = []
+    for part, count in zip(parts, counts):
+        want = min(count, max(1, int(round(sample_size * count / total))))
+        if not want:
+            continue
+        if want >= count:
+            sample.extend(part.get(include=["embeddings"])["embeddings"])
+            continue
+        windows = min(SAMPLE_WINDOWS, want)
+        stratum = count // windows
+        for i in range(windows):
+            size = want // windows + (1 if i < want % windows else 0)
+            offset = i * stratum + int(rng.integers(0, max(stratum - size, 0) + 1))
+            sample.extend(part.get(limit=size, offset=offset, include=["embeddings"])["embeddings"])
+    return sample
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0):
+    """Spherical k-means on unit vectors. Returns (member means, member counts) of the non-empty codes."""
+    k = min(k, len(vectors))
+    rng = np.random.default_rng(seed)
+    centers = vectors[rng.choice(len(vectors), k, replace=False)]
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centers.T, axis=1)
+        for j in range(k):
+            members = vectors[labels == j]
+            if len(members):
+                centers[j] = _unit(members.mean(axis=0))[0]
+    labels = np.argmax(vectors @ centers.T, axis=1)
+    means, counts = [], []
+    for j in range(k):
+        members = vectors[labels == j]
+        if len(members):
+            means.append(members.mean(axis=0, dtype=np.float64).astype(np.float32))
+            counts.append(len(members))
+    return means, counts
+
+class _RoutingIndex:
+    """Immutable snapshot the router searches (swapped whole on rebuild, so routing takes no lock)."""
+
+    def __init__(self, names: list, full: np.ndarray, slot_rows: np.ndarray,
+                 coarse: Optional[np.ndarray], projection: Optional[np.ndarray]):
+        self.names = names
+        self.full = full              # unit centroids of every code, (codes, dim) float32
+        self.slot_rows = slot_rows    # (slots, max codes) rows of each slot in `full`, padded by repeating one
+        # Coarse pass: the codes projected and laid out code-major, (max codes * slots, projected dim),
+        # so the best code per slot is a max over contiguous blocks
+        self.coarse = coarse
+        self.projection = projection
+        self.dim = full.shape[1] if len(full) else 0
+        self.built_at = time.time()
+
+class SlotRouter:
+    """
+    Routes a query vector to the slots most likely to answer it ("auto"
+    collection mode). Every slot is summarised by up to ROUTER_CODES_PER_SLOT
+    centroids (a small spherical k-means codebook) kept in SQLite:
+    - ingest/import/delete/reset update the codes incrementally (each vector
+      joins its nearest code), buffered in memory and flushed every
+      ROUTER_REFRESH_SECONDS, like token usage;
+    - the `slot_routing_rebuild` job re-clusters slots that were never
+      clustered or drifted by more than ROUTER_REBUILD_DRIFT since;
+    - every worker reloads the table when it changes and rebuilds an
+      in-memory index off the request path.
+    A query is scored against a random projection of the codes
+    (ROUTER_PROJECTION_DIM) and the ROUTER_SHORTLIST best slots are rescored
+    exactly, so routing stays well under a millisecond with thousands of slots.
+    """
+
+    def __init__(self, codes_per_slot: int, projection_dim: int, shortlist: int, refresh_interval: float):
+        self.codes_per_slot = codes_per_slot
+        self.projection_dim = projection_dim
+        self.shortlist = shortlist
+        self.refresh_interval = refresh_interval
+        self._slots: Dict[str, dict] = {}       # snapshot: {collection: {"codes": {code: [centroid, vectors]}, "built": n}}
+        self._deltas: Dict[str, dict] = {}      # {collection: {code: [sum, count]}} not flushed yet
+        self._replaced: Dict[str, dict] = {}    # whole-slot replacements (rebuild/reset) not flushed yet
+        self._lock = threading.Lock()
+        self._version = None
+        self._index: Optional[_RoutingIndex] = None
+        self._rows_cache: Dict[str, tuple] = {}
+        self._projections: Dict[int, np.ndarray] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.routes = 0
+        self.route_seconds = 0.0
+        self.max_route_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ROUTER_ENABLED
+
+    # --- Incremental updates (called from ingestion, in the threadpool) ---
+    def _centers(self, collection: str) -> Dict[int, np.ndarray]:
+        """Current codes of a slot: snapshot (or pending replacement) plus pending deltas."""
+        entry = self._replaced.get(collection) or self._slots.get(collection) or {"codes": {}}
+        totals = {
+            code: [centroid.astype(np.float64) * vectors, vectors]
+            for code, (centroid, vectors) in entry["codes"].items()
+        }
+        for code, (total, count) in self._deltas.get(collection, {}).items():
+            current = totals.get(code)
+            if current is None or current[0].shape != total.shape:
+                totals[code] = [total.copy(), count]
+            else:
+                current[0] = current[0] + total
+                current[1] += count
+        return {code: _unit(total)[0] for code, (total, count) in totals.items() if count > 0}
+
+    def _add_delta(self, collection: str, code: int, total: np.ndarray, count: int):
+        delta = self._deltas.setdefault(collection, {})
+        current = delta.get(code)
+        if current is None:
+            delta[code] = [total.astype(np.float64), count]
+        else:
+            current[0] = current[0] + total
+            current[1] += count
+
+    def _assign(self, collection: str, vectors: np.ndarray, sign: int) -> bool:
+        centers = self._centers(collection)
+        if not centers:
+            return False
+        codes = list(centers)
+        labels = np.argmax(vectors @ np.stack([centers[code] for code in codes]).T, axis=1)
+        for position, code in enumerate(codes):
+            members = vectors[labels == position]
+            if len(members):
+                self._add_delta(collection, code, sign * members.sum(axis=0, dtype=np.float64), sign * len(members))
+        return True
+
+    def record_added(self, collection: str, vectors: list):
+        if not self.enabled or vectors is None or len(vectors) == 0:
+            return
+        vectors = _unit(vectors)
+        with self._lock:
+            if not self._assign(collection, vectors, 1):
+                # New slot: seed the codebook from this batch (re-clustered later by the rebuild job)
+                means, counts = kmeans(vectors, self.codes_per_slot)
+                for code, (mean, count) in enumerate(zip(means, counts)):
+                    self._add_delta(collection, code, mean.astype(np.float64) * count, count)
+
+    def record_removed(self, collection: str, vectors: list):
+        if not self.enabled or vectors is None or len(vectors) == 0:
+            return
+        with self._lock:
+            self._assign(collection, _unit(vectors), -1)
+
+    def record_reset(self, collection: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._replaced[collection] = {"codes": {}, "built": 0}
+            self._deltas.pop(collection, None)
+
+    # --- Re-clustering ---
+    def rebuild_slot(self, collection: str) -> dict:
+        """
+        Re-clusters a slot from (a sample of up to ROUTER_SAMPLE_SIZE of) its
+        stored vectors. Blocking: run it in the threadpool.
+        """
+        store = vector_store.open_store(collection, None, CHROMA_DB_DIR)
+        total = store._collection.count()
+        if not total:
+            with self._lock:
+                known = collection in self._slots or collection in self._deltas
+            if known:
+                self.record_reset(collection)
+            return {"collection": collection, "vectors": 0, "codes": 0}
+        sample = sample_embeddings(store._collection, settings.ROUTER_SAMPLE_SIZE)
+        means, counts = kmeans(_unit(sample), self.codes_per_slot)
+        scale = total / len(sample)
+        codes = {code: [mean, max(1, int(round(count * scale)))] for code, (mean, count) in enumerate(zip(means, counts))}
+        with self._lock:
+            self._replaced[collection] = {"codes": codes, "built": total}
+            self._deltas.pop(collection, None)
+        return {"collection": collection, "vectors": total, "codes": len(codes)}
+
+    def _needs_rebuild(self, collection: str) -> bool:
+        entry = self._slots.get(collection)
+        if entry is None or not entry["codes"]:
+            return True
+        built = entry["built"]
+        if not built:
+            # Seeded from the first ingested batch only
+            return True
+        vectors = sum(count for _, count in entry["codes"].values())
+        return abs(vectors - built) > built * settings.ROUTER_REBUILD_DRIFT
+
+    async def rebuild(self, collection: str = None) -> dict:
+        """Re-clusters one slot, or (scheduled job) every slot that needs it."""
+        if collection is not None:
+            names = [collection]
+        else:
+            names = await run_in_threadpool(vector_store.list_slots, CHROMA_DB_DIR)
+            names = [name for name in names if name != AUTO_COLLECTION and self._needs_rebuild(name)]
+        rebuilt = []
+        for name in names:
+            try:
+                result = await run_in_threadpool(self.rebuild_slot, name)
+            except Exception as e:
+                logger.warning(f"Routing rebuild of slot {name} failed: {e}")
+                continue
+            if result["codes"]:
+                rebuilt.append(name)
+        await self.refresh()
+        if rebuilt:
+            logger.info(f"Re-clustered routing codes of {len(rebuilt)} slots", extra={"collections": rebuilt[:20]})
+        return {"rebuilt": rebuilt, "checked": len(names)}
+
+    # --- Persistence ---
+    async def flush(self) -> int:
+        with self._lock:
+            replaced, self._replaced = self._replaced, {}
+            deltas, self._deltas = self._deltas, {}
+        if not replaced and not deltas:
+            return 0
+        now = time.time()
+
+        async def write(db):
+            for collection, entry in replaced.items():
+                rows = [
+                    (code, vectors, np.asarray(centroid, dtype=np.float32).tobytes(), entry["built"])
+                    for code, (centroid, vectors) in entry["codes"].items()
+                ]
+                await crud.replace_slot_centroids(db, collection, rows, now)
+            for collection, codes in deltas.items():
+                for code, (total, count) in codes.items():
+                    row = await crud.get_slot_centroid(db, collection, code)
+                    vectors, built, base = 0, 0, 0.0
+                    if row is not None:
+                        stored = np.frombuffer(row[1], dtype=np.float32)
+                        if stored.shape == total.shape:
+                            vectors, base, built = row[0], stored.astype(np.float64) * row[0], row[2]
+                    new_count = vectors + count
+                    if new_count <= 0:
+                        await crud.delete_slot_centroid(db, collection, code)
+                        continue
+                    centroid = ((base + total) / new_count).astype(np.float32)
+                    await crud.upsert_slot_centroid(db, collection, code, new_count, centroid.tobytes(), built, now)
+
+        try:
+            await pool.run_write(write)
+        except Exception as e:
+            logger.error(f"Slot routing flush failed, will retry: {e}")
+            with self._lock:
+                for collection, entry in replaced.items():
+                    self._replaced.setdefault(collection, entry)
+                for collection, codes in deltas.items():
+                    if collection in self._replaced and collection not in replaced:
+                        continue
+                    for code, (total, count) in codes.items():
+                        self._add_delta(collection, code, total, count)
+            return 0
+        return len(replaced) + sum(len(codes) for codes in deltas.values())
+
+    def _load(self, rows: list):
+        slots = {}
+        for collection, code, vectors, centroid, built in rows:
+            entry = slots.setdefault(collection, {"codes": {}, "built": built, "signature": []})
+            entry["codes"][code] = [np.frombuffer(centroid, dtype=np.float32), vectors]
+            entry["signature"].append((code, vectors, zlib.crc32(centroid)))
+        with self._lock:
+            self._slots = slots
+
+    def _projection(self, dim: int) -> Optional[np.ndarray]:
+        if self.projection_dim <= 0 or self.projection_dim >= dim:
+            return None
+        if dim not in self._projections:
+            rng = np.random.default_rng(PROJECTION_SEED)
+            self._projections[dim] = (rng.standard_normal((dim, self.projection_dim)) / np.sqrt(self.projection_dim)).astype(np.float32)
+        return self._projections[dim]
+
+    def _build_index(self):
+        slots = self._slots
+        dims = {}
+        for collection, entry in slots.items():
+            for centroid, _ in entry["codes"].values():
+                dims[len(centroid)] = dims.get(len(centroid), 0) + 1
+        if not dims:
+            self._index = _RoutingIndex([], np.zeros((0, 0), np.float32), np.zeros((0, 0), np.int64), None, None)
+            return
+        # One embedding model per deployment; anything else cannot be compared
+        dim = max(dims, key=dims.get)
+        projection = self._projection(dim)
+        names, full_parts, low_parts, slot_rows = [], [], [], []
+        rows_cache, offset = {}, 0
+        for collection in sorted(slots):
+            entry = slots[collection]
+            centroids = [centroid for centroid, count in entry["codes"].values() if len(centroid) == dim and count > 0]
+            if not centroids:
+                continue
+            signature = tuple(entry["signature"])
+            cached = self._rows_cache.get(collection)
+            if cached is not None and cached[0] == signature:
+                full, low = cached[1], cached[2]
+            else:
+                full = _unit(np.stack(centroids))
+                low = full @ projection if projection is not None else None
+            rows_cache[collection] = (signature, full, low)
+            names.append(collection)
+            full_parts.append(full)
+            low_parts.append(low if low is not None else full)
+            slot_rows.append(list(range(offset, offset + len(full))))
+            offset += len(full)
+        self._rows_cache = rows_cache
+        if not names:
+            self._index = _RoutingIndex([], np.zeros((0, dim), np.float32), np.zeros((0, 0), np.int64), None, None)
+            return
+        width = max(len(rows) for rows in slot_rows)
+        slot_rows = np.array([rows + [rows[0]] * (width - len(rows)) for rows in slot_rows], dtype=np.int64)
+        low_rows = np.concatenate(low_parts)
+        self._index = _RoutingIndex(
+            names,
+            np.ascontiguousarray(np.concatenate(full_parts)),
+            slot_rows,
+            np.ascontiguousarray(low_rows[slot_rows.T.ravel()]),
+            projection,
+        )
+
+    async def refresh(self):
+        """Flushes local updates, reloads the table if any worker changed it and rebuilds the index."""
+        await self.flush()
+        async with pool.connection() as db:
+            version = await crud.get_slot_centroids_version(db)
+            if version == self._version and self._index is not None:
+                return
+            rows = await crud.get_slot_centroids(db)
+        self._load(rows)
+        await run_in_threadpool(self._build_index)
+        self._version = version
+
+    # --- Routing ---
+    def route(self, embedding, top_n: int = None) -> List[dict]:
+        """The `top_n` slots whose codes are closest to the query, best first, with their cosine score."""
+        index = self._index
+        if index is None or not index.names:
+            return []
+        start = time.perf_counter()
+        query = _unit(embedding)[0]
+        if len(query) != index.dim:
+            return []
+        count = len(index.names)
+        top_n = min(top_n or settings.ROUTER_TOP_N, count)
+        shortlist = max(self.shortlist, top_n)
+        if count <= shortlist:
+            candidates = np.arange(count)
+        else:
+            # Coarse pass: best code per slot in the projected space
+            projected = query @ index.projection if index.projection is not None else query
+            per_slot = (index.coarse @ projected).reshape(-1, count).max(axis=0)
+            candidates = np.argpartition(-per_slot, shortlist)[:shortlist]
+        # Exact cosine of the shortlisted slots' codes
+        rows = index.slot_rows[candidates]
+        scores = (index.full[rows.ravel()] @ query).reshape(rows.shape).max(axis=1)
+        order = np.argsort(-scores)[:top_n]
+        routed = [{"collection": index.names[candidates[i]], "score": round(float(scores[i]), 4)} for i in order]
+        elapsed = time.perf_counter() - start
+        self.routes += 1
+        self.route_seconds += elapsed
+        self.max_route_seconds = max(self.max_route_seconds, elapsed)
+        return routed
+
+    def stats(self) -> dict:
+        index = self._index
+        slots = self._slots
+        return {
+            "enabled": self.enabled,
+            "slots": len(index.names) if index else 0,
+            "codes": len(index.full) if index else 0,
+            "dim": index.dim if index else 0,
+            "projection_dim": index.projection.shape[1] if index is not None and index.projection is not None else None,
+            "index_built_at": index.built_at if index else None,
+            "routes": self.routes,
+            "avg_route_ms": round(self.route_seconds / self.routes * 1000, 4) if self.routes else None,
+            "max_route_ms": round(self.max_route_seconds * 1000, 4) if self.routes else None,
+            "collections": {
+                collection: {
+                    "codes": len(entry["codes"]),
+                    "vectors": sum(count for _, count in entry["codes"].values()),
+                    "built_vectors": entry["built"],
+                }
+                for collection, entry in sorted(slots.items())
+            },
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Slot routing refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self.flush()
+
+slot_router = SlotRouter(
+    codes_per_slot=settings.ROUTER_CODES_PER_SLOT,
+    projection_dim=settings.ROUTER_PROJECTION_DIM,
+    shortlist=settings.ROUTER_SHORTLIST,
+    refresh_interval=settings.ROUTER_REFRESH_SECONDS,
+)
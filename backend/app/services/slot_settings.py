@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Storage options per slot, next to slots.json (which stays {slot_id: name}:
+# the frontend reads and posts it back as a whole)
+CHROMA_DB_DIR = "/app/chroma_db"
+SETTINGS_FILE = "slot_settings.json"
+
+# Vector backends: Chroma (HNSW) or exact in-process search (app/services/numpy_store.py)
+ENGINE_CHROMA = "chroma"
+ENGINE_NUMPY = "numpy"
+ENGINES = (ENGINE_CHROMA, ENGINE_NUMPY)
+
+# HNSW parameters of the slot's Chroma collections -> collection metadata key.
+# None keeps Chroma's default; fixed when a collection is created (or rebuilt).
+HNSW_SETTINGS = {
+    "hnsw_space": "hnsw:space",
+    "hnsw_m": "hnsw:M",
+    "hnsw_construction_ef": "hnsw:construction_ef",
+    "hnsw_search_ef": "hnsw:search_ef",
+}
+SPACES = ("l2", "cosine", "ip")
+HNSW_LIMITS = {"hnsw_m": (2, 128), "hnsw_construction_ef": (1, 2000), "hnsw_search_ef": (1, 2000)}
+
+DEFAULTS = {
+    "shards": 1,
+    "engine": ENGINE_CHROMA,
+    **{key: None for key in HNSW_SETTINGS},
+}
+MAX_SHARDS = 32
+
+_cache = {"mtime": None, "data": {}}
+_lock = threading.Lock()
+
+def _path() -> str:
+    return os.path.join(CHROMA_DB_DIR, SETTINGS_FILE)
+
+def load_all() -> dict:
+    """Stored settings of every slot. Re-read only when the file changed (another worker may write it)."""
+    path = _path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _cache["mtime"] != mtime:
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading slot settings from {path}: {e}")
+            return {}
+        _cache.update(mtime=mtime, data=data)
+    return _cache["data"]
+
+def get_slot_settings(collection_name: str) -> dict:
+    """Settings of one slot, defaults filled in (collections without an entry use the defaults)."""
+    return {**DEFAULTS, **load_all().get(collection_name, {})}
+
+def validate(updates: dict, current: dict = None) -> dict:
+    """Checks `updates` (merged over `current`, a slot's settings, when given). Raises ValueError."""
+    unknown = set(updates) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown slot settings: {sorted(unknown)}")
+    if "shards" in updates:
+        shards = updates["shards"]
+        if not isinstance(shards, int) or isinstance(shards, bool) or not 1 <= shards <= MAX_SHARDS:
+            raise ValueError(f"shards must be an integer between 1 and {MAX_SHARDS}")
+    if "engine" in updates and updates["engine"] not in ENGINES:
+        raise ValueError(f"engine must be one of {list(ENGINES)}")
+    if updates.get("hnsw_space") is not None and updates["hnsw_space"] not in SPACES:
+        raise ValueError(f"hnsw_space must be one of {list(SPACES)}")
+    for key, (low, high) in HNSW_LIMITS.items():
+        value = updates.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high):
+            raise ValueError(f"{key} must be an integer between {low} and {high} (or null for Chroma's default)")
+    merged = {**DEFAULTS, **(current or {}), **updates}
+    if merged["engine"] == ENGINE_NUMPY and merged["shards"] > 1:
+        raise ValueError("The numpy engine keeps a slot in one matrix: shards must be 1")
+    return updates
+
+def hnsw_metadata(options: dict) -> Optional[dict]:
+    """Collection metadata for a slot's settings (None: all of Chroma's defaults)."""
+    metadata = {HNSW_SETTINGS[key]: options[key] for key in HNSW_SETTINGS if options.get(key) is not None}
+    return metadata or None
+
+def _write(data: dict):
+    os.makedirs(CHROMA_DB_DIR, exist_ok=True)
+    path = _path()
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def save_slot_settings(collection_name: str, updates: dict) -> dict:
+    """Merges `updates` into the slot's settings. Returns the resulting settings."""
+    validate(updates, get_slot_settings(collection_name))
+    with _lock:
+        data = dict(load_all())
+        data[collection_name] = {**data.get(collection_name, {}), **updates}
+        _write(data)
+    logger.info("Saved slot settings", extra={"collection": collection_name, "settings": data[collection_name]})
+    return get_slot_settings(collection_name)
+
+def delete_slot_settings(collection_name: str):
+    with _lock:
+        data = dict(load_all())
+        if data.pop(collection_name, None) is not None:
+            _write(data)
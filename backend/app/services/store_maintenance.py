@@ -0,0 +1,224 @@
+import logging
+import os
+import pickle
+import shutil
+import sqlite3
+import struct
+from contextlib import closing
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Chroma 0.4's files under the persist directory: one SQLite database (collections,
+# segments, the write log `embeddings_queue` and the metadata segments' rows) and
+# one folder per HNSW vector segment, named after the segment id.
+SQLITE_FILE = "chroma.sqlite3"
+INDEX_HEADER_FILE = "header.bin"
+INDEX_METADATA_FILE = "index_metadata.pickle"
+# Start of chroma-hnswlib's header.bin: version, offsetLevel0, max_elements, cur_element_count
+INDEX_HEADER = struct.Struct("<iQQQ")
+VECTOR_SCOPE = "VECTOR"
+METADATA_SCOPE = "METADATA"
+# Ids listed per inconsistency in a report
+SAMPLE_IDS = 10
+
+def _sqlite_path(persist_directory: str) -> str:
+    return os.path.join(persist_directory, SQLITE_FILE)
+
+def available(persist_directory: str) -> bool:
+    """Whether the store's files are on this machine (not the case with a remote Chroma server)."""
+    return os.path.exists(_sqlite_path(persist_directory))
+
+def _connect(persist_directory: str, readonly: bool = True) -> sqlite3.Connection:
+    if readonly:
+        return sqlite3.connect(f"file:{_sqlite_path(persist_directory)}?mode=ro", uri=True, timeout=60)
+    # Autocommit: each statement (and VACUUM) runs on its own
+    return sqlite3.connect(_sqlite_path(persist_directory), timeout=60, isolation_level=None)
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _decode_seq_id(value) -> int:
+    # The metadata segment stores its position as big-endian bytes
+    return int.from_bytes(value, "big") if isinstance(value, bytes) else int(value)
+
+def _segment_dirs(persist_directory: str) -> list:
+    return [
+        name for name in os.listdir(persist_directory)
+        if os.path.exists(os.path.join(persist_directory, name, INDEX_HEADER_FILE))
+        or os.path.exists(os.path.join(persist_directory, name, INDEX_METADATA_FILE))
+    ]
+
+def _vector_index(persist_directory: str, segment_id: str) -> Optional[dict]:
+    """
+    What an HNSW segment last persisted: elements in the index (deleted ones
+    stay in the graph, marked), the live id -> label map and the write log
+    position it covers. None until the segment has persisted once.
+    """
+    folder = os.path.join(persist_directory, segment_id)
+    try:
+        with open(os.path.join(folder, INDEX_HEADER_FILE), "rb") as f:
+            _, _, capacity, elements = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+        with open(os.path.join(folder, INDEX_METADATA_FILE), "rb") as f:
+            # chromadb's PersistentData
+            data = pickle.load(f)
+    except (FileNotFoundError, struct.error):
+        return None
+    return {
+        "elements": elements,
+        "capacity": capacity,
+        "labels": data.id_to_label,
+        "max_seq_id": data.max_seq_id,
+        "bytes": _dir_bytes(folder),
+    }
+
+def _segments(db: sqlite3.Connection, collection_id: str) -> dict:
+    return dict(db.execute("SELECT scope, id FROM segments WHERE collection = ?", (collection_id,)).fetchall())
+
+def _metadata_seq_id(db: sqlite3.Connection, segment_id: str) -> Optional[int]:
+    row = db.execute("SELECT seq_id FROM max_seq_id WHERE segment_id = ?", (segment_id,)).fetchone()
+    return _decode_seq_id(row[0]) if row else None
+
+def collection_stats(persist_directory: str, name: str) -> dict:
+    """
+    Records, HNSW tombstones and capacity of one Chroma collection, and
+    whether its metadata segment and vector index hold the same ids. Writes
+    the index has not persisted yet (still in the write log) are `pending`
+    and not counted as inconsistencies.
+    """
+    with closing(_connect(persist_directory)) as db:
+        row = db.execute("SELECT id, topic FROM collections WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return {"name": name, "exists": False}
+        collection_id, topic = row
+        segments = _segments(db, collection_id)
+        metadata_ids = {
+            embedding_id for (embedding_id,) in db.execute(
+                "SELECT embedding_id FROM embeddings WHERE segment_id = ?", (segments.get(METADATA_SCOPE),)
+            )
+        }
+        index = _vector_index(persist_directory, segments.get(VECTOR_SCOPE, ""))
+        index_ids = set(index["labels"]) if index else set()
+        pending = {
+            embedding_id for (embedding_id,) in db.execute(
+                "SELECT id FROM embeddings_queue WHERE topic = ? AND seq_id > ?",
+                (topic, index["max_seq_id"] if index else 0),
+            )
+        }
+    elements = index["elements"] if index else 0
+    tombstones = max(elements - len(index_ids), 0)
+    missing_from_index = sorted(metadata_ids - index_ids - pending)
+    missing_from_metadata = sorted(index_ids - metadata_ids - pending)
+    return {
+        "name": name,
+        "exists": True,
+        "records": len(metadata_ids),
+        "index_elements": elements,
+        "index_capacity": index["capacity"] if index else 0,
+        "tombstones": tombstones,
+        "tombstone_ratio": round(tombstones / elements, 4) if elements else 0.0,
+        "pending_writes": len(pending),
+        "index_bytes": index["bytes"] if index else 0,
+        "missing_from_index": {"count": len(missing_from_index), "ids": missing_from_index[:SAMPLE_IDS]},
+        "missing_from_metadata": {"count": len(missing_from_metadata), "ids": missing_from_metadata[:SAMPLE_IDS]},
+        "consistent": not missing_from_index and not missing_from_metadata,
+    }
+
+def _consumed_log_bounds(db: sqlite3.Connection, persist_directory: str) -> dict:
+    """
+    Per write log topic, the last position both segments of its collection
+    have persisted: rows up to it are never replayed again. The newest row of
+    the log always stays, Chroma numbers new writes after it.
+    """
+    newest = db.execute("SELECT MAX(seq_id) FROM embeddings_queue").fetchone()[0]
+    if newest is None:
+        return {}
+    bounds = {}
+    for collection_id, topic in db.execute("SELECT id, topic FROM collections").fetchall():
+        segments = _segments(db, collection_id)
+        index = _vector_index(persist_directory, segments.get(VECTOR_SCOPE, ""))
+        metadata_seq_id = _metadata_seq_id(db, segments.get(METADATA_SCOPE, ""))
+        if index is None or metadata_seq_id is None:
+            continue
+        bounds[topic] = min(index["max_seq_id"], metadata_seq_id, newest - 1)
+    return bounds
+
+def _orphan_dirs(db: sqlite3.Connection, persist_directory: str, names: list) -> list:
+    """
+    Segment folders of dropped collections. `names` is listed before reading
+    the table: a segment is registered before its folder exists.
+    """
+    known = {segment_id for (segment_id,) in db.execute("SELECT id FROM segments")}
+    return [name for name in names if name not in known]
+
+_ORPHAN_ROWS = "SELECT id FROM embeddings WHERE segment_id NOT IN (SELECT id FROM segments)"
+
+def store_stats(persist_directory: str) -> dict:
+    """Size and fragmentation of the SQLite file and what a purge would reclaim."""
+    folders = _segment_dirs(persist_directory)
+    with closing(_connect(persist_directory)) as db:
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        pages = db.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = db.execute("PRAGMA freelist_count").fetchone()[0]
+        log_rows = db.execute("SELECT COUNT(*) FROM embeddings_queue").fetchone()[0]
+        consumed = sum(
+            db.execute("SELECT COUNT(*) FROM embeddings_queue WHERE topic = ? AND seq_id <= ?", (topic, bound)).fetchone()[0]
+            for topic, bound in _consumed_log_bounds(db, persist_directory).items()
+        )
+        orphan_rows = db.execute(f"SELECT COUNT(*) FROM ({_ORPHAN_ROWS})").fetchone()[0]
+        orphan_dirs = _orphan_dirs(db, persist_directory, folders)
+    sqlite_bytes = sum(
+        os.path.getsize(path) for path in (
+            _sqlite_path(persist_directory) + suffix for suffix in ("", "-journal", "-wal")
+        ) if os.path.exists(path)
+    )
+    return {
+        "sqlite_bytes": sqlite_bytes,
+        "sqlite_free_bytes": free_pages * page_size,
+        "sqlite_fragmentation": round(free_pages / pages, 4) if pages else 0.0,
+        "segment_bytes": sum(_dir_bytes(os.path.join(persist_directory, name)) for name in folders),
+        "write_log_rows": log_rows,
+        "consumed_write_log_rows": consumed,
+        "orphan_metadata_rows": orphan_rows,
+        "orphan_segment_dirs": len(orphan_dirs),
+        "orphan_segment_bytes": sum(_dir_bytes(os.path.join(persist_directory, name)) for name in orphan_dirs),
+    }
+
+def purge(persist_directory: str) -> dict:
+    """
+    Deletes what Chroma 0.4 leaves behind: write log rows every segment has
+    persisted, metadata rows of dropped collections and the HNSW folders of
+    dropped collections that were not loaded when they were dropped. Safe
+    while the store is in use; the freed pages go back to the OS on VACUUM.
+    """
+    folders = _segment_dirs(persist_directory)
+    with closing(_connect(persist_directory, readonly=False)) as db:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            log_rows = 0
+            for topic, bound in _consumed_log_bounds(db, persist_directory).items():
+                log_rows += db.execute("DELETE FROM embeddings_queue WHERE topic = ? AND seq_id <= ?", (topic, bound)).rowcount
+            db.execute(f"DELETE FROM embedding_fulltext_search WHERE rowid IN ({_ORPHAN_ROWS})")
+            db.execute(f"DELETE FROM embedding_metadata WHERE id IN ({_ORPHAN_ROWS})")
+            orphan_rows = db.execute("DELETE FROM embeddings WHERE segment_id NOT IN (SELECT id FROM segments)").rowcount
+            db.execute("DELETE FROM max_seq_id WHERE segment_id NOT IN (SELECT id FROM segments)")
+            orphan_dirs = _orphan_dirs(db, persist_directory, folders)
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+    for name in orphan_dirs:
+        shutil.rmtree(os.path.join(persist_directory, name), ignore_errors=True)
+    return {"write_log_rows": log_rows, "orphan_metadata_rows": orphan_rows, "orphan_segment_dirs": len(orphan_dirs)}
+
+def vacuum(persist_directory: str):
+    """Rewrites the SQLite file without its free pages. Chroma's writes wait while it runs."""
+    with closing(_connect(persist_directory, readonly=False)) as db:
+        db.execute("VACUUM")
@@ -0,0 +1,320 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_openai import OpenAIEmbeddings
+
+from app.core.config import settings
+from app.core.database import pool
+from app.services import crud
+
+logger = logging.getLogger(__name__)
+
+# Operations (code paths) usage is attributed to
+OP_CHAT = "chat"
+OP_LEAD_EXTRACTION = "lead_extraction"
+OP_SUMMARY = "summary"
+OP_INGEST = "ingest"
+OP_EVALUATION = "evaluation"
+OP_WARMUP = "warmup"
+OP_SEARCH = "search"
+OP_OTHER = "other"
+
+# Collection label of requests over several slots (their usage is recorded per slot)
+FEDERATED_COLLECTION = "federated"
+
+# USD per 1K tokens: (input, output). Matched by longest prefix of the model name
+# the API reports ("gpt-3.5-turbo-0125" -> "gpt-3.5-turbo").
+PRICES_PER_1K = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+    "text-embedding-ada-002": (0.0001, 0.0),
+    "text-embedding-3-small": (0.00002, 0.0),
+    "text-embedding-3-large": (0.00013, 0.0),
+    "whisper-1": (0.0, 0.0),
+}
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int = 0) -> float:
+    matches = [name for name in PRICES_PER_1K if (model or "").startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, output_price = PRICES_PER_1K[max(matches, key=len)]
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
+
+class RequestTally:
+    """Running totals for one request (returned in the chat response)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.embedding_tokens = 0
+        self.cost_usd = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, prompt: int, completion: int, embedding: int, cost: float):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.embedding_tokens += embedding
+            self.cost_usd += cost
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "embedding_tokens": self.embedding_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+class UsageScope:
+    __slots__ = ("collection", "user_hash", "operation", "tally", "slots")
+
+    def __init__(self, collection: str, user_hash: str, operation: str, tally: RequestTally, slots: tuple = ()):
+        self.collection = collection
+        self.user_hash = user_hash
+        self.operation = operation
+        self.tally = tally
+        # Federated: the slots usage is split across (collection is FEDERATED_COLLECTION)
+        self.slots = slots
+
+    def shares(self) -> list:
+        """(collection, fraction) the usage of a call is recorded under."""
+        if not self.slots:
+            return [(self.collection, 1.0)]
+        return [(slot, 1.0 / len(self.slots)) for slot in self.slots]
+
+def _split(total: int, parts: int) -> list:
+    """`total` tokens over `parts` slots, summing exactly to it."""
+    base, remainder = divmod(total, parts)
+    return [base + (1 if i < remainder else 0) for i in range(parts)]
+
+# Who the model calls of the current request/task are billed to. Follows
+# asyncio tasks and run_in_threadpool like any contextvar.
+_scope: contextvars.ContextVar = contextvars.ContextVar("nexus_usage_scope", default=None)
+
+def collection_label(collection_names: Optional[list], collection_name: str = "") -> str:
+    """Label of a request over `collection_names` (several slots: FEDERATED_COLLECTION)."""
+    if collection_names and len(collection_names) > 1:
+        return FEDERATED_COLLECTION
+    return collection_names[0] if collection_names else collection_name
+
+def _child_scope(collection=None, user_hash: str = None, operation: str = None) -> UsageScope:
+    slots = ()
+    if isinstance(collection, (list, tuple)):
+        slots = tuple(collection) if len(collection) > 1 else ()
+        collection = collection_label(list(collection))
+    parent = _scope.get()
+    if parent is None:
+        return UsageScope(collection or "", user_hash or "", operation or OP_OTHER, RequestTally(), slots)
+    return UsageScope(
+        collection or parent.collection,
+        user_hash or parent.user_hash,
+        operation or parent.operation,
+        parent.tally,
+        slots if collection else parent.slots,
+    )
+
+def start_scope(collection=None, user_hash: str = None, operation: str = None) -> RequestTally:
+    """
+    Attributes the rest of the current request (its task and the threadpool
+    calls it makes) to a collection/user/operation. Returns the request tally.
+    `collection` may be a list of slots: usage is then split evenly across them.
+    """
+    scope = _child_scope(collection, user_hash, operation)
+    _scope.set(scope)
+    return scope.tally
+
+@contextmanager
+def usage_scope(collection=None, user_hash: str = None, operation: str = None):
+    """Same as start_scope, limited to a block (unset fields are inherited)."""
+    scope = _child_scope(collection, user_hash, operation)
+    token = _scope.set(scope)
+    try:
+        yield scope.tally
+    finally:
+        _scope.reset(token)
+
+UsageKey = Tuple[str, str, str, str, str]  # day, collection, user_hash, operation, model
+
+class TokenUsageRecorder:
+    """
+    Aggregates model usage in memory per (day, collection, user, operation, model)
+    and upserts the deltas into `token_usage` periodically, so model calls
+    never wait on SQLite.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[UsageKey, list] = {}
+        self._lock = threading.Lock()
+        self._flush_task = None
+
+    def record(self, model: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+               embedding_tokens: int = 0, latency: float = 0.0):
+        scope = _scope.get() or _child_scope()
+        cost = estimate_cost(model, prompt_tokens + embedding_tokens, completion_tokens)
+        scope.tally.add(prompt_tokens, completion_tokens, embedding_tokens, cost)
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        shares = scope.shares()
+        # A federated call counts once (with its latency) in every slot; tokens and cost are split
+        split = zip(
+            shares,
+            _split(prompt_tokens, len(shares)),
+            _split(completion_tokens, len(shares)),
+            _split(embedding_tokens, len(shares)),
+        )
+        with self._lock:
+            for (collection, fraction), prompt, completion, embedding in split:
+                key = (day, collection, scope.user_hash, scope.operation, model or "unknown")
+                totals = self._pending.setdefault(key, [0, 0, 0, 0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += prompt
+                totals[2] += completion
+                totals[3] += embedding
+                totals[4] += cost * fraction
+                totals[5] += latency
+
+    def record_totals(self, model: str, calls: int, prompt_tokens: int, completion_tokens: int, cost: float):
+        """For callers that only get aggregated numbers (e.g. RAGAS via get_openai_callback)."""
+        scope = _scope.get() or _child_scope()
+        day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        shares = scope.shares()
+        split = zip(shares, _split(prompt_tokens, len(shares)), _split(completion_tokens, len(shares)))
+        with self._lock:
+            for (collection, fraction), prompt, completion in split:
+                key = (day, collection, scope.user_hash, scope.operation, model)
+                totals = self._pending.setdefault(key, [0, 0, 0, 0, 0.0, 0.0])
+                totals[0] += calls
+                totals[1] += prompt
+                totals[2] += completion
+                totals[4] += cost * fraction
+
+    async def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = [key + tuple(totals) for key, totals in pending.items()]
+        try:
+            await pool.run_write(lambda db: crud.add_token_usage_batch(db, rows))
+        except Exception as e:
+            logger.error(f"Token usage flush failed, will retry: {e}")
+            with self._lock:
+                for key, totals in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0, 0, 0.0, 0.0])
+                    for i, value in enumerate(totals):
+                        current[i] += value
+            return 0
+        return len(rows)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+token_usage = TokenUsageRecorder(flush_interval=settings.TOKEN_USAGE_FLUSH_SECONDS)
+
+class TokenAccountingHandler(BaseCallbackHandler):
+    """Records the token usage OpenAI reports for every chat/LLM call."""
+
+    def __init__(self):
+        self._starts = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        with self._lock:
+            self._starts[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        with self._lock:
+            self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            start = self._starts.pop(run_id, None)
+        output = response.llm_output or {}
+        usage = output.get("token_usage") or {}
+        token_usage.record(
+            output.get("model_name", "unknown"),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            latency=time.perf_counter() - start if start else 0.0,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._starts.pop(run_id, None)
+
+langchain_handler = TokenAccountingHandler()
+
+_encodings = {}
+
+def count_tokens(texts: list, model: str) -> int:
+    """Embedding tokens (the embeddings API response is not surfaced by LangChain)."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        try:
+            import tiktoken
+            encoding = tiktoken.encoding_for_model(model)
+        except Exception:
+            encoding = False
+        _encodings[model] = encoding
+    if encoding is False:
+        # ~4 characters per token when tiktoken has no encoding for the model
+        return sum(len(text) for text in texts) // 4
+    return sum(len(encoding.encode(text, disallowed_special=())) for text in texts)
+
+class AccountedEmbeddings(OpenAIEmbeddings):
+    """
+    OpenAIEmbeddings that records the tokens and time of every call
+    (embed_query goes through embed_documents, so queries are covered too).
+    """
+
+    def embed_documents(self, texts, chunk_size: Optional[int] = 0):
+        start = time.perf_counter()
+        vectors = super().embed_documents(texts, chunk_size)
+        token_usage.record(self.model, embedding_tokens=count_tokens(texts, self.model), latency=time.perf_counter() - start)
+        return vectors
+
+GROUP_COLUMNS = {"day", "collection", "user_hash", "operation", "model"}
+
+async def get_token_usage(days: int, group_by: list, collection: str = None, user_hash: str = None) -> dict:
+    """Aggregated usage since `days` ago (UTC days), grouped by the given columns."""
+    # Include what is still buffered in memory
+    await token_usage.flush()
+    since = (datetime.now(timezone.utc) - timedelta(days=max(days, 1) - 1)).strftime("%Y-%m-%d")
+    async with pool.connection() as db:
+        rows = await crud.get_token_usage(db, since, group_by, collection, user_hash)
+    columns = group_by + ["calls", "prompt_tokens", "completion_tokens", "embedding_tokens", "cost_usd", "latency_seconds"]
+    results = [dict(zip(columns, row)) for row in rows]
+    totals = {
+        column: sum(row[column] for row in results)
+        for column in ("calls", "prompt_tokens", "completion_tokens", "embedding_tokens", "cost_usd", "latency_seconds")
+    }
+    return {"since": since, "group_by": group_by, "rows": results, "totals": totals}
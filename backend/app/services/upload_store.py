@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Uploads are stored once per content under <upload_dir>/blobs/<hash[:2]>/<hash><ext>
+# (the extension picks the loader). Which slot holds which file under which name
+# is a reference record in <upload_dir>/uploads.sqlite3; chunks keep their logical
+# source "<upload_dir>/<filename>", so listings, deletes and citations are unchanged.
+BLOBS_DIR = "blobs"
+INDEX_FILE = "uploads.sqlite3"
+LOCK_FILE = ".uploads.lock"
+TEMP_PREFIX = ".upload_"
+COPY_CHUNK_BYTES = 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_refs (
+    collection TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    blob TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (collection, filename)
+)
+"""
+
+def is_internal(name: str) -> bool:
+    """Entries of the upload directory that belong to the store (not legacy flat uploads)."""
+    return name in (BLOBS_DIR, LOCK_FILE) or name.startswith(INDEX_FILE) or name.startswith(TEMP_PREFIX)
+
+def _is_hash(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def blob_name(file_hash: str, filename: str) -> str:
+    return f"{file_hash}{os.path.splitext(filename)[1].lower()}"
+
+def blob_path(upload_dir: str, blob: str) -> str:
+    return os.path.join(upload_dir, BLOBS_DIR, blob[:2], blob)
+
+def _connect(upload_dir: str) -> sqlite3.Connection:
+    os.makedirs(upload_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(upload_dir, INDEX_FILE), timeout=30)
+    db.execute(_SCHEMA)
+    return db
+
+@contextmanager
+def _locked(upload_dir: str):
+    """Serialises publishing blobs and collecting them (threads and worker processes)."""
+    os.makedirs(upload_dir, exist_ok=True)
+    with open(os.path.join(upload_dir, LOCK_FILE), "w") as lock_file:
+        try:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        yield
+
+def save(fileobj, filename: str, upload_dir: str) -> dict:
+    """
+    Stores an uploaded file by the sha256 of its content, hashing while it
+    is written. Identical content is kept once: the second copy is dropped
+    and the blob's mtime refreshed, so the GC's age check starts over.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    temp_path = os.path.join(upload_dir, f"{TEMP_PREFIX}{uuid.uuid4().hex}")
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(temp_path, "wb") as out:
+            while True:
+                chunk = fileobj.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        blob = blob_name(digest.hexdigest(), filename)
+        path = blob_path(upload_dir, blob)
+        with _locked(upload_dir):
+            deduplicated = os.path.exists(path)
+            if deduplicated:
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {"hash": digest.hexdigest(), "blob": blob, "path": path, "size": size, "deduplicated": deduplicated}
+
+def save_file(source_path: str, filename: str, upload_dir: str, blob: Optional[str] = None) -> dict:
+    """
+    Stores a file from disk (imports). With the `blob` name it was exported
+    under and that blob already here, nothing is read or copied.
+    """
+    if blob and _is_hash(blob[:64]) and blob == blob_name(blob[:64], filename):
+        path = blob_path(upload_dir, blob)
+        with _locked(upload_dir):
+            if os.path.exists(path):
+                os.utime(path)
+                return {"hash": blob[:64], "blob": blob, "path": path, "size": os.path.getsize(path), "deduplicated": True}
+    with open(source_path, "rb") as f:
+        return save(f, filename, upload_dir)
+
+def add_reference(collection: str, filename: str, upload: dict, upload_dir: str):
+    """Records that `collection` holds `upload` (from save) as `filename`, replacing an older version."""
+    with closing(_connect(upload_dir)) as db, db:
+        db.execute(
+            "INSERT OR REPLACE INTO upload_refs (collection, filename, file_hash, blob, size, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (collection, filename, upload["hash"], upload["blob"], upload["size"], time.time()),
+        )
+
+def remove_reference(collection: str, filename: str, upload_dir: str) -> bool:
+    with closing(_connect(upload_dir)) as db, db:
+        return db.execute("DELETE FROM upload_refs WHERE collection = ? AND filename = ?", (collection, filename)).rowcount > 0
+
+def remove_references(collection: str, upload_dir: str) -> int:
+    with closing(_connect(upload_dir)) as db, db:
+        return db.execute("DELETE FROM upload_refs WHERE collection = ?", (collection,)).rowcount
+
+def references(collection: str, upload_dir: str) -> dict:
+    """filename -> {hash, blob, path, size} of the files a slot holds."""
+    with closing(_connect(upload_dir)) as db:
+        rows = db.execute("SELECT filename, file_hash, blob, size FROM upload_refs WHERE collection = ?", (collection,)).fetchall()
+    return {
+        filename: {"hash": file_hash, "blob": blob, "path": blob_path(upload_dir, blob), "size": size}
+        for filename, file_hash, blob, size in rows
+    }
+
+def referenced_paths(upload_dir: str) -> list:
+    """Every blob some slot references (each once)."""
+    if not os.path.exists(os.path.join(upload_dir, INDEX_FILE)):
+        return []
+    with closing(_connect(upload_dir)) as db:
+        blobs = [blob for (blob,) in db.execute("SELECT DISTINCT blob FROM upload_refs ORDER BY blob")]
+    return [blob_path(upload_dir, blob) for blob in blobs]
+
+def collect_garbage(upload_dir: str, max_age_seconds: float) -> dict:
+    """
+    Deletes blobs no slot references any more, and temp files of interrupted
+    uploads, once older than `max_age_seconds` (a blob saved by an ingestion
+    still indexing has no reference yet).
+    """
+    blobs_dir = os.path.join(upload_dir, BLOBS_DIR)
+    removed, freed = [], 0
+    now = time.time()
+    with _locked(upload_dir):
+        referenced = {os.path.basename(path) for path in referenced_paths(upload_dir)}
+        candidates = [
+            os.path.join(upload_dir, name) for name in os.listdir(upload_dir) if name.startswith(TEMP_PREFIX)
+        ] if os.path.isdir(upload_dir) else []
+        for root, _, files in os.walk(blobs_dir):
+            candidates.extend(os.path.join(root, name) for name in files if name not in referenced)
+        for path in candidates:
+            try:
+                stat = os.stat(path)
+                if now - stat.st_mtime > max_age_seconds:
+                    os.remove(path)
+                    removed.append(os.path.basename(path))
+                    freed += stat.st_size
+            except OSError as e:
+                logger.warning(f"Could not remove unreferenced upload {path}: {e}")
+    return {"blobs": removed, "bytes": freed}
+
+def link_or_copy(source_path: str, target_path: str):
+    """Hard link (same volume, no copy) with a copy as fallback."""
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_BYTES)
+            if not chunk:
+                return digest.hexdigest()
+            digest.update(chunk)
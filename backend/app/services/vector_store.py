@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings as ChromaSettings
+from langchain_community.vectorstores import Chroma
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+from app.services import numpy_store, sharding, slot_settings
+
+logger = logging.getLogger(__name__)
+
+# VECTOR_STORE_MODE
+MODE_EMBEDDED = "embedded"  # this process opens /app/chroma_db directly (one worker only)
+MODE_SERVER = "server"      # a Chroma server owns the store; any number of workers connect to it
+
+_server_client = None
+_server_lock = threading.Lock()
+_embedded_lock_file = None
+EMBEDDED_LOCK_FILE = ".nexus_embedded.lock"
+# Temporary collection an index rebuild copies into ("<collection>__rebuild"),
+# and the name the old index is moved to during the swap ("<collection>__old")
+REBUILD_SUFFIX = "__rebuild"
+OLD_SUFFIX = "__old"
+REBUILD_BATCH_SIZE = 5000
+# Per-slot write locks (<persist_directory>/.nexus_locks/<slot>.lock), shared by workers
+LOCK_DIR = ".nexus_locks"
+_slot_locks = {}
+_slot_locks_guard = threading.Lock()
+
+def server_mode() -> bool:
+    return settings.VECTOR_STORE_MODE == MODE_SERVER
+
+def _get_server_client():
+    """
+    One HttpClient per worker process, with a keep-alive connection pool
+    sized for the threadpool, so requests reuse local connections to the
+    gateway instead of opening one per call.
+    """
+    global _server_client
+    if _server_client is None:
+        with _server_lock:
+            if _server_client is None:
+                client = chromadb.HttpClient(
+                    host=settings.CHROMA_SERVER_HOST,
+                    port=settings.CHROMA_SERVER_PORT,
+                    settings=ChromaSettings(anonymized_telemetry=False),
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.CHROMA_HTTP_POOL_SIZE)
+                client._server._session.mount("http://", adapter)
+                client._server._session.mount("https://", adapter)
+                _server_client = client
+                logger.info(f"Vector store gateway at {settings.CHROMA_SERVER_HOST}:{settings.CHROMA_SERVER_PORT}")
+    return _server_client
+
+def get_client(persist_directory: str):
+    """chromadb client for the configured mode (embedded clients are cached by chromadb per directory)."""
+    if server_mode():
+        return _get_server_client()
+    return chromadb.PersistentClient(path=persist_directory)
+
+def client_cached(persist_directory: str) -> bool:
+    """Whether the next open reuses an existing client (False = opening the store / first connection)."""
+    if server_mode():
+        return _server_client is not None
+    return persist_directory in getattr(SharedSystemClient, "_identifer_to_system", {})
+
+def _open_collection(collection_name: str, embedding_function, persist_directory: str, metadata: dict = None) -> Chroma:
+    # `metadata` (HNSW parameters) only applies when the collection gets created
+    if server_mode():
+        return Chroma(
+            client=_get_server_client(),
+            persist_directory=persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection_name,
+            collection_metadata=metadata
+        )
+    return Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embedding_function,
+        collection_name=collection_name,
+        collection_metadata=metadata
+    )
+
+def open_store(collection_name: str, embedding_function, persist_directory: str) -> Chroma:
+    """
+    LangChain Chroma for a slot. In server mode persist_directory is only
+    kept so `persist()` stays the no-op it is on chromadb 0.4. A slot with
+    several shards (slot_settings) gets a ShardedCollection as `_collection`,
+    and a slot on the numpy engine a NumpyCollection, so every caller (and
+    LangChain's search) sees one collection.
+    """
+    options = slot_settings.get_slot_settings(collection_name)
+    if options["engine"] == slot_settings.ENGINE_NUMPY:
+        # In-process in both modes: the files are shared, the matrix is mapped per worker
+        return Chroma(
+            client=numpy_store.NumpyClient(persist_directory),
+            persist_directory=persist_directory,
+            embedding_function=embedding_function,
+            collection_name=collection_name
+        )
+    names = sharding.shard_names(collection_name, options["shards"])
+    metadata = slot_settings.hnsw_metadata(options)
+    store = _open_collection(names[0], embedding_function, persist_directory, metadata)
+    if len(names) > 1:
+        collections = [store._collection] + [
+            _open_collection(name, embedding_function, persist_directory, metadata)._collection for name in names[1:]
+        ]
+        store._collection = sharding.ShardedCollection(collection_name, collections)
+    return store
+
+def delete_store(collection_name: str, persist_directory: str, engine: str = None) -> int:
+    """Drops the slot's collection(s), whatever shard layout or engine (unless given) they were written with."""
+    deleted = 0
+    if engine in (None, slot_settings.ENGINE_CHROMA):
+        client = get_client(persist_directory)
+        for collection in client.list_collections():
+            if collection.name == collection_name or sharding.is_shard_name(collection.name, collection_name):
+                client.delete_collection(collection.name)
+                deleted += 1
+    if engine in (None, slot_settings.ENGINE_NUMPY):
+        deleted += numpy_store.delete_collection(collection_name, persist_directory)
+    return deleted
+
+def list_slots(persist_directory: str) -> list:
+    """Every slot in the store (shard collections folded into their slot)."""
+    client = get_client(persist_directory)
+    slots = {
+        sharding.slot_name(collection.name) for collection in client.list_collections()
+        if not collection.name.endswith((REBUILD_SUFFIX, OLD_SUFFIX))
+    }
+    return sorted(slots | set(numpy_store.list_collections(persist_directory)))
+
+@contextmanager
+def slot_write_lock(collection_name: str, persist_directory: str):
+    """
+    Serialises the writes to a slot (ingestion, import, deletes, reset) with
+    an index rebuild, which copies the slot and swaps the copy in: a write
+    landing in between would be lost. Threads wait on a lock per slot, worker
+    processes on an flock; not reentrant.
+    """
+    slot = sharding.slot_name(collection_name)
+    with _slot_locks_guard:
+        lock = _slot_locks.setdefault((persist_directory, slot), threading.Lock())
+    with lock:
+        os.makedirs(os.path.join(persist_directory, LOCK_DIR), exist_ok=True)
+        with open(os.path.join(persist_directory, LOCK_DIR, f"{slot}.lock"), "w") as lock_file:
+            try:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except ImportError:
+                pass
+            yield
+
+def index_params(collection) -> dict:
+    """HNSW parameters a chromadb collection was created with (only the non-default ones are stored)."""
+    return {key: value for key, value in (collection.metadata or {}).items() if key.startswith("hnsw:")}
+
+def _copy_records(source, target):
+    """Copies every record from one collection to another in batches."""
+    offset = 0
+    while True:
+        batch = source.get(limit=REBUILD_BATCH_SIZE, offset=offset, include=["embeddings", "metadatas", "documents"])
+        if not batch["ids"]:
+            return
+        target.upsert(ids=batch["ids"], embeddings=batch["embeddings"],
+                      metadatas=batch["metadatas"], documents=batch["documents"])
+        offset += len(batch["ids"])
+
+def _rename_in(client, collection, name: str):
+    """
+    Renames `collection` to `name`. A search opening the slot in between
+    re-creates `name`: its records (a writer outside the slot lock) are
+    carried over before it is replaced.
+    """
+    try:
+        collection.modify(name=name)
+    except Exception:
+        # Name taken (sqlite or HTTP error depending on the mode)
+        recreated = client.get_collection(name)
+        if recreated.count():
+            recreated_ids = recreated.get(include=[])["ids"]
+            _copy_records(recreated, collection)
+            if len(collection.get(ids=recreated_ids, include=[])["ids"]) != len(recreated_ids):
+                raise RuntimeError(f"Rebuild of {name}: could not carry over the records of the re-created collection")
+        client.delete_collection(name)
+        collection.modify(name=name)
+
+def _recover_rebuild(client, name: str):
+    """Finishes or undoes a rebuild of `name` interrupted by a crash, from the collections it left behind."""
+    names = {collection.name for collection in client.list_collections()}
+    temp_name, old_name = f"{name}{REBUILD_SUFFIX}", f"{name}{OLD_SUFFIX}"
+    if old_name in names:
+        if temp_name in names or name not in names:
+            # Stopped between moving the old index aside and renaming the copy in
+            logger.warning(f"Restoring {name} from an interrupted index rebuild")
+            if temp_name in names:
+                client.delete_collection(temp_name)
+            _rename_in(client, client.get_collection(old_name), name)
+        else:
+            # Stopped after the swap: only the old index is left
+            client.delete_collection(old_name)
+    elif temp_name in names:
+        temp = client.get_collection(temp_name)
+        if name in names and client.get_collection(name).count() >= temp.count():
+            # Stopped while copying: the source is intact
+            client.delete_collection(temp_name)
+        else:
+            # The source is missing or smaller than the copy: the copy holds the slot's records
+            logger.warning(f"Restoring {name} from the copy of an interrupted index rebuild")
+            _rename_in(client, temp, name)
+
+def rebuild_collection(name: str, metadata: Optional[dict], persist_directory: str) -> int:
+    """
+    Re-creates one Chroma collection with `metadata` (Chroma fixes the HNSW
+    parameters when the index is created): copies the records into
+    "<name>__rebuild" built with the new parameters, moves the old index
+    aside to "<name>__old", renames the copy in and drops the old index.
+    Every step leaves the records under a name the next rebuild recovers
+    them from after a crash. Callers hold the slot's `slot_write_lock`, so
+    no write lands between the copy and the swap; searches keep hitting the
+    old index until the swap. Returns the records in the new index.
+    """
+    client = get_client(persist_directory)
+    _recover_rebuild(client, name)
+    source = client.get_collection(name)
+    temp_name = f"{name}{REBUILD_SUFFIX}"
+    target = client.create_collection(temp_name, metadata=metadata)
+    _copy_records(source, target)
+    copied, expected = target.count(), source.count()
+    if copied != expected:
+        client.delete_collection(temp_name)
+        raise RuntimeError(f"Rebuild of {name} copied {copied} of {expected} records; kept the old index")
+    source.modify(name=f"{name}{OLD_SUFFIX}")
+    _rename_in(client, target, name)
+    client.delete_collection(f"{name}{OLD_SUFFIX}")
+    return target.count()
+
+def heartbeat(persist_directory: str) -> int:
+    return get_client(persist_directory).heartbeat()
+
+def acquire_embedded_lock(persist_directory: str):
+    """
+    Embedded mode is single-process: a second worker opening the same store
+    fails at startup instead of corrupting it. Held until the process exits.
+    """
+    global _embedded_lock_file
+    if _embedded_lock_file is not None:
+        return
+    try:
+        import fcntl
+    except ImportError:
+        # Windows dev boxes: no advisory locks, run a single worker
+        return
+    os.makedirs(persist_directory, exist_ok=True)
+    lock_file = open(os.path.join(persist_directory, EMBEDDED_LOCK_FILE), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(
+            f"{persist_directory} is already open by another process. Run a single worker or set "
+            "VECTOR_STORE_MODE=server so a Chroma server owns the store."
+        )
+    _embedded_lock_file = lock_file
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core import tracing
+from app.core.config import settings
+from app.services import rag_service, token_accounting, vector_store
+from app.services.chat_service import get_vector_db, get_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Warm-up states
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_TIMED_OUT = "timed_out"   # WARMUP_TIMEOUT_SECONDS passed; ready anyway, remaining slots warm on first use
+STATE_DISABLED = "disabled"
+STATE_STOPPED = "stopped"       # shutting down: stop receiving traffic
+
+READY_STATES = {STATE_DONE, STATE_TIMED_OUT, STATE_DISABLED}
+
+@tracing.traced("warmup.slot")
+def warm_slot(collection_name: str) -> dict:
+    """
+    Opens the slot's store (Chroma client + collection) and runs one query so
+    the HNSW index is loaded from disk. The query reuses a stored vector, so
+    no embeddings call is made.
+    """
+    start = time.perf_counter()
+    collection = get_vector_db(collection_name)._collection
+    count = collection.count()
+    if count:
+        sample = collection.get(limit=1, include=["embeddings"])
+        collection.query(query_embeddings=sample["embeddings"][:1], n_results=1)
+    tracing.current_span().set_attributes(collection=collection_name, documents=count)
+    return {"documents": count, "seconds": round(time.perf_counter() - start, 3)}
+
+@tracing.traced("warmup.model_clients")
+def warm_model_clients():
+    """One tiny embedding so the shared embeddings client has its connection open."""
+    with token_accounting.usage_scope(operation=token_accounting.OP_WARMUP):
+        get_embeddings().embed_query("warm-up")
+
+class SlotWarmup:
+    """
+    Pre-opens every slot in slots.json after startup (in the threadpool,
+    WARMUP_CONCURRENCY at a time, capped at WARMUP_TIMEOUT_SECONDS) and backs
+    the /readyz probe: the instance only reports ready once warm-up is over.
+    """
+
+    def __init__(self):
+        self.state = STATE_PENDING
+        self.slots = {}
+        self.model_clients = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state in READY_STATES
+
+    async def _warm(self, slot: str, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            self.slots[slot] = {"status": STATE_RUNNING}
+            try:
+                result = await run_in_threadpool(warm_slot, slot)
+                self.slots[slot] = dict(result, status="warm")
+            except Exception as e:
+                # A broken slot must not keep the instance out of rotation
+                logger.warning(f"Warm-up of slot {slot} failed: {e}")
+                self.slots[slot] = {"status": "failed", "error": str(e)}
+
+    async def _warm_model_clients(self):
+        try:
+            await run_in_threadpool(warm_model_clients)
+            self.model_clients = "warm"
+        except Exception as e:
+            logger.warning(f"Warm-up of model clients failed: {e}")
+            self.model_clients = "failed"
+
+    async def _wait_for_gateway(self):
+        # Server mode: the Chroma server may still be starting next to us
+        while True:
+            try:
+                await run_in_threadpool(vector_store.heartbeat, rag_service.CHROMA_DB_DIR)
+                return
+            except Exception:
+                await asyncio.sleep(0.5)
+
+    async def _warm_all(self):
+        if vector_store.server_mode():
+            await self._wait_for_gateway()
+        slots = list((await run_in_threadpool(rag_service.get_slot_config)).keys())
+        self.slots = {slot: {"status": STATE_PENDING} for slot in slots}
+        semaphore = asyncio.Semaphore(max(1, settings.WARMUP_CONCURRENCY))
+        jobs = [self._warm(slot, semaphore) for slot in slots]
+        if settings.WARMUP_MODEL_CLIENTS:
+            jobs.append(self._warm_model_clients())
+        await asyncio.gather(*jobs)
+
+    async def _run(self):
+        self.state = STATE_RUNNING
+        self.started_at = time.time()
+        try:
+            await asyncio.wait_for(self._warm_all(), timeout=settings.WARMUP_TIMEOUT_SECONDS)
+            self.state = STATE_DONE
+        except asyncio.TimeoutError:
+            pending = [slot for slot, info in self.slots.items() if info["status"] in (STATE_PENDING, STATE_RUNNING)]
+            logger.warning(f"Warm-up hit the {settings.WARMUP_TIMEOUT_SECONDS}s cap; not warmed: {pending}")
+            self.state = STATE_TIMED_OUT
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            self.state = STATE_DONE
+        self.finished_at = time.time()
+        logger.info(
+            f"Warm-up {self.state} in {self.finished_at - self.started_at:.2f}s",
+            extra={"slots": len(self.slots)}
+        )
+
+    def start(self):
+        if not settings.WARMUP_ENABLED:
+            self.state = STATE_DISABLED
+            return
+        if self._task is None:
+            # In the background: the server (and /livez) is up while slots warm
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.state = STATE_STOPPED
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "ready": self.ready,
+            "warmup": self.state,
+            "elapsed_seconds": elapsed,
+            "model_clients": self.model_clients,
+            "slots": self.slots,
+        }
+
+slot_warmup = SlotWarmup()
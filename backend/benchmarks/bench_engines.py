@@ -0,0 +1,165 @@
+"""
+Vector engine benchmark: Chroma (HNSW) vs the exact numpy engine.
+
+Builds the same synthetic slot (bench_retrieval's topic clusters and
+metadata) once per engine and size, then runs the query workload through
+the retrieval path of `chat_service.get_answer` (`get_vector_db` +
+`get_retriever`) with the slot's `engine` setting switched. Per engine it
+reports ingest time, cold first query, p50/p95/p99 latency of unfiltered
+and `where`-filtered searches, recall@k against brute force, RSS and disk.
+
+Usage:
+    python benchmarks/bench_engines.py --sizes 1000,5000,20000 --queries 200
+    python benchmarks/bench_engines.py --sizes 50000 --engines numpy --dim 3072
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import current_rss_mb, dir_size_bytes, write_results
+from bench_retrieval import (
+    COLLECTION_NAME, LookupEmbeddings, chunk_batches, make_queries, topic_centroids,
+    latency_summary, run_queries, score, _reset_chroma_clients,
+)
+
+import chromadb
+from app.services import chat_service, numpy_store, slot_settings
+
+ENGINES = list(slot_settings.ENGINES)
+
+def open_collection(engine: str, persist_dir: str):
+    if engine == slot_settings.ENGINE_NUMPY:
+        slot_settings.save_slot_settings(COLLECTION_NAME, {"engine": engine})
+        return numpy_store.get_collection(COLLECTION_NAME, persist_dir)
+    return chromadb.PersistentClient(path=persist_dir).get_or_create_collection(COLLECTION_NAME)
+
+def build(engine: str, persist_dir: str, size: int, centroids: np.ndarray, args) -> float:
+    """Ingests the slot in upsert batches, like rag_service does. Returns the seconds it took."""
+    collection = open_collection(engine, persist_dir)
+    start = time.perf_counter()
+    for offset, vectors, labels in chunk_batches(size, centroids, args.seed, args.spread):
+        collection.upsert(
+            ids=[f"c{i}" for i in range(offset, offset + len(vectors))],
+            embeddings=vectors.tolist(),
+            metadatas=[{"source": f"/app/data_uploads/topic_{t}.txt", "chunk": offset + i} for i, t in enumerate(labels)],
+            documents=[f"Synthetic chunk {offset + i} about topic {t}." for i, t in enumerate(labels)],
+        )
+    return time.perf_counter() - start
+
+def exact_top_k(size: int, centroids: np.ndarray, queries: np.ndarray, args) -> np.ndarray:
+    best_scores = np.full((len(queries), args.k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), args.k), -1, dtype=np.int64)
+    for offset, vectors, _ in chunk_batches(size, centroids, args.seed, args.spread):
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        candidates = np.concatenate([best_ids, np.tile(np.arange(offset, offset + len(vectors)), (len(queries), 1))], axis=1)
+        order = np.argsort(-scores, axis=1)[:, :args.k]
+        best_scores = np.take_along_axis(scores, order, axis=1)
+        best_ids = np.take_along_axis(candidates, order, axis=1)
+    return best_ids
+
+def filtered_queries(queries: np.ndarray, args) -> list:
+    """Searches restricted to one source file (a `where` on the metadata), straight on the collection."""
+    collection = chat_service.get_vector_db(COLLECTION_NAME, embeddings=LookupEmbeddings({}))._collection
+    seconds = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        collection.query(
+            query_embeddings=[query.tolist()], n_results=args.k,
+            where={"source": f"/app/data_uploads/topic_{i % args.topics}.txt"},
+        )
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+def run_engine(engine: str, size: int, args, workdir: str, centroids, targets, query_vectors, exact) -> dict:
+    persist_dir = os.path.join(workdir, f"{engine}_{size}")
+    os.makedirs(persist_dir, exist_ok=True)
+    chat_service.CHROMA_DB_DIR = persist_dir
+    slot_settings.CHROMA_DB_DIR = persist_dir
+
+    rss_before = current_rss_mb()
+    build_seconds = build(engine, persist_dir, size, centroids, args)
+    _reset_chroma_clients()
+    numpy_store._collections.clear()
+
+    keys = [f"query-{size}-{i}" for i in range(len(targets))]
+    embeddings = LookupEmbeddings(dict(zip(keys, query_vectors.tolist())))
+    start = time.perf_counter()
+    run_queries(COLLECTION_NAME, keys[:1], embeddings, args.k)
+    cold_seconds = time.perf_counter() - start
+    for _ in range(args.warmup):
+        run_queries(COLLECTION_NAME, keys[:1], embeddings, args.k)
+
+    construct, search, results = run_queries(COLLECTION_NAME, keys, embeddings, args.k)
+    filtered = filtered_queries(query_vectors, args)
+    result = {
+        "engine": engine,
+        "size": size,
+        "build_seconds": build_seconds,
+        "cold_first_query_seconds": cold_seconds,
+        "latency": {
+            "total": latency_summary([c + s for c, s in zip(construct, search)]),
+            "search": latency_summary(search),
+            "filtered": latency_summary(filtered),
+        },
+        "quality": score(results, targets, exact, args.k),
+        "rss_growth_mb": current_rss_mb() - rss_before,
+        "disk_bytes": dir_size_bytes(persist_dir),
+    }
+    _reset_chroma_clients()
+    numpy_store._collections.clear()
+    if not args.keep:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,20000", help="Comma separated slot sizes (chunks)")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--k", type=int, default=chat_service.RETRIEVAL_K)
+    parser.add_argument("--dim", type=int, default=1536, help="Vector size (1536 = text-embedding-ada-002)")
+    parser.add_argument("--topics", type=int, default=50, help="Number of topic clusters (= source files)")
+    parser.add_argument("--spread", type=float, default=1.0, help="Chunk noise around its topic centroid")
+    parser.add_argument("--query-noise", type=float, default=0.5, help="Query noise around its labelled chunk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="Where the stores go (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated stores")
+    parser.add_argument("--output", default="bench_engines.json")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    engines = [e for e in args.engines.split(",") if e.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nexus_bench_engines_")
+    print("--- NEXUS VECTOR ENGINE BENCHMARK ---")
+    results = []
+    try:
+        for size in sizes:
+            centroids = topic_centroids(args.topics, args.dim, args.seed)
+            targets, query_vectors = make_queries(size, args.queries, centroids, args.seed, args.spread, args.query_noise)
+            exact = exact_top_k(size, centroids, query_vectors, args)
+            for engine in engines:
+                result = run_engine(engine, size, args, workdir, centroids, targets, query_vectors, exact)
+                results.append(result)
+                latency = result["latency"]
+                print(
+                    f"{size:>7} {engine:>6}: build={result['build_seconds']:.1f}s cold={result['cold_first_query_seconds'] * 1000:.0f}ms "
+                    f"total p50={latency['total']['p50_ms']:.2f}ms p95={latency['total']['p95_ms']:.2f}ms "
+                    f"p99={latency['total']['p99_ms']:.2f}ms filtered p50={latency['filtered']['p50_ms']:.2f}ms "
+                    f"recall@{args.k}={result['quality'][f'recall_at_{args.k}']:.3f} "
+                    f"rss=+{result['rss_growth_mb']:.0f}MB disk={result['disk_bytes'] / 1024 / 1024:.1f}MB"
+                )
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_results(args.output, "engines", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Ingestion throughput benchmark.
+
+Generates synthetic PDF, DOCX, TXT and MD corpora of a controlled size and
+drives them through `rag_service.index_document` (direct) or the
+`/api/v1/ingest` endpoint (api), with embeddings served by the offline
+OpenAI stub. Reports per-stage time (load, split, embed, store), chunks/sec,
+peak RSS and on-disk growth of the Chroma store, and writes JSON results so
+changes to the ingest path can be compared run over run.
+
+Usage:
+    python benchmarks/bench_ingest.py --files 5 --size-kb 200
+    python benchmarks/bench_ingest.py --mode api --formats pdf,txt --stub-profile realistic
+"""
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import (
+    setup_backend_env, openai_stub, peak_rss_mb, current_rss_mb, dir_size_bytes, write_results
+)
+
+FORMATS = ["pdf", "docx", "txt", "md"]
+STAGES = ["load", "split", "embed", "store"]
+
+VOCABULARY = (
+    "cliente contrato factura servicio tratamiento reserva precio garantía política empleado nómina "
+    "vacaciones auditoría balance presupuesto proveedor inventario pedido entrega soporte incidencia "
+    "customer invoice policy employee payroll audit budget supplier order delivery support ticket "
+    "clinic appointment treatment property rental lawyer divorce compliance security backup report"
+).split()
+
+# --- CORPUS GENERATION ---
+def generate_text(size_bytes: int, rng: random.Random) -> str:
+    """Paragraphs of vocabulary words until `size_bytes` is reached."""
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 20))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+def write_txt(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def write_md(path: str, text: str):
+    sections = text.split("\n\n")
+    with open(path, "w", encoding="utf-8") as f:
+        for i, section in enumerate(sections):
+            if i % 4 == 0:
+                f.write(f"## Section {i // 4 + 1}\n\n")
+            f.write(section + "\n\n")
+
+def write_docx(path: str, text: str):
+    """Minimal valid OOXML document (what docx2txt needs), no python-docx required."""
+    body = "".join(
+        f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(p)}</w:t></w:r></w:p>" for p in text.split("\n\n")
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        "</Types>"
+    )
+    rels = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/></Relationships>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("[Content_Types].xml", content_types)
+        z.writestr("_rels/.rels", rels)
+        z.writestr("word/document.xml", document)
+
+def write_pdf(path: str, text: str, chars_per_page: int = 2500):
+    import fitz  # PyMuPDF, already required for ingestion
+
+    doc = fitz.open()
+    for i in range(0, len(text), chars_per_page):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 792), text[i:i + chars_per_page], fontsize=8)
+    doc.save(path)
+    doc.close()
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "txt": write_txt, "md": write_md}
+
+def generate_corpus(corpus_dir: str, formats: list, files: int, size_kb: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    corpus = {}
+    for fmt in formats:
+        corpus[fmt] = []
+        for i in range(files):
+            path = os.path.join(corpus_dir, f"bench_{fmt}_{i:03d}.{fmt}")
+            WRITERS[fmt](path, generate_text(size_kb * 1024, rng))
+            corpus[fmt].append(path)
+    return corpus
+
+# --- DRIVERS ---
+def ingest_direct(path: str, collection: str) -> dict:
+    from app.services import rag_service, upload_store
+    # Same steps as the ingest endpoint: content-addressed save, index, reference
+    filename = os.path.basename(path)
+    with open(path, "rb") as f:
+        upload = upload_store.save(f, filename, rag_service.UPLOAD_DIR)
+    result = rag_service.index_document(
+        upload["path"], collection, source=os.path.join(rag_service.UPLOAD_DIR, filename), file_hash=upload["hash"]
+    )
+    upload_store.add_reference(collection, filename, upload, rag_service.UPLOAD_DIR)
+    return result
+
+def make_api_driver():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    client.__enter__()  # runs the lifespan (SQLite pool, workers)
+
+    def ingest_api(path: str, collection: str) -> dict:
+        with open(path, "rb") as f:
+            response = client.post(
+                "/api/v1/ingest",
+                params={"collection_name": collection},
+                files={"files": (os.path.basename(path), f)},
+                headers={"X-NEXUS-KEY": os.getenv("NEXUS_API_KEY", "")},
+            )
+        response.raise_for_status()
+        result = response.json()["results"][0]
+        if result["status"] != "success":
+            raise RuntimeError(result.get("error"))
+        return result["details"]
+
+    return ingest_api, client
+
+def run_format(fmt: str, paths: list, ingest, chroma_dir: str, collection: str) -> dict:
+    stage_totals = {stage: 0.0 for stage in STAGES}
+    chunks = 0
+    input_bytes = sum(os.path.getsize(p) for p in paths)
+    disk_before = dir_size_bytes(chroma_dir)
+
+    start = time.perf_counter()
+    for path in paths:
+        result = ingest(path, collection)
+        chunks += result["chunks_created"]
+        for stage, seconds in result.get("timings", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+    wall = time.perf_counter() - start
+    disk_after = dir_size_bytes(chroma_dir)
+
+    return {
+        "format": fmt,
+        "files": len(paths),
+        "input_bytes": input_bytes,
+        "chunks": chunks,
+        "wall_seconds": wall,
+        "stage_seconds": stage_totals,
+        "chunks_per_second": chunks / wall if wall else 0.0,
+        "mb_per_second": input_bytes / 1024 / 1024 / wall if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "rss_mb": current_rss_mb(),
+        "disk_growth_bytes": disk_after - disk_before,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="NEXUS ingestion throughput benchmark.")
+    parser.add_argument("--mode", choices=["direct", "api"], default="direct")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--files", type=int, default=3, help="Files per format")
+    parser.add_argument("--size-kb", type=int, default=100, help="Approximate text size per file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--stub-profile", default="instant", help="Profile of the offline OpenAI stub")
+    parser.add_argument("--no-stub", action="store_true", help="Use the real OpenAI API (costs money)")
+    parser.add_argument("--workdir", help="Where corpus, uploads and the Chroma store go (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the workdir afterwards")
+    parser.add_argument("--output", default="bench_ingest.json")
+    args = parser.parse_args()
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nexus_bench_ingest_")
+    corpus_dir = os.path.join(workdir, "corpus")
+    for sub in ("corpus", "uploads", "chroma"):
+        os.makedirs(os.path.join(workdir, sub), exist_ok=True)
+    setup_backend_env(workdir)
+    # Measure ingestion only, not background maintenance
+    os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+    print("--- NEXUS INGESTION BENCHMARK ---")
+    print(f"Generating corpus: {args.files} x {args.size_kb} KB per format ({', '.join(formats)})")
+    corpus = generate_corpus(corpus_dir, formats, args.files, args.size_kb, args.seed)
+
+    stub = contextlib.nullcontext() if args.no_stub else openai_stub(args.stub_profile)
+    results = []
+    client = None
+    try:
+        with stub:
+            from app.services import rag_service
+            rag_service.CHROMA_DB_DIR = os.path.join(workdir, "chroma")
+            rag_service.UPLOAD_DIR = os.path.join(workdir, "uploads")
+
+            ingest = ingest_direct
+            if args.mode == "api":
+                ingest, client = make_api_driver()
+
+            for fmt in formats:
+                collection = f"bench_{fmt}"
+                result = run_format(fmt, corpus[fmt], ingest, rag_service.CHROMA_DB_DIR, collection)
+                results.append(result)
+                stages = " ".join(f"{s}={result['stage_seconds'].get(s, 0):.2f}s" for s in STAGES)
+                print(
+                    f"{fmt:>5}: {result['chunks']} chunks in {result['wall_seconds']:.2f}s "
+                    f"({result['chunks_per_second']:.1f} chunks/s) {stages} "
+                    f"peak_rss={result['peak_rss_mb']:.0f}MB disk=+{result['disk_growth_bytes'] / 1024 / 1024:.1f}MB"
+                )
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_results(args.output, "ingest", vars(args), results)
+
+if __name__ == "__main__":
+    main()
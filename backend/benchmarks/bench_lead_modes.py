@@ -0,0 +1,106 @@
+"""
+Compares the two lead extraction strategies of chat_service.get_answer:
+  - separate: RAG chain + second extraction call
+  - fused:    one structured-output call (answer + lead)
+
+Reports latency (mean/p50/p95) and OpenAI tokens per mode, and writes the
+raw numbers as JSON.
+
+Usage (inside the backend container, with a populated slot):
+    python benchmarks/bench_lead_modes.py --collection nexus_slot_1 --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import setup_backend_env, percentile, write_results
+
+setup_backend_env()
+
+from langchain_community.callbacks import get_openai_callback
+from app.services.chat_service import get_answer, LEAD_MODE_SEPARATE, LEAD_MODE_FUSED
+
+DEFAULT_CONTEXT = "Esto es una clínica estética. Busca tratamientos como Botox, láser o rellenos."
+DEFAULT_QUERIES = [
+    "¿Cuánto cuesta el botox?",
+    "Quiero reservar una cita para el jueves, soy Ana, mi teléfono es 600123123",
+    "¿Qué horario tenéis?",
+]
+
+def run_mode(mode: str, queries: list, collection: str, business_context: str, runs: int) -> dict:
+    latencies = []
+    tokens = {"prompt": 0, "completion": 0, "total": 0, "calls": 0}
+    leads_detected = 0
+
+    for _ in range(runs):
+        for query in queries:
+            with get_openai_callback() as cb:
+                start = time.perf_counter()
+                response = get_answer(
+                    query=query,
+                    collection_name=collection,
+                    business_context=business_context,
+                    lead_mode=mode,
+                )
+                latencies.append(time.perf_counter() - start)
+            tokens["prompt"] += cb.prompt_tokens
+            tokens["completion"] += cb.completion_tokens
+            tokens["total"] += cb.total_tokens
+            tokens["calls"] += cb.successful_requests
+            lead = response.get("lead_data")
+            if lead is not None and lead.is_lead:
+                leads_detected += 1
+
+    requests = len(latencies)
+    return {
+        "mode": mode,
+        "requests": requests,
+        "latency_mean_s": statistics.mean(latencies),
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "tokens_per_request": tokens["total"] / requests,
+        "llm_calls_per_request": tokens["calls"] / requests,
+        "tokens": tokens,
+        "leads_detected": leads_detected,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark separate vs fused lead extraction.")
+    parser.add_argument("--collection", default="nexus_slot_1")
+    parser.add_argument("--business-context", default=DEFAULT_CONTEXT)
+    parser.add_argument("--queries-file", help="JSON list of queries (defaults to a built-in clinic set)")
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions of the query set per mode")
+    parser.add_argument("--output", default="bench_lead_modes.json")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file) as f:
+            queries = json.load(f)
+
+    print("--- NEXUS LEAD EXTRACTION BENCHMARK (separate vs fused) ---")
+    results = []
+    for mode in (LEAD_MODE_SEPARATE, LEAD_MODE_FUSED):
+        result = run_mode(mode, queries, args.collection, args.business_context, args.runs)
+        results.append(result)
+        print(
+            f"{mode:>9}: mean={result['latency_mean_s']:.2f}s p50={result['latency_p50_s']:.2f}s "
+            f"p95={result['latency_p95_s']:.2f}s tokens/req={result['tokens_per_request']:.0f} "
+            f"calls/req={result['llm_calls_per_request']:.1f} leads={result['leads_detected']}"
+        )
+
+    separate, fused = results
+    summary = {
+        "latency_speedup": separate["latency_mean_s"] / fused["latency_mean_s"] if fused["latency_mean_s"] else None,
+        "token_ratio": fused["tokens_per_request"] / separate["tokens_per_request"] if separate["tokens_per_request"] else None,
+    }
+    print(f"Fused is {summary['latency_speedup']:.2f}x faster and uses {summary['token_ratio']:.0%} of the tokens.")
+
+    write_results(args.output, "lead_modes", vars(args), {"modes": results, "summary": summary})
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Retrieval latency and quality benchmark.
+
+Builds synthetic collections (10k .. 1M chunks) whose vectors come from
+known topic clusters, then runs a query workload through the retrieval path
+of `chat_service.get_answer` (`get_vector_db` + `get_retriever`, i.e. a new
+Chroma(...) per request followed by the HNSW search).
+
+Every query is a noisy copy of one labelled chunk, so quality can be scored:
+  - recall@k: overlap of the returned ids with the exact (brute force) top-k
+  - hit@k / MRR: rank of the labelled chunk in the results
+
+Per collection size it reports p50/p95/p99 latency for the construction and
+search stages, cold first-query time (HNSW index load), RSS growth and disk
+size, and writes the numbers as JSON.
+
+Query vectors are looked up instead of embedded, so the numbers isolate the
+vector store; pass --embed-via-stub to also time the OpenAI embedding call
+against the offline stub.
+
+Usage:
+    python benchmarks/bench_retrieval.py --sizes 10000,100000 --queries 200
+    python benchmarks/bench_retrieval.py --sizes 1000000 --dim 384 --hnsw-search-ef 64
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import (
+    setup_backend_env, openai_stub, peak_rss_mb, current_rss_mb, dir_size_bytes, percentile, write_results
+)
+
+setup_backend_env()
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+from langchain_core.embeddings import Embeddings
+from app.services import chat_service
+
+BUILD_BATCH_SIZE = 5000
+COLLECTION_NAME = "bench_retrieval"
+
+class LookupEmbeddings(Embeddings):
+    """
+    Returns the precomputed vector for a query key. With `timed` set, the real
+    embedding call is still made (and timed) so its latency is part of the run.
+    """
+
+    def __init__(self, vectors: dict, timed=None):
+        self.vectors = vectors
+        self.timed = timed
+        self.embed_seconds = []
+
+    def embed_query(self, text: str) -> list:
+        if self.timed is not None:
+            start = time.perf_counter()
+            self.timed.embed_query(text)
+            self.embed_seconds.append(time.perf_counter() - start)
+        return self.vectors[text]
+
+    def embed_documents(self, texts: list) -> list:
+        return [self.embed_query(text) for text in texts]
+
+# --- SYNTHETIC DATA ---
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+def topic_centroids(topics: int, dim: int, seed: int) -> np.ndarray:
+    return _unit(np.random.default_rng(seed).standard_normal((topics, dim))).astype(np.float32)
+
+def chunk_batches(size: int, centroids: np.ndarray, seed: int, spread: float):
+    """
+    Yields (start, vectors, topics) batches. Each batch has its own seed, so a
+    batch can be regenerated without materializing the whole collection.
+    """
+    topics, dim = centroids.shape
+    for start in range(0, size, BUILD_BATCH_SIZE):
+        count = min(BUILD_BATCH_SIZE, size - start)
+        rng = np.random.default_rng((seed, start))
+        labels = rng.integers(0, topics, count)
+        noise = rng.standard_normal((count, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+        yield start, _unit(centroids[labels] + noise).astype(np.float32), labels
+
+def make_queries(size: int, count: int, centroids: np.ndarray, seed: int, spread: float, query_noise: float):
+    """Picks `count` labelled chunks and perturbs them into query vectors."""
+    rng = np.random.default_rng(seed + 1)
+    targets = np.sort(rng.choice(size, size=min(count, size), replace=False))
+    vectors = np.zeros((len(targets), centroids.shape[1]), dtype=np.float32)
+    for start, batch, _ in chunk_batches(size, centroids, seed, spread):
+        in_batch = (targets >= start) & (targets < start + len(batch))
+        vectors[in_batch] = batch[targets[in_batch] - start]
+    noise = rng.standard_normal(vectors.shape).astype(np.float32) * (query_noise / np.sqrt(vectors.shape[1]))
+    return targets, _unit(vectors + noise).astype(np.float32)
+
+def build_collection(persist_dir: str, size: int, centroids: np.ndarray, seed: int, spread: float,
+                     queries: np.ndarray, k: int, hnsw: dict):
+    """
+    Inserts the chunks with the metadata shape ingest produces and computes the
+    exact top-k of every query on the way (running brute force per batch).
+    """
+    client = chromadb.PersistentClient(path=persist_dir)
+    collection = client.get_or_create_collection(COLLECTION_NAME, metadata=hnsw or None)
+
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for start, vectors, labels in chunk_batches(size, centroids, seed, spread):
+        ids = [f"c{i}" for i in range(start, start + len(vectors))]
+        collection.add(
+            ids=ids,
+            embeddings=vectors.tolist(),
+            metadatas=[{"source": f"/app/data_uploads/topic_{t}.txt", "chunk": start + i} for i, t in enumerate(labels)],
+            documents=[f"Synthetic chunk {start + i} about topic {t}." for i, t in enumerate(labels)],
+        )
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        candidates = np.concatenate([best_ids, np.tile(np.arange(start, start + len(vectors)), (len(queries), 1))], axis=1)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, order, axis=1)
+        best_ids = np.take_along_axis(candidates, order, axis=1)
+    return best_ids
+
+def _reset_chroma_clients():
+    # Drop cached clients so the next Chroma(...) reloads the index from disk (cold start)
+    clear = getattr(SharedSystemClient, "clear_system_cache", None)
+    if clear is not None:
+        clear()
+
+# --- WORKLOAD ---
+def run_queries(collection_name: str, keys: list, embeddings: LookupEmbeddings, k: int):
+    """Same calls as get_answer: new vector store handle, then the retriever."""
+    construct, search, results = [], [], []
+    for key in keys:
+        start = time.perf_counter()
+        vector_db = chat_service.get_vector_db(collection_name, embeddings=embeddings)
+        built = time.perf_counter()
+        docs = chat_service.get_retriever(vector_db, k=k).get_relevant_documents(key)
+        done = time.perf_counter()
+        construct.append(built - start)
+        search.append(done - built)
+        results.append([doc.metadata["chunk"] for doc in docs])
+    return construct, search, results
+
+def score(results: list, targets: np.ndarray, exact: np.ndarray, k: int) -> dict:
+    recall, hits, reciprocal_ranks = [], 0, []
+    for returned, target, truth in zip(results, targets, exact):
+        returned = returned[:k]
+        recall.append(len(set(returned) & set(truth.tolist())) / k)
+        if target in returned:
+            hits += 1
+            reciprocal_ranks.append(1.0 / (returned.index(target) + 1))
+        else:
+            reciprocal_ranks.append(0.0)
+    return {
+        f"recall_at_{k}": float(np.mean(recall)),
+        f"hit_at_{k}": hits / len(results),
+        "mrr": float(np.mean(reciprocal_ranks)),
+    }
+
+def latency_summary(values: list) -> dict:
+    return {
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "mean_ms": float(np.mean(values)) * 1000,
+    }
+
+def run_size(size: int, args, workdir: str, timed_embeddings) -> dict:
+    persist_dir = os.path.join(workdir, f"chroma_{size}")
+    centroids = topic_centroids(args.topics, args.dim, args.seed)
+    targets, query_vectors = make_queries(size, args.queries, centroids, args.seed, args.spread, args.query_noise)
+    hnsw = {
+        key: value for key, value in {
+            "hnsw:M": args.hnsw_m,
+            "hnsw:construction_ef": args.hnsw_construction_ef,
+            "hnsw:search_ef": args.hnsw_search_ef,
+        }.items() if value is not None
+    }
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    exact = build_collection(persist_dir, size, centroids, args.seed, args.spread, query_vectors, args.k, hnsw)
+    build_seconds = time.perf_counter() - start
+    _reset_chroma_clients()
+
+    keys = [f"query-{size}-{i}" for i in range(len(targets))]
+    embeddings = LookupEmbeddings(dict(zip(keys, query_vectors.tolist())), timed=timed_embeddings)
+    chat_service.CHROMA_DB_DIR = persist_dir
+
+    # Cold: first query after (re)opening the store loads the HNSW index
+    rss_cold = current_rss_mb()
+    start = time.perf_counter()
+    run_queries(COLLECTION_NAME, keys[:1], embeddings, args.k)
+    cold_seconds = time.perf_counter() - start
+    rss_loaded = current_rss_mb()
+
+    for _ in range(args.warmup):
+        run_queries(COLLECTION_NAME, keys[:1], embeddings, args.k)
+    embeddings.embed_seconds.clear()
+
+    construct, search, results = run_queries(COLLECTION_NAME, keys, embeddings, args.k)
+    total = [c + s for c, s in zip(construct, search)]
+
+    _reset_chroma_clients()
+    result = {
+        "size": size,
+        "queries": len(keys),
+        "build_seconds": build_seconds,
+        "cold_first_query_seconds": cold_seconds,
+        "latency": {
+            "construct": latency_summary(construct),
+            "search": latency_summary(search),
+            "total": latency_summary(total),
+        },
+        "quality": score(results, targets, exact, args.k),
+        "memory": {
+            "rss_build_growth_mb": rss_cold - rss_before,
+            "rss_index_load_mb": rss_loaded - rss_cold,
+            "rss_mb": current_rss_mb(),
+            "peak_rss_mb": peak_rss_mb(),
+        },
+        "disk_bytes": dir_size_bytes(persist_dir),
+    }
+    if embeddings.embed_seconds:
+        result["latency"]["embed"] = latency_summary(embeddings.embed_seconds)
+    if not args.keep:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="NEXUS retrieval latency/quality benchmark.")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma separated collection sizes (chunks)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--k", type=int, default=chat_service.RETRIEVAL_K)
+    parser.add_argument("--dim", type=int, default=1536, help="Vector size (1536 = text-embedding-ada-002)")
+    parser.add_argument("--topics", type=int, default=200, help="Number of topic clusters")
+    parser.add_argument("--spread", type=float, default=1.0, help="Chunk noise around its topic centroid")
+    parser.add_argument("--query-noise", type=float, default=0.5, help="Query noise around its labelled chunk")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--hnsw-construction-ef", type=int)
+    parser.add_argument("--hnsw-search-ef", type=int)
+    parser.add_argument("--embed-via-stub", action="store_true", help="Also time the query embedding call (offline stub)")
+    parser.add_argument("--stub-profile", default="instant")
+    parser.add_argument("--workdir", help="Where the Chroma stores go (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated stores")
+    parser.add_argument("--output", default="bench_retrieval.json")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="nexus_bench_retrieval_")
+    os.makedirs(workdir, exist_ok=True)
+
+    print("--- NEXUS RETRIEVAL BENCHMARK ---")
+    stub = openai_stub(args.stub_profile) if args.embed_via_stub else contextlib.nullcontext()
+    results = []
+    try:
+        with stub:
+            timed_embeddings = None
+            if args.embed_via_stub:
+                from langchain_openai import OpenAIEmbeddings
+                timed_embeddings = OpenAIEmbeddings()
+
+            for size in sizes:
+                print(f"Building {size} chunks (dim={args.dim})...")
+                result = run_size(size, args, workdir, timed_embeddings)
+                results.append(result)
+                latency, quality = result["latency"], result["quality"]
+                print(
+                    f"{size:>8}: build={result['build_seconds']:.1f}s cold={result['cold_first_query_seconds'] * 1000:.0f}ms "
+                    f"total p50={latency['total']['p50_ms']:.1f}ms p95={latency['total']['p95_ms']:.1f}ms "
+                    f"p99={latency['total']['p99_ms']:.1f}ms (construct p50={latency['construct']['p50_ms']:.1f}ms) "
+                    f"recall@{args.k}={quality[f'recall_at_{args.k}']:.3f} mrr={quality['mrr']:.3f} "
+                    f"index_rss=+{result['memory']['rss_index_load_mb']:.0f}MB disk={result['disk_bytes'] / 1024 / 1024:.0f}MB"
+                )
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_results(args.output, "retrieval", vars(args), results)
+
+if __name__ == "__main__":
+    main()
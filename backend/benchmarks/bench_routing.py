@@ -0,0 +1,99 @@
+"""
+Auto slot routing benchmark.
+
+Builds a synthetic codebook (--slots slots of --codes centroids each, every
+slot drawn around its own topic) straight into the router's in-memory
+snapshot, then routes noisy copies of the codes and reports:
+  - p50/p95/p99 latency of `SlotRouter.route` (projected coarse pass +
+    exact rescoring of the shortlist)
+  - top-1 agreement with exact scoring of every code, and hit@top_n of the
+    slot the query was drawn from
+  - index build time
+
+Usage:
+    python benchmarks/bench_routing.py --slots 1000,5000 --queries 2000
+    python benchmarks/bench_routing.py --slots 3000 --dim 3072 --projection-dim 32 --shortlist 64
+"""
+import argparse
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import setup_backend_env, percentile, write_results
+
+setup_backend_env()
+
+from app.services.slot_router import SlotRouter, _unit
+
+def build_router(slots: int, codes: int, dim: int, args, rng) -> tuple:
+    router = SlotRouter(codes, args.projection_dim, args.shortlist, refresh_interval=0)
+    topics = _unit(rng.standard_normal((slots, dim)))
+    entries = {}
+    for s in range(slots):
+        centroids = _unit(topics[s] + args.spread * rng.standard_normal((codes, dim)) / np.sqrt(dim))
+        entries[f"slot{s}"] = {
+            "codes": {c: [centroids[c], 100] for c in range(codes)},
+            "built": 100 * codes,
+            "signature": [(c, 100, zlib.crc32(centroids[c].tobytes())) for c in range(codes)],
+        }
+    router._slots = entries
+    start = time.perf_counter()
+    router._build_index()
+    return router, time.perf_counter() - start
+
+def run(slots: int, args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    router, build_seconds = build_router(slots, args.codes, args.dim, args, rng)
+    index = router._index
+    latencies, agree, hits = [], 0, 0
+    for _ in range(args.queries):
+        source = int(rng.integers(slots))
+        code = index.full[index.slot_rows[source][int(rng.integers(args.codes))]]
+        query = _unit(code + args.noise * rng.standard_normal(args.dim) / np.sqrt(args.dim))[0]
+        start = time.perf_counter()
+        routed = router.route(query, args.top_n)
+        latencies.append(time.perf_counter() - start)
+        exact = (index.full[index.slot_rows.ravel()] @ query).reshape(index.slot_rows.shape).max(axis=1)
+        agree += routed[0]["collection"] == index.names[int(np.argmax(exact))]
+        hits += any(r["collection"] == index.names[source] for r in routed)
+    result = {
+        "slots": slots,
+        "codes": slots * args.codes,
+        "build_seconds": round(build_seconds, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "top1_vs_exact": round(agree / args.queries, 4),
+        f"hit@{args.top_n}": round(hits / args.queries, 4),
+    }
+    print(
+        f"{slots:>6} slots  build {result['build_seconds']:.2f}s  "
+        f"p50 {result['p50_ms']:.3f}ms  p95 {result['p95_ms']:.3f}ms  p99 {result['p99_ms']:.3f}ms  "
+        f"top1 {result['top1_vs_exact']:.3f}  hit@{args.top_n} {result[f'hit@{args.top_n}']:.3f}"
+    )
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slots", default="100,1000,5000", help="comma separated slot counts")
+    parser.add_argument("--codes", type=int, default=4, help="centroids per slot")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--projection-dim", type=int, default=64)
+    parser.add_argument("--shortlist", type=int, default=32)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--spread", type=float, default=0.8, help="code spread around the slot topic")
+    parser.add_argument("--noise", type=float, default=0.5, help="query noise around its code")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_routing_results.json")
+    args = parser.parse_args()
+
+    results = [run(int(slots), args) for slots in args.slots.split(",")]
+    write_results(args.output, "routing", vars(args), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Startup import-time budget.
+
+Imports `app.main` in fresh interpreters under `python -X importtime` and
+reports wall time, RSS after import and the most expensive top-level
+packages. Also checks that the heavy, rarely used stacks (ragas, datasets,
+llama-index, pandas) are not loaded at startup, and measures what importing
+the evaluation stack would add on top. Exits non-zero when a budget is
+exceeded, so it can gate CI or a deploy.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 3000 --budget-rss-mb 250
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+from collections import defaultdict
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import BACKEND_DIR, setup_backend_env, percentile, write_results
+
+# Must not be imported by a chat/ingest worker until an evaluation request arrives
+LAZY_MODULES = ["ragas", "datasets", "llama_index", "pandas", "pyarrow"]
+
+CHILD = """
+import json, os, sys, time
+sys.path.insert(0, {benchmarks_dir!r})
+from common import current_rss_mb
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "import_seconds": seconds,
+    "rss_mb": current_rss_mb(),
+    "modules": len(sys.modules),
+    "lazy_loaded": [m for m in {lazy!r} if m in sys.modules],
+}}))
+"""
+
+def parse_importtime(stderr: str) -> dict:
+    """`-X importtime` lines -> self time (us) per top-level package."""
+    per_package = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|")
+            per_package[name.strip().split(".")[0]] += int(self_us)
+        except ValueError:
+            continue
+    return per_package
+
+def run_child(module: str) -> tuple:
+    code = CHILD.format(
+        benchmarks_dir=os.path.dirname(os.path.abspath(__file__)), module=module, lazy=LAZY_MODULES
+    )
+    env = dict(os.environ, SCHEDULER_ENABLED="false", LOG_LEVEL="WARNING")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        tail = "\n".join(line for line in completed.stderr.splitlines() if not line.startswith("import time:"))
+        raise RuntimeError(f"Importing {module} failed:\n{tail[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(completed.stderr)
+
+def measure(module: str, runs: int) -> dict:
+    seconds, rss, packages = [], [], defaultdict(list)
+    lazy_loaded, modules = [], 0
+    for _ in range(runs):
+        result, per_package = run_child(module)
+        seconds.append(result["import_seconds"])
+        rss.append(result["rss_mb"])
+        modules = result["modules"]
+        lazy_loaded = result["lazy_loaded"]
+        for package, us in per_package.items():
+            packages[package].append(us)
+    top = sorted(
+        ((package, percentile(values, 50) / 1000) for package, values in packages.items()),
+        key=lambda item: item[1], reverse=True,
+    )
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms_p50": percentile(seconds, 50) * 1000,
+        "import_ms_max": max(seconds) * 1000,
+        "rss_mb_p50": percentile(rss, 50),
+        "modules_loaded": modules,
+        "lazy_modules_loaded": lazy_loaded,
+        "top_packages_ms": [{"package": p, "self_ms": round(ms, 1)} for p, ms in top[:15]],
+    }
+
+def print_report(result: dict):
+    print(
+        f"{result['module']}: {result['import_ms_p50']:.0f} ms p50 (max {result['import_ms_max']:.0f} ms), "
+        f"RSS {result['rss_mb_p50']:.0f} MB, {result['modules_loaded']} modules"
+    )
+    for entry in result["top_packages_ms"]:
+        print(f"    {entry['package']:<28} {entry['self_ms']:>8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="NEXUS startup import-time budget.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement (first run is a cold cache)")
+    parser.add_argument("--budget-ms", type=float, default=0, help="Fail if `import app.main` p50 exceeds this (0 = report only)")
+    parser.add_argument("--budget-rss-mb", type=float, default=0, help="Fail if RSS after startup import exceeds this")
+    parser.add_argument("--skip-evaluation", action="store_true", help="Do not measure the evaluation stack")
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="nexus_bench_startup_")
+    setup_backend_env(workdir)
+
+    print("--- NEXUS STARTUP IMPORT BUDGET ---")
+    results = {"startup": measure("app.main", args.runs)}
+    print_report(results["startup"])
+    if not args.skip_evaluation:
+        try:
+            results["evaluation"] = measure("app.services.evaluation_service", args.runs)
+            print_report(results["evaluation"])
+            print(
+                f"Evaluation stack on first use: +{results['evaluation']['import_ms_p50'] - results['startup']['import_ms_p50']:.0f} ms, "
+                f"+{results['evaluation']['rss_mb_p50'] - results['startup']['rss_mb_p50']:.0f} MB"
+            )
+        except RuntimeError as e:
+            print(f"Evaluation stack not measured: {e}")
+
+    failures = []
+    startup = results["startup"]
+    if startup["lazy_modules_loaded"]:
+        failures.append(f"loaded at startup: {', '.join(startup['lazy_modules_loaded'])}")
+    if args.budget_ms and startup["import_ms_p50"] > args.budget_ms:
+        failures.append(f"import {startup['import_ms_p50']:.0f} ms > budget {args.budget_ms:.0f} ms")
+    if args.budget_rss_mb and startup["rss_mb_p50"] > args.budget_rss_mb:
+        failures.append(f"RSS {startup['rss_mb_p50']:.0f} MB > budget {args.budget_rss_mb:.0f} MB")
+    results["failures"] = failures
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args.output, "startup", vars(args), results)
+    if failures:
+        print("BUDGET EXCEEDED: " + "; ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
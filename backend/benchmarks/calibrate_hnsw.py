@@ -0,0 +1,182 @@
+"""
+HNSW calibration for one slot.
+
+Samples the slot's own vectors, holds out --queries of them as queries and
+builds Chroma's HNSW implementation (chroma-hnswlib) over the rest for every
+(M, construction_ef) of the grid, then measures recall@k against exact
+search and single-query latency for every search_ef. Recommends the fastest
+setting (p95) whose recall reaches --target-recall; --apply stores it in the
+slot's settings, after which POST /api/v1/slots/<slot>/index/rebuild applies
+it to the existing data.
+
+Reads the store the way the app does (VECTOR_STORE_MODE), so run it inside
+the backend container. Nothing is written unless --apply.
+
+Usage:
+    python benchmarks/calibrate_hnsw.py --slot nexus_slot_1
+    python benchmarks/calibrate_hnsw.py --slot nexus_slot_1 --m 8,16,32 --search-ef 10,20,40,80 --target-recall 0.98 --apply
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from common import setup_backend_env, percentile, write_results
+
+setup_backend_env()
+
+import hnswlib
+from app.services import slot_settings, vector_store
+from app.services.slot_router import sample_embeddings
+
+# Chroma's defaults, always part of the grid as the baseline
+CHROMA_DEFAULTS = {"M": 16, "construction_ef": 100, "search_ef": 10}
+
+def _ints(value: str) -> list:
+    return sorted({int(v) for v in value.split(",") if v.strip()})
+
+def sample_vectors(collection, max_vectors: int, rng) -> np.ndarray:
+    """
+    All vectors of the slot, or up to `max_vectors` spread over it. Sampled
+    per shard, like the router (paging a sharded slot by offset reads
+    offset + limit rows from every shard for each page).
+    """
+    return np.asarray(sample_embeddings(collection, max_vectors, rng), dtype=np.float32)
+
+def exact_top_k(base: np.ndarray, queries: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Ground truth in the slot's distance space (brute force)."""
+    if space == "cosine":
+        base = base / np.maximum(np.linalg.norm(base, axis=1, keepdims=True), 1e-12)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    similarities = queries @ base.T
+    if space == "l2":
+        # Squared L2 up to the per-query constant |q|^2
+        similarities = 2 * similarities - np.sum(base * base, axis=1)[None, :]
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    return top
+
+def estimate_index_bytes(count: int, dim: int, M: int) -> int:
+    # Same estimate as app/services/collection_memory.py
+    per_element = dim * 4 + (2 * M + 1) * 4 + 8 + (M * 4 + 4) // max(M - 1, 1)
+    return count * per_element
+
+def measure(base: np.ndarray, queries: np.ndarray, truth: np.ndarray, space: str, M: int,
+            construction_ef: int, search_efs: list, args) -> list:
+    index = hnswlib.Index(space=space, dim=base.shape[1])
+    start = time.perf_counter()
+    index.init_index(max_elements=len(base), M=M, ef_construction=construction_ef)
+    index.add_items(base, np.arange(len(base)), num_threads=args.threads)
+    build_seconds = time.perf_counter() - start
+    rows = []
+    for search_ef in search_efs:
+        index.set_ef(max(search_ef, args.k))
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            labels, _ = index.knn_query(query[None, :], k=args.k, num_threads=1)
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(set(labels[0].tolist()) & set(expected.tolist())) / args.k)
+        rows.append({
+            "M": M,
+            "construction_ef": construction_ef,
+            "search_ef": search_ef,
+            f"recall_at_{args.k}": round(float(np.mean(recalls)), 4),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "build_seconds": round(build_seconds, 2),
+            "estimated_index_bytes": estimate_index_bytes(len(base), base.shape[1], M),
+        })
+    return rows
+
+def recommend(rows: list, k: int, target: float) -> dict:
+    """Fastest (p95) setting reaching the target recall (then smallest M/ef); else the most accurate one."""
+    recall = f"recall_at_{k}"
+    passing = [row for row in rows if row[recall] >= target]
+    if passing:
+        return min(passing, key=lambda row: (row["p95_ms"], row["M"], row["construction_ef"], row["search_ef"]))
+    return max(rows, key=lambda row: (row[recall], -row["p95_ms"]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slot", required=True, help="collection name, e.g. nexus_slot_1")
+    parser.add_argument("--persist-dir", default=slot_settings.CHROMA_DB_DIR)
+    parser.add_argument("--m", default="8,16,32", help="M values")
+    parser.add_argument("--construction-ef", default="100,200", help="construction_ef values")
+    parser.add_argument("--search-ef", default="10,20,40,80,160", help="search_ef values")
+    parser.add_argument("--space", choices=slot_settings.SPACES, help="distance (default: the slot's, else l2)")
+    parser.add_argument("--k", type=int, default=6, help="results per query (chat retrieves 6)")
+    parser.add_argument("--queries", type=int, default=200, help="held-out vectors used as queries")
+    parser.add_argument("--max-vectors", type=int, default=100000, help="sample size for large slots")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="index build threads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--apply", action="store_true", help="store the recommendation in the slot settings")
+    parser.add_argument("--output", default="calibrate_hnsw.json")
+    args = parser.parse_args()
+
+    slot_settings.CHROMA_DB_DIR = args.persist_dir
+    options = slot_settings.get_slot_settings(args.slot)
+    if options["engine"] != slot_settings.ENGINE_CHROMA:
+        parser.error(f"{args.slot} uses the {options['engine']} engine, which has no HNSW index")
+    space = args.space or options["hnsw_space"] or "l2"
+    rng = np.random.default_rng(args.seed)
+
+    collection = vector_store.open_store(args.slot, None, args.persist_dir)._collection
+    vectors = sample_vectors(collection, args.max_vectors, rng)
+    if len(vectors) <= args.queries + args.k:
+        parser.error(f"{args.slot} holds {len(vectors)} vectors: not enough to calibrate (exact search is cheap at this size)")
+    held_out = rng.choice(len(vectors), size=args.queries, replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    base, queries = vectors[mask], vectors[held_out]
+    truth = exact_top_k(base, queries, args.k, space)
+    print(f"--- HNSW CALIBRATION: {args.slot} ({len(base)} vectors, dim={base.shape[1]}, space={space}, k={args.k}) ---")
+
+    search_efs = sorted(set(_ints(args.search_ef)) | {CHROMA_DEFAULTS["search_ef"]})
+    grid = [(M, ef) for M in _ints(args.m) for ef in _ints(args.construction_ef)]
+    if (CHROMA_DEFAULTS["M"], CHROMA_DEFAULTS["construction_ef"]) not in grid:
+        grid.insert(0, (CHROMA_DEFAULTS["M"], CHROMA_DEFAULTS["construction_ef"]))
+    rows = []
+    for M, construction_ef in grid:
+        for row in measure(base, queries, truth, space, M, construction_ef, search_efs, args):
+            rows.append(row)
+            print(
+                f"M={row['M']:>3} construction_ef={row['construction_ef']:>4} search_ef={row['search_ef']:>4}: "
+                f"recall@{args.k}={row[f'recall_at_{args.k}']:.3f} p50={row['p50_ms']:.3f}ms p95={row['p95_ms']:.3f}ms "
+                f"build={row['build_seconds']:.1f}s index~{row['estimated_index_bytes'] / 1048576:.0f}MB"
+            )
+
+    best = recommend(rows, args.k, args.target_recall)
+    baseline = next(row for row in rows if all(row[key] == value for key, value in CHROMA_DEFAULTS.items()))
+    recommendation = {
+        # Left unset (Chroma's l2) unless chosen: an explicit value would flag every collection for a rebuild
+        "hnsw_space": space if args.space or options["hnsw_space"] else None,
+        "hnsw_m": best["M"],
+        "hnsw_construction_ef": best["construction_ef"],
+        "hnsw_search_ef": best["search_ef"],
+    }
+    reached = best[f"recall_at_{args.k}"] >= args.target_recall
+    print(
+        f"Recommended: {recommendation} (recall {best[f'recall_at_{args.k}']:.3f}, p95 {best['p95_ms']:.3f}ms; "
+        f"Chroma defaults: recall {baseline[f'recall_at_{args.k}']:.3f}, p95 {baseline['p95_ms']:.3f}ms)"
+        + ("" if reached else f" -- no setting reached recall {args.target_recall}, widen the grid")
+    )
+    if args.apply:
+        slot_settings.save_slot_settings(args.slot, recommendation)
+        print(f"Saved to the slot settings; rebuild to apply: POST /api/v1/slots/{args.slot}/index/rebuild")
+
+    write_results(args.output, "calibrate_hnsw", vars(args), {
+        "slot": args.slot,
+        "vectors": len(base),
+        "space": space,
+        "grid": rows,
+        "baseline": baseline,
+        "recommendation": recommendation,
+        "target_reached": reached,
+    })
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Shared helpers for the benchmark scripts (paths, offline stub, memory/disk
+probes, percentiles and result files).
+"""
+import contextlib
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+def setup_backend_env(workdir: str = None):
+    """
+    Makes `app` importable and fills the env vars app.core.config insists on,
+    so benchmarks can run outside the container.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.append(BACKEND_DIR)
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    if workdir:
+        os.environ.setdefault("DB_PATH", os.path.join(workdir, "nexus.db"))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextlib.contextmanager
+def openai_stub(profile: str = "instant", port: int = None):
+    """
+    Runs stubs/openai_stub.py in a subprocess and points the OpenAI clients at it.
+    Must be entered before LangChain/OpenAI clients are created.
+    """
+    port = port or _free_port()
+    env = dict(os.environ, STUB_PROFILE=profile)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "stubs.openai_stub:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}/v1"
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f"{base_url}/models", timeout=1)
+                break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("OpenAI stub did not start")
+        previous = {k: os.environ.get(k) for k in ("OPENAI_BASE_URL", "OPENAI_API_BASE", "OPENAI_API_KEY")}
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ["OPENAI_API_BASE"] = base_url
+        os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "sk-stub"
+        try:
+            yield base_url
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (MB)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return peak_rss_mb()
+
+def dir_size_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def write_results(path: str, benchmark: str, params: dict, results):
+    """Machine-readable output: one JSON document per run, comparable run over run."""
+    document = {
+        "benchmark": benchmark,
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    print(f"Results written to {path}")
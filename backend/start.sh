@@ -0,0 +1,41 @@
+#!/bin/sh
+# Container entrypoint.
+#   VECTOR_STORE_MODE=embedded (default): one uvicorn worker opens /app/chroma_db itself.
+#   VECTOR_STORE_MODE=server: a local Chroma server owns /app/chroma_db and
+#   WEB_CONCURRENCY uvicorn workers connect to it over keep-alive HTTP.
+#   Set CHROMA_SERVER_AUTOSTART=false to use a Chroma server running elsewhere.
+set -e
+
+CHROMA_PID=""
+if [ "${VECTOR_STORE_MODE:-embedded}" = "server" ] && [ "${CHROMA_SERVER_AUTOSTART:-true}" = "true" ]; then
+    chroma run --path /app/chroma_db \
+        --host "${CHROMA_SERVER_HOST:-127.0.0.1}" --port "${CHROMA_SERVER_PORT:-8001}" &
+    CHROMA_PID=$!
+    # Workers wait for the heartbeat themselves (/readyz), this only avoids noisy startup logs
+    python -c "
+import sys, time, urllib.request
+url = 'http://${CHROMA_SERVER_HOST:-127.0.0.1}:${CHROMA_SERVER_PORT:-8001}/api/v1/heartbeat'
+for _ in range(120):
+    try:
+        urllib.request.urlopen(url, timeout=1)
+        sys.exit(0)
+    except Exception:
+        time.sleep(0.5)
+sys.exit('Chroma server did not start')
+"
+fi
+
+set +e
+uvicorn app.main:app --host 0.0.0.0 --port 8000 --loop asyncio \
+    --proxy-headers --forwarded-allow-ips "*" &
+APP_PID=$!
+
+trap 'kill -TERM $APP_PID 2>/dev/null; wait $APP_PID; [ -n "$CHROMA_PID" ] && kill -TERM $CHROMA_PID 2>/dev/null; wait' TERM INT
+wait $APP_PID
+status=$?
+# uvicorn has exited: stop the gateway after it so in-flight writes are not cut off
+if [ -n "$CHROMA_PID" ]; then
+    kill -TERM $CHROMA_PID 2>/dev/null || true
+    wait $CHROMA_PID 2>/dev/null || true
+fi
+exit $status
@@ -0,0 +1,364 @@
+"""
+Offline, deterministic OpenAI-compatible stub.
+
+Implements the endpoints NEXUS uses:
+  - POST /v1/embeddings            (OpenAIEmbeddings; float or base64 encoding)
+  - POST /v1/chat/completions      (ChatOpenAI; streaming, tools/functions for structured output)
+  - POST /v1/audio/transcriptions  (Whisper in rag_service.transcribe_audio)
+  - GET  /v1/models
+
+Same input -> same output, so benchmarks and load tests are reproducible.
+Embeddings use the hashing trick over words, so texts sharing words are close
+in cosine space and retrieval still behaves sensibly.
+
+Latency, error and rate-limit behaviour come from a profile (STUB_PROFILE)
+and can be overridden with env vars or at runtime through /stub/config.
+
+Run:
+    uvicorn stubs.openai_stub:app --port 8100
+and point the API at it:
+    OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=sk-stub
+
+NOTE: langchain's OpenAIEmbeddings tokenizes with tiktoken, which downloads its
+BPE files on first use. On air-gapped boxes pre-populate TIKTOKEN_CACHE_DIR.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import time
+import uuid
+from collections import deque
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+PROFILES = {
+    # No added latency, never fails: raw throughput of the API itself
+    "instant": {"latency_ms": 0, "jitter_ms": 0, "per_token_ms": 0, "error_rate": 0.0, "rate_limit_rpm": 0},
+    # Roughly what gpt-3.5-turbo / ada-002 feel like from Europe
+    "realistic": {"latency_ms": 350, "jitter_ms": 150, "per_token_ms": 12, "error_rate": 0.0, "rate_limit_rpm": 0},
+    # Realistic latency plus 10% 500s
+    "flaky": {"latency_ms": 350, "jitter_ms": 150, "per_token_ms": 12, "error_rate": 0.1, "rate_limit_rpm": 0},
+    # Realistic latency plus a low requests-per-minute cap (429 + Retry-After)
+    "throttled": {"latency_ms": 350, "jitter_ms": 150, "per_token_ms": 12, "error_rate": 0.0, "rate_limit_rpm": 60},
+}
+
+EMBEDDING_DIMENSIONS = int(os.getenv("STUB_EMBEDDING_DIMENSIONS", "1536"))
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def _load_config() -> dict:
+    config = dict(PROFILES[os.getenv("STUB_PROFILE", "instant")])
+    for key in config:
+        env_value = os.getenv(f"STUB_{key.upper()}")
+        if env_value is not None:
+            config[key] = type(config[key])(env_value)
+    config["seed"] = int(os.getenv("STUB_SEED", "42"))
+    return config
+
+config = _load_config()
+_rng = random.Random(config["seed"])
+_recent_requests = deque()
+stats = {"requests": 0, "errors": 0, "rate_limited": 0, "by_endpoint": {}}
+
+app = FastAPI(title="NEXUS OpenAI Stub", version="1.0.0")
+
+# --- HELPERS ---
+def _count_tokens(text: str) -> int:
+    # ~4 chars per token, like OpenAI's rule of thumb
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+def _error(status_code: int, message: str, error_type: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": error_type}},
+        headers=headers,
+    )
+
+async def _simulate(endpoint: str, output_tokens: int = 0):
+    """Applies the active profile. Returns an error response, or None to proceed."""
+    stats["requests"] += 1
+    stats["by_endpoint"][endpoint] = stats["by_endpoint"].get(endpoint, 0) + 1
+
+    rpm = config["rate_limit_rpm"]
+    if rpm:
+        now = time.monotonic()
+        while _recent_requests and now - _recent_requests[0] > 60:
+            _recent_requests.popleft()
+        if len(_recent_requests) >= rpm:
+            stats["rate_limited"] += 1
+            retry_after = max(1, math.ceil(60 - (now - _recent_requests[0])))
+            return _error(429, "Rate limit reached (stub).", "rate_limit_exceeded", {"retry-after": str(retry_after)})
+        _recent_requests.append(now)
+
+    delay_ms = config["latency_ms"] + config["per_token_ms"] * output_tokens
+    if config["jitter_ms"]:
+        delay_ms += _rng.uniform(-config["jitter_ms"], config["jitter_ms"])
+    if delay_ms > 0:
+        await asyncio.sleep(delay_ms / 1000)
+
+    if config["error_rate"] and _rng.random() < config["error_rate"]:
+        stats["errors"] += 1
+        return _error(500, "The server had an error while processing your request (stub).", "server_error")
+    return None
+
+def _digest(text: str) -> bytes:
+    return hashlib.md5(text.encode("utf-8")).digest()
+
+def embed_text(item, dimensions: int = EMBEDDING_DIMENSIONS) -> list:
+    """Deterministic hashing-trick embedding (unit norm). Accepts text or token ids."""
+    if isinstance(item, list):
+        features = [f"t{token}" for token in item]
+    else:
+        features = WORD_RE.findall(str(item).lower())
+    vector = [0.0] * dimensions
+    for feature in features or ["<empty>"]:
+        digest = _digest(feature)
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+def _fake_from_schema(schema: dict, root: dict, seed_text: str, key: str = ""):
+    """Builds a deterministic value that validates against a (pydantic) JSON schema."""
+    if "$ref" in schema:
+        ref = schema["$ref"].split("/")[-1]
+        definitions = root.get("$defs") or root.get("definitions") or {}
+        return _fake_from_schema(definitions.get(ref, {}), root, seed_text, key)
+    for combinator in ("allOf", "anyOf", "oneOf"):
+        if combinator in schema:
+            options = [s for s in schema[combinator] if s.get("type") != "null"] or schema[combinator]
+            return _fake_from_schema(options[0], root, seed_text, key)
+    if "enum" in schema:
+        return schema["enum"][_digest(seed_text + key)[0] % len(schema["enum"])]
+
+    schema_type = schema.get("type", "object" if "properties" in schema else "string")
+    if schema_type == "object":
+        return {
+            name: _fake_from_schema(prop, root, seed_text, name)
+            for name, prop in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        return [_fake_from_schema(schema.get("items", {}), root, seed_text, key)]
+    if schema_type == "boolean":
+        return bool(_digest(seed_text + key)[0] & 1)
+    if schema_type == "integer":
+        return _digest(seed_text + key)[0] % 10
+    if schema_type == "number":
+        return round(_digest(seed_text + key)[0] / 255, 3)
+    if schema_type == "null":
+        return None
+    words = WORD_RE.findall(seed_text)[:8]
+    return " ".join(words) or key
+
+def _last_user_message(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return content or ""
+    return ""
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+def _chat_result(body: dict) -> dict:
+    """Deterministic assistant message for a chat.completions request."""
+    messages = body.get("messages", [])
+    question = _last_user_message(messages)
+    seed_text = question or _prompt_text(messages)
+
+    # Structured output: tools / legacy functions / json_schema response_format
+    tools = body.get("tools") or []
+    functions = body.get("functions") or []
+    tool_choice = body.get("tool_choice")
+    if tools:
+        chosen = tools[0]["function"]
+        if isinstance(tool_choice, dict):
+            wanted = tool_choice.get("function", {}).get("name")
+            chosen = next((t["function"] for t in tools if t["function"]["name"] == wanted), chosen)
+        params = chosen.get("parameters", {})
+        arguments = json.dumps(_fake_from_schema(params, params, seed_text), ensure_ascii=False)
+        call = {"id": f"call_{_digest(seed_text).hex()[:24]}", "type": "function",
+                "function": {"name": chosen["name"], "arguments": arguments}}
+        return {"message": {"role": "assistant", "content": None, "tool_calls": [call]},
+                "finish_reason": "tool_calls", "text": arguments}
+    if functions:
+        chosen = functions[0]
+        params = chosen.get("parameters", {})
+        arguments = json.dumps(_fake_from_schema(params, params, seed_text), ensure_ascii=False)
+        return {"message": {"role": "assistant", "content": None,
+                            "function_call": {"name": chosen["name"], "arguments": arguments}},
+                "finish_reason": "function_call", "text": arguments}
+
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format.get("json_schema", {}).get("schema", {})
+        content = json.dumps(_fake_from_schema(schema, schema, seed_text), ensure_ascii=False)
+    elif response_format.get("type") == "json_object":
+        content = json.dumps({"answer": f"Stub answer: {question[:200]}"}, ensure_ascii=False)
+    else:
+        content = f"Stub answer: {question[:400]}" if question else "Stub answer."
+
+    max_tokens = body.get("max_tokens")
+    if max_tokens:
+        content = content[: max_tokens * 4]
+    return {"message": {"role": "assistant", "content": content}, "finish_reason": "stop", "text": content}
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict:
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+# --- ENDPOINTS ---
+@app.get("/v1/models")
+async def list_models():
+    created = 1700000000
+    names = ["gpt-3.5-turbo", "gpt-4", "text-embedding-ada-002", "whisper-1"]
+    return {"object": "list", "data": [{"id": n, "object": "model", "created": created, "owned_by": "stub"} for n in names]}
+
+@app.post("/v1/embeddings")
+async def create_embeddings(request: Request):
+    body = await request.json()
+    inputs = body.get("input", [])
+    # A single string or a single token list is one input
+    if isinstance(inputs, str) or (isinstance(inputs, list) and inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    error = await _simulate("embeddings")
+    if error:
+        return error
+
+    dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+    data = []
+    prompt_tokens = 0
+    for index, item in enumerate(inputs):
+        vector = embed_text(item, dimensions)
+        prompt_tokens += len(item) if isinstance(item, list) else _count_tokens(str(item))
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+        else:
+            embedding = vector
+        data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "text-embedding-ada-002"),
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+    }
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    body = await request.json()
+    result = _chat_result(body)
+    prompt_tokens = _count_tokens(_prompt_text(body.get("messages", [])))
+    completion_tokens = _count_tokens(result["text"])
+
+    error = await _simulate("chat.completions", completion_tokens)
+    if error:
+        return error
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-3.5-turbo")
+
+    if not body.get("stream"):
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "system_fingerprint": "fp_stub",
+            "choices": [{"index": 0, "message": result["message"], "logprobs": None,
+                         "finish_reason": result["finish_reason"]}],
+            "usage": _usage(prompt_tokens, completion_tokens),
+        }
+
+    def chunk(delta: dict, finish_reason=None, usage=None) -> str:
+        payload = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "system_fingerprint": "fp_stub",
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    async def event_stream():
+        message = result["message"]
+        yield chunk({"role": "assistant", "content": ""})
+        if message.get("tool_calls"):
+            calls = [dict(call, index=i) for i, call in enumerate(message["tool_calls"])]
+            yield chunk({"tool_calls": calls})
+        elif message.get("function_call"):
+            yield chunk({"function_call": message["function_call"]})
+        else:
+            for piece in re.findall(r"\S+\s*", message["content"]):
+                yield chunk({"content": piece})
+        include_usage = (body.get("stream_options") or {}).get("include_usage")
+        yield chunk({}, result["finish_reason"], _usage(prompt_tokens, completion_tokens) if include_usage else None)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/v1/audio/transcriptions")
+async def create_transcription(
+    file: UploadFile = File(...),
+    model: str = Form("whisper-1"),
+    response_format: str = Form("json"),
+):
+    content = await file.read()
+    error = await _simulate("audio.transcriptions")
+    if error:
+        return error
+
+    digest = hashlib.md5(content).hexdigest()[:12]
+    text = f"Stub transcription of {file.filename} ({len(content)} bytes, {digest})."
+    if response_format == "text":
+        return PlainTextResponse(text)
+    return {"text": text}
+
+# --- STUB CONTROL ---
+@app.get("/stub/config")
+async def get_stub_config():
+    return {"config": config, "profiles": PROFILES}
+
+@app.post("/stub/config")
+async def update_stub_config(payload: dict):
+    """Switch profile ({"profile": "flaky"}) and/or override single keys at runtime."""
+    global _rng
+    profile = payload.pop("profile", None)
+    if profile:
+        if profile not in PROFILES:
+            return _error(400, f"Unknown profile '{profile}'", "invalid_request_error")
+        config.update(PROFILES[profile])
+    for key, value in payload.items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    _rng = random.Random(config["seed"])
+    _recent_requests.clear()
+    return {"config": config}
+
+@app.get("/stub/stats")
+async def get_stub_stats():
+    return stats
+
+@app.post("/stub/reset")
+async def reset_stub_stats():
+    global _rng
+    stats.update({"requests": 0, "errors": 0, "rate_limited": 0, "by_endpoint": {}})
+    _rng = random.Random(config["seed"])
+    _recent_requests.clear()
+    return stats
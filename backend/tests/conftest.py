@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# Settings are read when app.core.config is imported: test values first
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("VECTOR_STORE_MODE", "embedded")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def chroma_dir(tmp_path):
+    """A fresh embedded Chroma store; chromadb's per-directory client cache is dropped afterwards."""
+    pytest.importorskip("chromadb")
+    from chromadb.api.client import SharedSystemClient
+
+    yield str(tmp_path / "chroma")
+    SharedSystemClient.clear_system_cache()
+
+@pytest.fixture
+def chroma_client(chroma_dir):
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.PersistentClient(path=chroma_dir, settings=Settings(anonymized_telemetry=False))
@@ -0,0 +1,58 @@
+import asyncio
+
+from app.core.database import Database
+
+def _run(coro):
+    return asyncio.run(coro)
+
+async def _rows(db: Database) -> list:
+    async with db.connection() as conn:
+        cursor = await conn.execute("SELECT value FROM items ORDER BY value")
+        return [value for (value,) in await cursor.fetchall()]
+
+def test_failed_op_rolls_back_its_own_writes_only(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / "nexus.db"), pool_size=1, write_batch_size=10)
+        await db.run_write(lambda conn: conn.execute("CREATE TABLE items (value INTEGER)"))
+
+        async def good(conn, value):
+            await conn.execute("INSERT INTO items VALUES (?)", (value,))
+
+        async def partial(conn):
+            # Delete then insert, failing in between (like replace_secure_messages)
+            await conn.execute("DELETE FROM items")
+            await conn.execute("INSERT INTO items VALUES (99)")
+            raise RuntimeError("boom")
+
+        await db.run_write(lambda conn: good(conn, 0))
+        # Queued together: one group commit
+        results = await asyncio.gather(
+            db.run_write(lambda conn: good(conn, 1)),
+            db.run_write(partial),
+            db.run_write(lambda conn: good(conn, 2)),
+            return_exceptions=True,
+        )
+        rows = await _rows(db)
+        await db.close()
+        return results, rows
+
+    results, rows = _run(scenario())
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], RuntimeError)
+    assert rows == [0, 1, 2]
+
+def test_op_result_is_returned_after_commit(tmp_path):
+    async def scenario():
+        db = Database(str(tmp_path / "nexus.db"), pool_size=1, write_batch_size=10)
+        await db.run_write(lambda conn: conn.execute("CREATE TABLE items (value INTEGER)"))
+
+        async def insert(conn):
+            cursor = await conn.execute("INSERT INTO items VALUES (7)")
+            return cursor.rowcount
+
+        count = await db.run_write(insert)
+        rows = await _rows(db)
+        await db.close()
+        return count, rows
+
+    assert _run(scenario()) == (1, [7])
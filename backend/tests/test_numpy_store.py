@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from app.services import numpy_store
+
+DIM = 12
+
+def _embeddings(n: int, seed: int):
+    rng = random.Random(seed)
+    return [[rng.uniform(-1, 1) for _ in range(DIM)] for _ in range(n)]
+
+@pytest.fixture
+def pair(chroma_client, tmp_path):
+    """A NumpyCollection and a cosine Chroma collection that receive the same writes."""
+    collection = numpy_store.NumpyCollection("slot", str(tmp_path / "numpy_store"))
+    reference = chroma_client.create_collection("slot", metadata={"hnsw:space": "cosine"})
+    return collection, reference
+
+def _both(pair, method: str, **kwargs):
+    for collection in pair:
+        getattr(collection, method)(**kwargs)
+
+def _query(collection, queries, **kwargs) -> dict:
+    return collection.query(query_embeddings=queries, n_results=5, include=["distances", "metadatas", "documents"], **kwargs)
+
+def _assert_same_results(pair, queries, **kwargs):
+    got, want = (_query(collection, queries, **kwargs) for collection in pair)
+    assert got["ids"] == want["ids"]
+    assert got["documents"] == want["documents"]
+    assert got["metadatas"] == want["metadatas"]
+    for got_distances, want_distances in zip(got["distances"], want["distances"]):
+        assert got_distances == pytest.approx(want_distances, abs=1e-4)
+
+def test_upsert_and_query_match_chroma(pair):
+    ids = [f"c{i}" for i in range(60)]
+    _both(pair, "upsert", ids=ids, embeddings=_embeddings(60, 0),
+          metadatas=[{"source": f"doc{i % 3}", "page": i} for i in range(60)], documents=[f"t{i}" for i in range(60)])
+    assert pair[0].count() == pair[1].count() == 60
+    _assert_same_results(pair, _embeddings(3, 1))
+    _assert_same_results(pair, _embeddings(3, 2), where={"source": "doc1"})
+
+def test_upsert_replaces_existing_records(pair):
+    ids = [f"c{i}" for i in range(20)]
+    _both(pair, "upsert", ids=ids, embeddings=_embeddings(20, 0), metadatas=[{"v": 0}] * 20, documents=["old"] * 20)
+    # Half new, half existing ids
+    ids = [f"c{i}" for i in range(10, 30)]
+    _both(pair, "upsert", ids=ids, embeddings=_embeddings(20, 3), metadatas=[{"v": 1}] * 20, documents=["new"] * 20)
+    assert pair[0].count() == pair[1].count() == 30
+    got, want = (c.get(ids=["c5", "c15", "c25"], include=["metadatas", "documents"]) for c in pair)
+    assert sorted(zip(got["ids"], got["documents"])) == sorted(zip(want["ids"], want["documents"]))
+    assert dict(zip(got["ids"], got["metadatas"]))["c15"] == {"v": 1}
+    _assert_same_results(pair, _embeddings(2, 4))
+
+def test_delete_by_ids_and_where_matches_chroma(pair):
+    ids = [f"c{i}" for i in range(40)]
+    _both(pair, "upsert", ids=ids, embeddings=_embeddings(40, 5),
+          metadatas=[{"source": f"doc{i % 4}"} for i in range(40)], documents=[f"t{i}" for i in range(40)])
+    _both(pair, "delete", ids=["c0", "c1", "c2"])
+    _both(pair, "delete", where={"source": "doc3"})
+    assert pair[0].count() == pair[1].count()
+    got, want = (sorted(c.get(include=[])["ids"]) for c in pair)
+    assert got == want
+    _assert_same_results(pair, _embeddings(3, 6))
+
+def test_get_where_with_operators_matches_chroma(pair):
+    ids = [f"c{i}" for i in range(30)]
+    _both(pair, "upsert", ids=ids, embeddings=_embeddings(30, 7),
+          metadatas=[{"source": f"doc{i % 3}", "page": i} for i in range(30)], documents=[f"t{i}" for i in range(30)])
+    for where in ({"page": {"$gte": 20}}, {"source": {"$ne": "doc0"}}, {"$and": [{"source": "doc1"}, {"page": {"$lt": 15}}]}):
+        got, want = (sorted(c.get(where=where, include=[])["ids"]) for c in pair)
+        assert got == want, where
+
+def test_compact_keeps_the_records(pair):
+    count = numpy_store.MIN_CAPACITY + 1
+    ids = [f"c{i}" for i in range(count)]
+    embeddings, metadatas = _embeddings(count, 8), [{"n": i} for i in range(count)]
+    # The second append doubles the capacity reserved in the vectors file
+    _both(pair, "upsert", ids=ids[:-1], embeddings=embeddings[:-1], metadatas=metadatas[:-1], documents=ids[:-1])
+    _both(pair, "upsert", ids=ids[-1:], embeddings=embeddings[-1:], metadatas=metadatas[-1:], documents=ids[-1:])
+    collection = pair[0]
+    assert collection.storage()["capacity"] == 2 * numpy_store.MIN_CAPACITY
+    # Exact search: identical before and after (HNSW may miss a neighbour at this size)
+    before = _query(collection, _embeddings(2, 9))
+    assert collection.compact() == (numpy_store.MIN_CAPACITY - 1) * DIM * 4
+    storage = collection.storage()
+    assert storage["records"] == storage["capacity"] == count and storage["consistent"]
+    assert _query(collection, _embeddings(2, 9)) == before
@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from app.services import sharding
+
+DIM = 8
+
+def _records(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    ids = [f"chunk-{i}" for i in range(n)]
+    embeddings = [[rng.uniform(-1, 1) for _ in range(DIM)] for _ in ids]
+    metadatas = [{"source": f"doc-{i % 5}.pdf", "page": i} for i in range(n)]
+    documents = [f"text {i}" for i in range(n)]
+    return ids, embeddings, metadatas, documents
+
+@pytest.fixture
+def collections(chroma_client):
+    """(single collection, ShardedCollection over 3 shards) holding the same records."""
+    metadata = {"hnsw:space": "cosine"}
+    single = chroma_client.create_collection("slot", metadata=metadata)
+    shards = [chroma_client.create_collection(name, metadata=metadata) for name in sharding.shard_names("sharded", 3)]
+    sharded = sharding.ShardedCollection("sharded", shards)
+    ids, embeddings, metadatas, documents = _records(90)
+    single.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+    sharded.upsert(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents)
+    return single, sharded
+
+def test_records_are_placed_by_stable_hash(collections):
+    _, sharded = collections
+    assert sharded.count() == 90
+    for index, shard in enumerate(sharded.collections):
+        assert all(sharding.shard_of(record_id, 3) == index for record_id in shard.get(include=[])["ids"])
+    # Every shard got some of the records
+    assert all(shard.count() for shard in sharded.collections)
+
+def test_get_by_ids_merges_shards(collections):
+    single, sharded = collections
+    ids = ["chunk-3", "chunk-40", "chunk-77", "missing"]
+    merged = sharded.get(ids=ids, include=["metadatas", "documents"])
+    expected = single.get(ids=ids, include=["metadatas", "documents"])
+    assert sorted(zip(merged["ids"], merged["documents"])) == sorted(zip(expected["ids"], expected["documents"]))
+    assert {m["page"] for m in merged["metadatas"]} == {3, 40, 77}
+
+def test_get_where_limit_and_offset_page_through_every_shard(collections):
+    _, sharded = collections
+    where = {"source": "doc-1.pdf"}
+    everything = sharded.get(where=where, include=["metadatas"])
+    assert len(everything["ids"]) == 18
+    pages = [sharded.get(where=where, limit=5, offset=offset, include=["metadatas"]) for offset in range(0, 18, 5)]
+    assert [len(page["ids"]) for page in pages] == [5, 5, 5, 3]
+    paged_ids = [record_id for page in pages for record_id in page["ids"]]
+    assert paged_ids == everything["ids"]
+    assert all(m["source"] == "doc-1.pdf" for page in pages for m in page["metadatas"])
+
+def test_query_returns_the_global_top_k(collections):
+    single, sharded = collections
+    _, queries, _, _ = _records(4, seed=1)
+    merged = sharded.query(query_embeddings=queries, n_results=7, include=["distances", "documents"])
+    expected = single.query(query_embeddings=queries, n_results=7, include=["distances", "documents"])
+    assert merged["ids"] == expected["ids"]
+    assert merged["documents"] == expected["documents"]
+    for got, want in zip(merged["distances"], expected["distances"]):
+        assert got == pytest.approx(want, abs=1e-5)
+        assert got == sorted(got)
+
+def test_delete_routes_to_shards(collections):
+    _, sharded = collections
+    sharded.delete(ids=["chunk-1", "chunk-2"])
+    sharded.delete(where={"source": "doc-4.pdf"})
+    assert sharded.count() == 90 - 2 - 18
+    assert sharded.get(ids=["chunk-1", "chunk-2", "chunk-4"])["ids"] == []
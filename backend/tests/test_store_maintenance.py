@@ -0,0 +1,91 @@
+import random
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+
+from app.services import store_maintenance
+
+DIM = 8
+
+def _client(chroma_dir: str):
+    return chromadb.PersistentClient(path=chroma_dir, settings=Settings(anonymized_telemetry=False))
+
+def _reopen(chroma_dir: str):
+    """A new process opening the store: replays the write log past what each segment persisted."""
+    SharedSystemClient.clear_system_cache()
+    return _client(chroma_dir)
+
+def _add(collection, prefix: str, n: int, rng: random.Random, batch: int = 500):
+    for start in range(0, n, batch):
+        ids = [f"{prefix}-{i}" for i in range(start, min(start + batch, n))]
+        collection.add(ids=ids, embeddings=[[rng.uniform(-1, 1) for _ in range(DIM)] for _ in ids],
+                       metadatas=[{"n": int(i.rsplit("-", 1)[1])} for i in ids])
+
+def _log(chroma_dir: str) -> dict:
+    with closing(sqlite3.connect(f"{chroma_dir}/{store_maintenance.SQLITE_FILE}")) as db:
+        rows = db.execute("SELECT topic, COUNT(*), MAX(seq_id) FROM embeddings_queue GROUP BY topic").fetchall()
+        newest = db.execute("SELECT MAX(seq_id) FROM embeddings_queue").fetchone()[0]
+    return {"topics": {topic: (count, top) for topic, count, top in rows}, "newest": newest}
+
+@pytest.fixture
+def store(chroma_dir):
+    rng = random.Random(0)
+    client = _client(chroma_dir)
+    # Persists its index every 1000 writes: the last 500 stay in the log only
+    synced = client.create_collection("synced", metadata={"hnsw:space": "cosine", "hnsw:sync_threshold": 1000})
+    _add(synced, "s", 2500, rng)
+    synced.delete(where={"n": {"$lt": 300}})
+    # Never persisted its index: nothing of it may be purged
+    pending = client.create_collection("pending", metadata={"hnsw:space": "cosine", "hnsw:batch_size": 5000,
+                                                            "hnsw:sync_threshold": 5000})
+    _add(pending, "p", 800, rng)
+    dropped = client.create_collection("dropped")
+    _add(dropped, "d", 600, rng)
+    client.delete_collection("dropped")
+    return chroma_dir
+
+def test_purge_keeps_every_write_a_segment_still_needs(store):
+    before = _log(store)
+    stats = store_maintenance.store_stats(store)
+    pending_index = store_maintenance.collection_stats(store, "pending")
+    assert stats["orphan_metadata_rows"] >= 600
+    assert 0 < stats["consumed_write_log_rows"] < stats["write_log_rows"]
+
+    purged = store_maintenance.purge(store)
+
+    after = _log(store)
+    assert purged["write_log_rows"] == stats["consumed_write_log_rows"]
+    assert purged["orphan_metadata_rows"] == stats["orphan_metadata_rows"]
+    # Chroma numbers the next write after the newest row: it always stays
+    assert after["newest"] == before["newest"]
+    # The collection whose index never persisted keeps its whole log
+    with closing(sqlite3.connect(f"{store}/{store_maintenance.SQLITE_FILE}")) as db:
+        topic = db.execute("SELECT topic FROM collections WHERE name = 'pending'").fetchone()[0]
+    assert after["topics"][topic][0] == before["topics"][topic][0] == pending_index["pending_writes"]
+    assert store_maintenance.store_stats(store)["orphan_metadata_rows"] == 0
+
+def test_store_reopens_consistent_after_purge_and_vacuum(store):
+    client = _client(store)
+    query = [[0.1] * DIM]
+    expected = {name: client.get_collection(name).query(query_embeddings=query, n_results=5)["ids"]
+                for name in ("synced", "pending")}
+    store_maintenance.purge(store)
+    store_maintenance.vacuum(store)
+
+    client = _reopen(store)
+    synced, pending = client.get_collection("synced"), client.get_collection("pending")
+    assert synced.count() == 2200 and pending.count() == 800
+    for name, collection in (("synced", synced), ("pending", pending)):
+        assert collection.query(query_embeddings=query, n_results=5)["ids"] == expected[name]
+
+    # New writes continue the log and survive another reopen
+    _add(synced, "after", 10, random.Random(1))
+    client = _reopen(store)
+    assert client.get_collection("synced").count() == 2210
+    stats = store_maintenance.collection_stats(store, "synced")
+    assert stats["consistent"] and stats["records"] == 2210
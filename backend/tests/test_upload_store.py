@@ -0,0 +1,86 @@
+import io
+import os
+import time
+
+from app.services import upload_store
+
+def _save(upload_dir: str, content: bytes, filename: str) -> dict:
+    return upload_store.save(io.BytesIO(content), filename, upload_dir)
+
+def _age(path: str, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_identical_content_is_stored_once(tmp_path):
+    upload_dir = str(tmp_path)
+    first = _save(upload_dir, b"same bytes", "CV.pdf")
+    second = _save(upload_dir, b"same bytes", "resume.PDF")
+    other = _save(upload_dir, b"other bytes", "CV.pdf")
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert first["blob"] == second["blob"] == f"{first['hash']}.pdf"
+    assert other["blob"] != first["blob"]
+    with open(first["path"], "rb") as f:
+        assert f.read() == b"same bytes"
+    # No temp files left behind
+    assert not [name for name in os.listdir(upload_dir) if name.startswith(upload_store.TEMP_PREFIX)]
+
+def test_references_per_slot_and_filename(tmp_path):
+    upload_dir = str(tmp_path)
+    upload = _save(upload_dir, b"report", "report.txt")
+    upload_store.add_reference("slot_a", "report.txt", upload, upload_dir)
+    upload_store.add_reference("slot_b", "copy.txt", upload, upload_dir)
+    newer = _save(upload_dir, b"report v2", "report.txt")
+    # Same filename in the same slot: the newer version replaces the reference
+    upload_store.add_reference("slot_a", "report.txt", newer, upload_dir)
+
+    assert upload_store.references("slot_a", upload_dir)["report.txt"]["hash"] == newer["hash"]
+    assert set(upload_store.references("slot_b", upload_dir)) == {"copy.txt"}
+    assert sorted(upload_store.referenced_paths(upload_dir)) == sorted([upload["path"], newer["path"]])
+
+    assert upload_store.remove_reference("slot_b", "copy.txt", upload_dir)
+    assert not upload_store.remove_reference("slot_b", "copy.txt", upload_dir)
+    assert upload_store.remove_references("slot_a", upload_dir) == 1
+    assert upload_store.referenced_paths(upload_dir) == []
+
+def test_gc_deletes_only_old_unreferenced_blobs(tmp_path):
+    upload_dir = str(tmp_path)
+    kept = _save(upload_dir, b"still referenced", "a.txt")
+    upload_store.add_reference("slot", "a.txt", kept, upload_dir)
+    orphan = _save(upload_dir, b"orphan", "b.txt")
+    # Saved by an ingestion still indexing: no reference yet, but recent
+    fresh = _save(upload_dir, b"being indexed", "c.txt")
+    stale_temp = os.path.join(upload_dir, f"{upload_store.TEMP_PREFIX}interrupted")
+    with open(stale_temp, "wb") as f:
+        f.write(b"partial")
+    for path in (kept["path"], orphan["path"], stale_temp):
+        _age(path, 3600)
+
+    result = upload_store.collect_garbage(upload_dir, max_age_seconds=600)
+
+    assert sorted(result["blobs"]) == sorted([orphan["blob"], os.path.basename(stale_temp)])
+    assert result["bytes"] == len(b"orphan") + len(b"partial")
+    assert os.path.exists(kept["path"]) and os.path.exists(fresh["path"])
+    assert not os.path.exists(orphan["path"]) and not os.path.exists(stale_temp)
+
+def test_gc_frees_a_blob_once_its_last_reference_goes(tmp_path):
+    upload_dir = str(tmp_path)
+    upload = _save(upload_dir, b"shared", "shared.txt")
+    upload_store.add_reference("slot_a", "shared.txt", upload, upload_dir)
+    upload_store.add_reference("slot_b", "shared.txt", upload, upload_dir)
+    _age(upload["path"], 3600)
+
+    upload_store.remove_reference("slot_a", "shared.txt", upload_dir)
+    assert upload_store.collect_garbage(upload_dir, 600)["blobs"] == []
+    upload_store.remove_reference("slot_b", "shared.txt", upload_dir)
+    assert upload_store.collect_garbage(upload_dir, 600)["blobs"] == [upload["blob"]]
+
+def test_save_file_reuses_a_stored_blob_and_rejects_foreign_names(tmp_path):
+    upload_dir = str(tmp_path / "uploads")
+    upload = _save(upload_dir, b"exported", "doc.md")
+    source = tmp_path / "doc.md"
+    source.write_bytes(b"exported")
+    assert upload_store.save_file(str(source), "doc.md", upload_dir, blob=upload["blob"])["deduplicated"]
+    # A manifest naming a path instead of a blob is ignored: the file is hashed and stored
+    stored = upload_store.save_file(str(source), "doc.md", upload_dir, blob="../../etc/passwd")
+    assert stored["blob"] == upload["blob"]
+    assert os.path.dirname(stored["path"]).startswith(os.path.join(upload_dir, upload_store.BLOBS_DIR))
@@ -0,0 +1,148 @@
+import random
+import threading
+
+import pytest
+
+pytest.importorskip("chromadb")
+from app.services import vector_store
+
+DIM = 8
+SLOT = "nexus_slot_test"
+
+def _vectors(n: int, rng: random.Random) -> list:
+    return [[rng.uniform(-1, 1) for _ in range(DIM)] for _ in range(n)]
+
+@pytest.fixture
+def slot(chroma_dir):
+    collection = vector_store.get_client(chroma_dir).create_collection(SLOT, metadata={"hnsw:space": "cosine"})
+    rng = random.Random(0)
+    ids = [f"chunk-{i}" for i in range(2000)]
+    collection.upsert(ids=ids, embeddings=_vectors(len(ids), rng), metadatas=[{"version": 0}] * len(ids), documents=ids)
+    return chroma_dir
+
+def _collection(chroma_dir: str):
+    return vector_store.get_client(chroma_dir).get_collection(SLOT)
+
+def test_rebuild_applies_new_parameters_and_keeps_records(slot):
+    rebuilt = vector_store.rebuild_collection(SLOT, {"hnsw:space": "cosine", "hnsw:M": 32}, slot)
+    collection = _collection(slot)
+    assert rebuilt == collection.count() == 2000
+    assert vector_store.index_params(collection) == {"hnsw:space": "cosine", "hnsw:M": 32}
+    names = [c.name for c in vector_store.get_client(slot).list_collections()]
+    assert names == [SLOT]
+
+def test_rebuild_under_concurrent_writes_loses_nothing(slot):
+    rng = random.Random(1)
+    stop = threading.Event()
+    written = {"new": [], "updates": 0}
+    errors = []
+
+    def writer():
+        # What ingestion/import/delete do: open the collection under the slot lock
+        try:
+            while not stop.is_set():
+                with vector_store.slot_write_lock(SLOT, slot):
+                    collection = _collection(slot)
+                    new_id = f"new-{len(written['new'])}"
+                    written["updates"] += 1
+                    collection.upsert(
+                        ids=[new_id, "chunk-0"], embeddings=_vectors(2, rng),
+                        metadatas=[{"version": written["updates"]}] * 2, documents=[new_id, "chunk-0"],
+                    )
+                    collection.delete(ids=[f"chunk-{written['updates']}"])
+                    written["new"].append(new_id)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for m in (24, 32, 48):
+            with vector_store.slot_write_lock(SLOT, slot):
+                vector_store.rebuild_collection(SLOT, {"hnsw:space": "cosine", "hnsw:M": m}, slot)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert not errors
+    collection = _collection(slot)
+    updates = written["updates"]
+    assert updates > 0
+    assert collection.count() == 2000 + len(written["new"]) - updates
+    assert collection.get(ids=["chunk-0"])["metadatas"] == [{"version": updates}]
+    assert len(collection.get(ids=written["new"])["ids"]) == len(written["new"])
+    assert collection.get(ids=[f"chunk-{i}" for i in range(1, updates + 1)])["ids"] == []
+    assert vector_store.index_params(collection)["hnsw:M"] == 48
+
+def test_rebuild_keeps_the_records_of_a_recreated_collection(slot, monkeypatch):
+    real_rename_in = vector_store._rename_in
+    recreated = []
+
+    def rename_in(client, collection, name):
+        if not recreated:
+            # A request opens (re-creates) the slot between moving the old index aside and the rename, and writes to it
+            recreated.append(name)
+            client.create_collection(name).upsert(ids=["late"], embeddings=_vectors(1, random.Random(2)), documents=["late"])
+        real_rename_in(client, collection, name)
+
+    monkeypatch.setattr(vector_store, "_rename_in", rename_in)
+    rebuilt = vector_store.rebuild_collection(SLOT, {"hnsw:space": "cosine", "hnsw:M": 32}, slot)
+    monkeypatch.undo()
+
+    collection = _collection(slot)
+    assert recreated
+    assert rebuilt == collection.count() == 2001
+    assert collection.get(ids=["late"])["documents"] == ["late"]
+    assert vector_store.index_params(collection)["hnsw:M"] == 32
+
+def _crash_after(slot, step: str):
+    """Leaves the store as a rebuild stopped after `step` would, with a search having re-created the slot."""
+    client = vector_store.get_client(slot)
+    source = client.get_collection(SLOT)
+    target = client.create_collection(f"{SLOT}{vector_store.REBUILD_SUFFIX}", metadata={"hnsw:M": 32})
+    vector_store._copy_records(source, target)
+    if step == "move_aside":
+        source.modify(name=f"{SLOT}{vector_store.OLD_SUFFIX}")
+    elif step == "drop_source":
+        # The swap of earlier releases dropped the source before renaming the copy
+        client.delete_collection(SLOT)
+    client.create_collection(SLOT)
+
+@pytest.mark.parametrize("step", ["move_aside", "drop_source"])
+def test_rebuild_recovers_the_records_of_an_interrupted_swap(slot, step):
+    _crash_after(slot, step)
+    assert vector_store.list_slots(slot) == [SLOT]
+
+    rebuilt = vector_store.rebuild_collection(SLOT, {"hnsw:space": "cosine", "hnsw:M": 48}, slot)
+    collection = _collection(slot)
+    assert rebuilt == collection.count() == 2000
+    assert vector_store.index_params(collection)["hnsw:M"] == 48
+    assert [c.name for c in vector_store.get_client(slot).list_collections()] == [SLOT]
+
+def test_rebuild_drops_the_copy_of_an_interrupted_copy(slot):
+    client = vector_store.get_client(slot)
+    client.create_collection(f"{SLOT}{vector_store.REBUILD_SUFFIX}").upsert(
+        ids=["chunk-0"], embeddings=_vectors(1, random.Random(3)), documents=["partial"],
+    )
+    rebuilt = vector_store.rebuild_collection(SLOT, {"hnsw:space": "cosine", "hnsw:M": 32}, slot)
+    assert rebuilt == 2000
+    assert _collection(slot).get(ids=["chunk-0"])["documents"] == ["chunk-0"]
+
+def test_slot_write_lock_serialises_threads(tmp_path):
+    order = []
+    entered = threading.Event()
+
+    def second():
+        entered.wait()
+        with vector_store.slot_write_lock(SLOT, str(tmp_path)):
+            order.append("second")
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    # Shards of a slot share its lock
+    with vector_store.slot_write_lock(f"{SLOT}__shard1", str(tmp_path)):
+        entered.set()
+        thread.join(timeout=0.2)
+        order.append("first")
+    thread.join()
+    assert order == ["first", "second"]
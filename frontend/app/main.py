@@ -3,6 +3,7 @@ import requests
 import time
 import base64
 import os
+import uuid
 from PIL import Image
 from fpdf import FPDF
 
@@ -455,6 +456,10 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
     st.session_state.messages.append({"role": "assistant", "content": "Welcome to Nexus. Secure connection established."})
 
+if "chat_session_id" not in st.session_state:
+    # The backend keeps the conversation (and its summary) under this id
+    st.session_state["chat_session_id"] = f"frontend-{uuid.uuid4()}"
+
 if "uploader_key" not in st.session_state:
     st.session_state["uploader_key"] = 0
 
@@ -824,20 +829,11 @@ else:
             
             with st.spinner("Analyzing..."):
                 try:
-                    # Construct History
-                    # We skip the first message if it's the welcome message or if structure is unexpected
-                    history = []
-                    for i in range(len(st.session_state.messages) - 1):
-                        msg = st.session_state.messages[i]
-                        next_msg = st.session_state.messages[i+1]
-                        
-                        if msg["role"] == "user" and next_msg["role"] == "assistant":
-                            history.append({"user": msg["content"], "assistant": next_msg["content"]})
-                    
+                    # History lives server-side (keyed by session_id): send only the new message
                     payload = {
                         "message": prompt, 
                         "collection_name": st.session_state["selected_slot"],
-                        "history": history
+                        "session_id": st.session_state["chat_session_id"]
                     }
                     response = requests.post(f"{BACKEND_URL}/api/v1/chat", json=payload, headers=API_HEADERS, timeout=30)
                     